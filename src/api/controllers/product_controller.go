@@ -1,7 +1,12 @@
 package controllers
 
 import (
+	"bufio"
+	"bytes"
 	"context"
+	"encoding/json"
+	"errors"
+	"io"
 	"log"
 	"net/http"
 	"time"
@@ -168,3 +173,123 @@ func GetAllProducts(c *fiber.Ctx) error {
 		Status: http.StatusOK, Message: "success", Data: &fiber.Map{"products": products},
 	})
 }
+
+// Upserts sent to MongoDB at once while a stream is ingested
+const ingestBatchSize = 1000
+
+// Per record errors returned in an ingest response, the rest are only counted
+const maxIngestErrors = 1000
+
+type ingestError struct {
+	Record int    `json:"record"`
+	Id     string `json:"id,omitempty"`
+	Error  string `json:"error"`
+}
+
+// IngestProducts upserts a stream of NDJSON products, one models.Product per line. Records are decoded and written in
+// unordered bulk batches while the body is still arriving, and a record that fails to decode, validate or write is
+// reported by its position in the stream without rejecting the others.
+func IngestProducts(c *fiber.Ctx) error {
+	ctx, cancel := context.WithTimeout(context.Background(), 30*time.Minute)
+	defer cancel()
+
+	var body io.Reader = c.Context().RequestBodyStream()
+	if body == nil {
+		body = bytes.NewReader(c.Body())
+	}
+	reader := bufio.NewReaderSize(body, 64*1024)
+
+	var bulkOps []mongo.WriteModel
+	var opRecords []int
+	var opIds []string
+	var recordErrors []ingestError
+	received, rejected := 0, 0
+	var upserted, modified, matched int64
+
+	reject := func(record int, id string, message string) {
+		rejected++
+		if len(recordErrors) < maxIngestErrors {
+			recordErrors = append(recordErrors, ingestError{Record: record, Id: id, Error: message})
+		}
+	}
+
+	flush := func() error {
+		if len(bulkOps) == 0 {
+			return nil
+		}
+
+		results, err := productCollection.BulkWrite(ctx, bulkOps, options.BulkWrite().SetOrdered(false))
+		if results != nil {
+			upserted += results.UpsertedCount
+			modified += results.ModifiedCount
+			matched += results.MatchedCount
+		}
+
+		var bulkErr mongo.BulkWriteException
+		if errors.As(err, &bulkErr) && len(bulkErr.WriteErrors) > 0 {
+			for _, writeErr := range bulkErr.WriteErrors {
+				reject(opRecords[writeErr.Index], opIds[writeErr.Index], writeErr.Message)
+			}
+			err = nil
+		}
+
+		bulkOps, opRecords, opIds = bulkOps[:0], opRecords[:0], opIds[:0]
+		return err
+	}
+
+	for {
+		line, readErr := reader.ReadBytes('\n')
+		line = bytes.TrimSpace(line)
+
+		if len(line) > 0 {
+			received++
+			var product models.Product
+
+			if err := json.Unmarshal(line, &product); err != nil {
+				reject(received, "", err.Error())
+			} else if validationErr := productValidate.Struct(&product); validationErr != nil {
+				reject(received, product.Id, validationErr.Error())
+			} else {
+				filter := bson.D{{Key: "_id", Value: product.Id}}
+				update := bson.D{{Key: "$set", Value: product}}
+				bulkOps = append(bulkOps, mongo.NewUpdateOneModel().SetFilter(filter).SetUpdate(update).SetUpsert(true))
+				opRecords = append(opRecords, received)
+				opIds = append(opIds, product.Id)
+			}
+
+			if len(bulkOps) >= ingestBatchSize {
+				if err := flush(); err != nil {
+					return c.Status(http.StatusInternalServerError).JSON(responses.ProductResponse{
+						Status: http.StatusInternalServerError, Message: "error", Data: &fiber.Map{"error_message": err.Error(), "received": received},
+					})
+				}
+			}
+		}
+
+		if readErr == io.EOF {
+			break
+		}
+		if readErr != nil {
+			return c.Status(http.StatusBadRequest).JSON(responses.ProductResponse{
+				Status: http.StatusBadRequest, Message: "error", Data: &fiber.Map{"error_message": readErr.Error(), "received": received},
+			})
+		}
+	}
+
+	if err := flush(); err != nil {
+		return c.Status(http.StatusInternalServerError).JSON(responses.ProductResponse{
+			Status: http.StatusInternalServerError, Message: "error", Data: &fiber.Map{"error_message": err.Error(), "received": received},
+		})
+	}
+
+	return c.Status(http.StatusOK).JSON(responses.ProductResponse{
+		Status: http.StatusOK, Message: "success", Data: &fiber.Map{
+			"received": received,
+			"rejected": rejected,
+			"upserted": upserted,
+			"modified": modified,
+			"matched":  matched,
+			"errors":   recordErrors,
+		},
+	})
+}
@@ -8,7 +8,8 @@ import (
 
 func main() {
 	app := fiber.New(fiber.Config{
-		Concurrency: 4096, // Maximum number of concurrent workers
+		Concurrency:       4096, // Maximum number of concurrent workers
+		StreamRequestBody: true, // Lets /products/ingest read NDJSON while it arrives
 	})
 
 	//run database
@@ -8,6 +8,7 @@ import (
 func ProductRoutes(app *fiber.App) {
 	app.Post("/product", controllers.CreateProduct)
 	app.Post("/products", controllers.CreateProducts)
+	app.Post("/products/ingest", controllers.IngestProducts)
 	app.Get("/product/:productId", controllers.GetAProduct)
 	app.Get("/products", controllers.GetAllProducts)
 }
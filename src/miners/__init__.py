@@ -0,0 +1,3 @@
+'''
+Paraguayan products miners, one module per store under miners/<store>/main.py
+'''
@@ -0,0 +1,195 @@
+import argparse
+
+from miners.config import API_URL, QUEUE_URL, SINK_URL, UPLOADERS, WORKERS
+from miners.stores import STORES
+
+def parse_stores(value: str) -> list[str]:
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m miners', description='Paraguayan products miners')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    crawl_options = argparse.ArgumentParser(add_help=False)
+    crawl_options.add_argument('--stores', type=parse_stores, default=None, help=f"Comma separated stores, any of: {', '.join(STORES)}")
+    crawl_options.add_argument('--workers', type=int, default=WORKERS, help='Global number of worker threads')
+    crawl_options.add_argument('--no-wait', action='store_true', help='Do not wait for the API before mining')
+    crawl_options.add_argument('--budget', type=int, default=None, help='Pages each store may request, picks the categories most likely to have changed')
+    crawl_options.add_argument('--no-history', action='store_true', help='Do not append the mined prices to the price history')
+    crawl_options.add_argument('--sitemaps', action='store_true', help='Only crawl categories whose pages changed in the store sitemap')
+    crawl_options.add_argument('--images', action='store_true', help='Cache product images and thumbnails locally')
+    crawl_options.add_argument('--details', action='store_true', help='Fetch and cache the detail pages of new and changed products')
+    crawl_options.add_argument('--search', action='store_true', help='Add the uploaded products to the local search index')
+    crawl_options.add_argument('--sink', default=SINK_URL, help='Where to write products, the API URL, ingest+ and the API URL, a mongodb:// URI, mongo for MONGO_URI, or ndjson[:dir] / parquet[:dir] files')
+    crawl_options.add_argument('--uploaders', type=int, default=UPLOADERS, help='Upload batches in flight at once')
+    crawl_options.add_argument('--no-spool', action='store_true', help='Drop failed upload batches instead of spooling them for retry')
+    crawl_options.add_argument('--probe', action='store_true', help='Mine the first page of every category and the rest only where it changed or the last full crawl is a day old')
+    crawl_options.add_argument('--deadline', default=None, help='Time a run may take, like 900s or 15m, the most valuable categories are mined first and coverage is reported')
+
+    commands.add_parser('run', parents=[crawl_options], help='Mine stores in a single process')
+
+    daemon_parser = commands.add_parser('daemon', parents=[crawl_options], help='Stay resident and mine stores on a schedule')
+    schedule = daemon_parser.add_mutually_exclusive_group(required=True)
+    schedule.add_argument('--every', help='Interval between run starts, like 90s, 30m, 6h or 1d')
+    schedule.add_argument('--cron', help="Five field cron expression in local time, like '0 */6 * * *'")
+    daemon_parser.add_argument('--wait-first', action='store_true', help='Wait for the schedule before the first run instead of starting right away')
+
+    publish_parser = commands.add_parser('publish', help='Publish store tasks to the shared queue of a distributed crawl')
+    publish_parser.add_argument('--stores', type=parse_stores, default=None, help='Comma separated stores, all if omitted')
+    publish_parser.add_argument('--queue', default=QUEUE_URL, help='Queue location, a SQLite path or sqlite:/// URL')
+
+    worker_parser = commands.add_parser('worker', help='Mine tasks from the shared queue of a distributed crawl')
+    worker_parser.add_argument('--queue', default=QUEUE_URL, help='Queue location, a SQLite path or sqlite:/// URL')
+    worker_parser.add_argument('--workers', type=int, default=4, help='Number of worker threads in this process')
+    worker_parser.add_argument('--follow', action='store_true', help='Keep waiting for new tasks once the queue is drained')
+    worker_parser.add_argument('--no-history', action='store_true', help='Do not append the mined prices to the price history')
+    worker_parser.add_argument('--images', action='store_true', help='Cache product images and thumbnails locally')
+    worker_parser.add_argument('--details', action='store_true', help='Fetch and cache the detail pages of new and changed products')
+    worker_parser.add_argument('--sink', default=SINK_URL, help='Where to write products, the API URL, ingest+ and the API URL, a mongodb:// URI, mongo for MONGO_URI, or ndjson[:dir] / parquet[:dir] files')
+    worker_parser.add_argument('--uploaders', type=int, default=UPLOADERS, help='Upload batches in flight at once')
+    worker_parser.add_argument('--no-spool', action='store_true', help='Drop failed upload batches instead of spooling them for retry')
+
+    compact_parser = commands.add_parser('compact', help='Merge the price history segments of past days')
+    compact_parser.add_argument('--stores', type=parse_stores, default=None, help='Comma separated stores, all if omitted')
+
+    analyze_parser = commands.add_parser('analyze', help='Per category price changes between the last two runs')
+    analyze_parser.add_argument('--stores', type=parse_stores, default=None, help='Comma separated stores, all if omitted')
+
+    replay_parser = commands.add_parser('replay', help='Send the upload batches left in the spool')
+    replay_parser.add_argument('--sink', default=SINK_URL, help='Where to write products, see run --sink')
+
+    load_parser = commands.add_parser('load', help='Stream exported NDJSON files to the API ingest endpoint')
+    load_parser.add_argument('paths', nargs='+', help='.ndjson.gz files written by the ndjson sink, or directories of them')
+    load_parser.add_argument('--api', default=API_URL, help='Base URL of the API')
+
+    index_parser = commands.add_parser('index', help='Add exported NDJSON files to the local search index')
+    index_parser.add_argument('paths', nargs='+', help='.ndjson.gz files written by the ndjson sink, or directories of them')
+
+    search_parser = commands.add_parser('search', help='Search the local index of uploaded products by name')
+    search_parser.add_argument('query', help='Words the product names must contain')
+    search_parser.add_argument('--fuzzy', action='store_true', help='Rank names by trigram similarity, tolerating typos')
+    search_parser.add_argument('--origin', default=None, help='Only products of this origin')
+    search_parser.add_argument('--category', default=None, help='Only products of this category')
+    search_parser.add_argument('--min-price', type=int, default=None, help='Only products at this price or above')
+    search_parser.add_argument('--max-price', type=int, default=None, help='Only products at this price or below')
+    search_parser.add_argument('--limit', type=int, default=20, help='Number of products shown')
+
+    bench_parser = commands.add_parser('bench', help='Benchmark parts of the miners')
+    bench_parser.add_argument('suite', choices=['sinks', 'parsers', 'json', 'record'], help='sinks: write the same synthetic products to each sink, parsers: mine recorded store pages offline, json: decode the recorded API responses, record: record store pages for parsers and json')
+    bench_parser.add_argument('--sinks', type=parse_stores, default=[API_URL, 'mongo'], help='Comma separated sink URLs')
+    bench_parser.add_argument('--count', type=int, default=20_000, help='Number of synthetic products')
+    bench_parser.add_argument('--batch-size', type=int, default=1000, help='Products per write')
+    bench_parser.add_argument('--stores', type=parse_stores, default=None, help='Comma separated stores for parsers and record, all if omitted')
+    bench_parser.add_argument('--fixtures', default=None, help='Directory of the recorded pages, the fixtures directory of the package by default')
+    bench_parser.add_argument('--categories', type=int, default=2, help='Categories recorded per store')
+    bench_parser.add_argument('--pages', type=int, default=2, help='Pages recorded per category')
+    bench_parser.add_argument('--repeat', type=int, default=5, help='Timed passes over the recorded pages')
+    bench_parser.add_argument('--save', default=None, help='Write the parser results to this JSON file')
+    bench_parser.add_argument('--baseline', default=None, help='Compare the parser results with this JSON file and fail on regressions')
+    bench_parser.add_argument('--threshold', type=float, default=None, help='Allowed slowdown over the baseline, 0.1 is 10%%')
+
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        from miners.daemon import parse_interval
+        from miners.orchestrator import run
+        run(args.stores, workers=args.workers, wait=not args.no_wait, budget=args.budget, history=not args.no_history, sitemaps=args.sitemaps, images=args.images, sink=args.sink, spool=not args.no_spool, uploaders=args.uploaders, deadline=parse_interval(args.deadline) if args.deadline else None, probe=args.probe, details=args.details, search=args.search)
+
+    elif args.command == 'daemon':
+        from miners.daemon import Cron, Interval, parse_interval, serve
+        schedule = Interval(parse_interval(args.every)) if args.every else Cron(args.cron)
+        serve(args.stores, schedule, immediately=not args.wait_first, workers=args.workers, wait=not args.no_wait, budget=args.budget, history=not args.no_history, sitemaps=args.sitemaps, images=args.images, sink=args.sink, spool=not args.no_spool, uploaders=args.uploaders, deadline=parse_interval(args.deadline) if args.deadline else None, probe=args.probe, details=args.details, search=args.search)
+
+    elif args.command == 'publish':
+        from miners.distributed import open_broker, publish
+        print(f'[DEBUG] Published {publish(open_broker(args.queue), args.stores)} tasks...')
+
+    elif args.command == 'worker':
+        from miners.distributed import open_broker, work
+        work(open_broker(args.queue), workers=args.workers, follow=args.follow, history=not args.no_history, images=args.images, sink=args.sink, spool=not args.no_spool, uploaders=args.uploaders, details=args.details)
+
+    elif args.command == 'compact':
+        from miners.history import PriceHistory
+        from miners.stores import get_stores
+        history = PriceHistory()
+        for store in get_stores(args.stores):
+            print(f'[DEBUG] Compacted {history.compact(store.name)} partitions from {store.label}...')
+
+    elif args.command == 'analyze':
+        import json
+        from miners.analytics import summary
+        from miners.history import PriceHistory
+        from miners.stores import get_stores
+        history = PriceHistory()
+        print(json.dumps({store.name: summary(history, store.name) for store in get_stores(args.stores)}, indent=2))
+
+    elif args.command == 'replay':
+        from miners.sinks import open_sink
+        from miners.spool import Spool
+        sink = open_sink(args.sink)
+        sink.wait()
+        sent, left = Spool().replay(sink)
+        sink.close()
+        print(f'[DEBUG] Replayed {sent} batches, {left} still spooled...')
+
+    elif args.command == 'load':
+        import json
+        from miners.sinks import ingest, read_exports
+        summary = ingest(args.api, read_exports(args.paths))
+        print(json.dumps({key: value for key, value in summary.items() if key != 'errors'}, indent=2))
+        for error in summary.get('errors', [])[:10]:
+            print(f"[ERROR] Record {error.get('record')} {error.get('id', '')}: {error.get('error')}")
+
+    elif args.command == 'index':
+        from itertools import islice
+        from miners.search import SearchIndex
+        from miners.sinks import read_exports
+        index = SearchIndex()
+        rows = read_exports(args.paths)
+        while batch := list(islice(rows, 10_000)):
+            index.add(batch)
+        index.save()
+        print(f'[DEBUG] Search index holds {len(index)} products...')
+
+    elif args.command == 'search':
+        import json
+        from dataclasses import asdict
+        from miners.search import SearchIndex
+        result = SearchIndex().search(args.query, fuzzy=args.fuzzy, origin=args.origin, category=args.category, min_price=args.min_price, max_price=args.max_price, limit=args.limit)
+        print(json.dumps(asdict(result), indent=2, ensure_ascii=False))
+
+    elif args.command == 'bench' and args.suite == 'sinks':
+        import json
+        from miners.bench import bench_sinks
+        print(json.dumps(bench_sinks(args.sinks, args.count, args.batch_size), indent=2))
+
+    elif args.command == 'bench' and args.suite == 'record':
+        from miners.bench import FIXTURES_DIR, record_fixtures
+        record_fixtures(args.stores, args.categories, args.pages, args.fixtures or FIXTURES_DIR)
+
+    elif args.command == 'bench' and args.suite == 'json':
+        import json
+        from miners.bench import FIXTURES_DIR, bench_json
+        print(json.dumps(bench_json(args.stores, args.repeat, args.fixtures or FIXTURES_DIR), indent=2))
+
+    elif args.command == 'bench':
+        import json
+        import sys
+        from miners.bench import FIXTURES_DIR, REGRESSION_THRESHOLD, bench_parsers, compare
+        results = bench_parsers(args.stores, args.repeat, args.fixtures or FIXTURES_DIR)
+        print(json.dumps(results, indent=2))
+
+        if args.save:
+            with open(args.save, 'w') as file:
+                json.dump(results, file, indent=2)
+
+        if args.baseline:
+            with open(args.baseline) as file:
+                regressions = compare(results, json.load(file), REGRESSION_THRESHOLD if args.threshold is None else args.threshold)
+            for regression in regressions:
+                print(f'[ERROR] Parser regression {regression}...')
+            if regressions:
+                sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import numpy as np
+
+from miners.history import PriceHistory
+
+@dataclass
+class Snapshot:
+    '''
+    Products of one store in one run, as column arrays sorted by key. Ids are sha256 digests, so their first 8 bytes as
+    a big-endian integer are a uniformly distributed join key that sorts far faster than 32-byte strings, full ids
+    are still compared on every match.
+    '''
+    timestamp: int
+    key: np.ndarray
+    id: np.ndarray
+    price: np.ndarray
+    mayorista_price: np.ndarray
+    is_discounted: np.ndarray
+    category: np.ndarray
+
+    @classmethod
+    def from_rows(cls, timestamp: int, rows: np.ndarray) -> 'Snapshot':
+        ids = np.ascontiguousarray(rows['id'])
+        keys = np.frombuffer(ids.tobytes(), dtype='>u8').reshape(-1, 4)[:, 0].astype(np.uint64) if len(ids) else np.empty(0, dtype=np.uint64)
+
+        order = np.argsort(keys)
+        keys = keys[order]
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = keys[1:] != keys[:-1]
+        order = order[keep]
+
+        return cls(timestamp, keys[keep], ids[order], rows['price'][order], rows['mayorista_price'][order], rows['is_discounted'][order], rows['category'][order])
+
+    def __len__(self) -> int:
+        return len(self.id)
+
+@dataclass
+class RunDiff:
+    '''
+    Changes between two snapshots of a store. Index arrays point into before (removed) or after (everything else).
+    '''
+    before: Snapshot
+    after: Snapshot
+    new: np.ndarray
+    removed: np.ndarray
+    common_before: np.ndarray
+    common_after: np.ndarray
+    price_drops: np.ndarray
+    price_rises: np.ndarray
+    discount_starts: np.ndarray
+    discount_ends: np.ndarray
+
+    def category_counts(self, categories: int) -> dict[str, np.ndarray]:
+        '''
+        Count every kind of change per category code
+
+        Args:
+            categories: Size of the store's category dictionary
+
+        Returns:
+            dict[str, np.ndarray]: Counts indexed by category code
+        '''
+        return {
+            'new': np.bincount(self.after.category[self.new], minlength=categories),
+            'removed': np.bincount(self.before.category[self.removed], minlength=categories),
+            'price_drops': np.bincount(self.after.category[self.price_drops], minlength=categories),
+            'price_rises': np.bincount(self.after.category[self.price_rises], minlength=categories),
+            'discount_starts': np.bincount(self.after.category[self.discount_starts], minlength=categories),
+            'discount_ends': np.bincount(self.after.category[self.discount_ends], minlength=categories),
+        }
+
+    def price_index(self, categories: int) -> np.ndarray:
+        '''
+        Jevons price index per category, the geometric mean of the price ratios of products present in both runs.
+        Categories without matched products get NaN.
+
+        Args:
+            categories: Size of the store's category dictionary
+
+        Returns:
+            np.ndarray: Index per category code, 1.0 means no change
+        '''
+        before = self.before.price[self.common_before].astype(np.float64)
+        after = self.after.price[self.common_after].astype(np.float64)
+        valid = (before > 0) & (after > 0)
+
+        codes = self.after.category[self.common_after][valid]
+        log_ratio = np.log(after[valid] / before[valid])
+
+        totals = np.bincount(codes, weights=log_ratio, minlength=categories)
+        counts = np.bincount(codes, minlength=categories)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.exp(totals / counts)
+
+def runs(history: PriceHistory, store: str, start: float | None = None, end: float | None = None) -> np.ndarray:
+    '''
+    Timestamps of the runs recorded for a store, in order
+    '''
+    return np.unique(history.scan(store, start, end)['timestamp'])
+
+def load_run(history: PriceHistory, store: str, timestamp: int) -> Snapshot:
+    return Snapshot.from_rows(int(timestamp), history.scan(store, timestamp, timestamp + 1))
+
+def load_window(history: PriceHistory, store: str, start: float | None = None, end: float | None = None) -> list[Snapshot]:
+    '''
+    Load every run of a store in [start, end) with a single scan
+
+    Returns:
+        list[Snapshot]: One snapshot per run, oldest first
+    '''
+    rows = history.scan(store, start, end)
+    rows = rows[np.argsort(rows['timestamp'], kind='stable')]
+    timestamps, bounds = np.unique(rows['timestamp'], return_index=True)
+    bounds = np.append(bounds, len(rows))
+
+    return [Snapshot.from_rows(int(timestamp), rows[bounds[i]:bounds[i + 1]]) for i, timestamp in enumerate(timestamps)]
+
+def diff(before: Snapshot, after: Snapshot, compared: np.ndarray | None = None) -> RunDiff:
+    '''
+    Compare two snapshots of a store in vectorized passes over their sorted key arrays
+
+    Args:
+        before: Older snapshot
+        after: Newer snapshot
+        compared: Whether each category code was crawled whole by both runs, new and removed products are only counted
+            in those categories. Every category if None.
+
+    Returns:
+        RunDiff: Index arrays of every change
+    '''
+    positions = np.searchsorted(before.key, after.key)
+    positions_clipped = np.minimum(positions, max(len(before) - 1, 0))
+    matched = (positions < len(before)) & (before.key[positions_clipped] == after.key) if len(before) else np.zeros(len(after), dtype=bool)
+    matched[matched] = before.id[positions[matched]] == after.id[matched]
+
+    common_after = np.flatnonzero(matched)
+    common_before = positions[matched]
+
+    present = np.zeros(len(before), dtype=bool)
+    present[common_before] = True
+
+    price_before = before.price[common_before]
+    price_after = after.price[common_after]
+    discount_before = before.is_discounted[common_before]
+    discount_after = after.is_discounted[common_after]
+
+    new = np.flatnonzero(~matched)
+    removed = np.flatnonzero(~present)
+
+    if compared is not None:
+        new = new[compared[after.category[new]]]
+        removed = removed[compared[before.category[removed]]]
+
+    return RunDiff(
+        before=before,
+        after=after,
+        new=new,
+        removed=removed,
+        common_before=common_before,
+        common_after=common_after,
+        price_drops=common_after[price_after < price_before],
+        price_rises=common_after[price_after > price_before],
+        discount_starts=common_after[(discount_before == 0) & (discount_after == 1)],
+        discount_ends=common_after[(discount_before == 1) & (discount_after == 0)],
+    )
+
+def chained_index(snapshots: list[Snapshot], categories: int) -> np.ndarray:
+    '''
+    Chain the per category Jevons index across consecutive runs of a window
+
+    Args:
+        snapshots: Snapshots oldest first, see load_window
+        categories: Size of the store's category dictionary
+
+    Returns:
+        np.ndarray: (runs, categories) index relative to the first run, NaN carries the previous value forward
+    '''
+    series = np.ones((len(snapshots), categories))
+
+    for i in range(1, len(snapshots)):
+        step = diff(snapshots[i - 1], snapshots[i]).price_index(categories)
+        series[i] = series[i - 1] * np.where(np.isnan(step), 1.0, step)
+
+    return series
+
+def compared_categories(history: PriceHistory, store: str, before: int, after: int) -> (np.ndarray | None):
+    '''
+    Mask of the category codes both runs crawled whole, see diff
+
+    Returns:
+        np.ndarray: Bool per category code
+        None: If neither run recorded its categories, both crawled everything
+    '''
+    crawled = [history.crawled(store, timestamp) for timestamp in (before, after)]
+    crawled = [names for names in crawled if names is not None]
+
+    if not crawled:
+        return None
+
+    both = set.intersection(*crawled)
+    return np.array([name in both for name in history.categories(store)], dtype=bool)
+
+def summary(history: PriceHistory, store: str) -> (dict | None):
+    '''
+    Per category changes between the last two runs of a store, new and removed products only in the categories both
+    runs crawled whole
+
+    Returns:
+        dict: Category name to counts and price index
+        None: If the store has fewer than two runs
+    '''
+    partitions = history.partitions(store)[-2:]
+
+    if not partitions:
+        return None
+
+    start = datetime.strptime(os.path.basename(partitions[0]), '%Y-%m-%d').replace(tzinfo=timezone.utc).timestamp()
+    timestamps = runs(history, store, start)
+
+    if len(timestamps) < 2:
+        return None
+
+    compared = compared_categories(history, store, timestamps[-2], timestamps[-1])
+    changes = diff(load_run(history, store, timestamps[-2]), load_run(history, store, timestamps[-1]), compared)
+    names = history.categories(store)
+    counts = changes.category_counts(len(names))
+    index = changes.price_index(len(names))
+
+    return {
+        name: {**{kind: int(values[code]) for kind, values in counts.items()}, 'price_index': None if np.isnan(index[code]) else float(index[code])}
+        for code, name in enumerate(names)
+        if any(values[code] for values in counts.values()) or not np.isnan(index[code])
+    }
@@ -0,0 +1,414 @@
+import gzip
+import itertools
+import json
+import os
+import statistics
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass
+from hashlib import sha256
+from time import perf_counter
+from urllib.parse import urlsplit
+
+import requests
+
+from miners import fetch, stores
+from miners.mining import MiningError
+from miners.platforms import Platform
+from miners.sinks import BatchRejected, open_sink
+from miners.taskqueue import decode_item, encode_item
+
+# Recorded store pages replayed by the parser benchmarks, one directory per store
+FIXTURES_DIR: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Slowdown over the baseline, in microseconds per product, reported as a regression
+REGRESSION_THRESHOLD: float = 0.10
+
+@dataclass
+class BenchProduct:
+    id: str
+    origin: str
+    name: str
+    price: int
+    is_discounted: bool
+    image_url: str
+    product_url: str
+    category_name: str
+
+def synthetic_products(count: int) -> list[BenchProduct]:
+    '''
+    Products shaped like the ones the stores mine, ids are stable so a second pass updates instead of inserting
+    '''
+    products = []
+
+    for i in range(count):
+        url = f'https://bench.invalid/product/{i}'
+        products.append(BenchProduct(
+            id=sha256(url.encode()).hexdigest(),
+            origin='bench',
+            name=f'Bench product {i}',
+            price=1000 + i % 500_000,
+            is_discounted=i % 7 == 0,
+            image_url=f'https://bench.invalid/image/{i % 100}.png',
+            product_url=url,
+            category_name=f'Category {i % 40}',
+        ))
+
+    return products
+
+def written(sink, batch: list) -> bool:
+    try:
+        return sink.write('bench', batch)
+    except BatchRejected:
+        return False
+
+def bench_sinks(urls: list[str], count: int = 20_000, batch_size: int = 1000) -> list[dict]:
+    '''
+    Time writing the same products to each sink, once to insert them and once more to update them, the way re-runs
+    write mostly known products
+
+    Args:
+        urls: Sink URLs, see sinks.open_sink
+        count: Number of synthetic products
+        batch_size: Products per write, the upload pipeline batch size
+
+    Returns:
+        list[dict]: One result per sink and pass
+    '''
+    products = synthetic_products(count)
+    batches = [products[i:i + batch_size] for i in range(0, count, batch_size)]
+    results = []
+
+    for url in urls:
+        sink = open_sink(url)
+        sink.wait()
+
+        try:
+            for phase in ('insert', 'update'):
+                started = perf_counter()
+                failed = sum(not written(sink, batch) for batch in batches)
+                seconds = perf_counter() - started
+
+                results.append({
+                    'sink': sink.name,
+                    'url': url,
+                    'phase': phase,
+                    'products': count,
+                    'failed_batches': failed,
+                    'seconds': round(seconds, 3),
+                    'products_per_second': round(count / seconds) if seconds else None,
+                })
+        finally:
+            sink.close()
+
+    return results
+
+def response(url: str, status: int, content_type: str, body: bytes) -> requests.Response:
+    '''
+    Build a complete response from recorded parts, usable both as a fetch.get and as a fetch.stream response
+    '''
+    replayed = requests.Response()
+    replayed.url = url
+    replayed.status_code = status
+    replayed.headers['Content-Type'] = content_type
+    replayed.encoding = requests.utils.get_encoding_from_headers(replayed.headers)
+    replayed._content = body
+    replayed._content_consumed = True
+    return replayed
+
+@contextmanager
+def patched(module, get, stream):
+    '''
+    Swap the fetch functions the stores call, and the random politeness sleeps of the store module or its platform
+    engine, for the duration of a benchmark or a recording
+    '''
+    originals = fetch.get, fetch.stream, getattr(module, 'sleep', None)
+    engine = getattr(module, 'store', None)
+    delay = engine.delay if isinstance(engine, Platform) else None
+
+    fetch.get, fetch.stream = get, stream
+    if originals[2] is not None:
+        module.sleep = lambda seconds: None
+    if delay is not None:
+        engine.delay = 0
+
+    try:
+        yield
+    finally:
+        fetch.get, fetch.stream = originals[:2]
+        if originals[2] is not None:
+            module.sleep = originals[2]
+        if delay is not None:
+            engine.delay = delay
+
+def record_fixtures(names: list[str] | None = None, categories: int = 2, pages: int = 2, root: str = FIXTURES_DIR) -> dict[str, int]:
+    '''
+    Record the pages the parser benchmarks replay: the first pages of the first categories of each store, fetched
+    live through the store's own iter_products so every request it makes is captured
+
+        <root>/<store>/index.json       tasks, pages mined per task and the recorded responses of each
+        <root>/<store>/<hash>.gz        gzipped body of one response
+
+    Args:
+        names: Store names, all stores if None
+        categories: Tasks recorded per store
+        pages: Pages mined per task
+        root: Fixtures directory
+
+    Returns:
+        dict[str, int]: Responses recorded per store
+    '''
+    recorded = {}
+
+    for store in stores.get_stores(names):
+        module = stores.load(store)
+        directory = os.path.join(root, store.name)
+        tasks = (module.get_tasks() or [])[:categories]
+
+        if not tasks:
+            print(f'[ERROR] No tasks to record from {store.label}...')
+            continue
+
+        os.makedirs(directory, exist_ok=True)
+        index = {'store': store.name, 'source': 'live', 'pages': pages, 'tasks': []}
+        get, stream = fetch.get, fetch.stream
+
+        for task in tasks:
+            responses = []
+
+            def save(url: str, page: requests.Response) -> requests.Response:
+                url = fetch.canonicalize(url)
+                body = page.content if page.status_code == 200 else b''
+                name = f'{sha256(url.encode()).hexdigest()[:16]}.gz'
+
+                with gzip.open(os.path.join(directory, name), 'wb') as file:
+                    file.write(body)
+
+                responses.append({'url': url, 'status': page.status_code, 'content_type': page.headers.get('Content-Type', ''), 'file': name})
+                return response(url, page.status_code, page.headers.get('Content-Type', ''), body)
+
+            with patched(module, lambda url, timeout=120: save(url, get(url, timeout)), lambda url, timeout=120: save(url, stream(url, timeout))):
+                mined = module.iter_products(task)
+                try:
+                    for _ in itertools.islice(mined, pages):
+                        pass
+                except MiningError:
+                    print(f'[ERROR] Failed to record {store.label} task {encode_item(task)}...')
+                    continue
+                finally:
+                    mined.close()
+
+            index['tasks'].append({'payload': encode_item(task), 'responses': responses})
+
+        with open(os.path.join(directory, 'index.json'), 'w') as file:
+            json.dump(index, file, indent=2)
+
+        recorded[store.name] = sum(len(task['responses']) for task in index['tasks'])
+        print(f'[DEBUG] Recorded {recorded[store.name]} responses from {store.label}...')
+
+    return recorded
+
+def load_fixtures(store: str, root: str = FIXTURES_DIR) -> (dict | None):
+    '''
+    Read the recorded pages of a store into memory, so replaying them costs no disk reads
+
+    Returns:
+        dict: The fixture index, with the recorded bodies by URL under responses
+        None: If the store has no fixtures
+    '''
+    path = os.path.join(root, store, 'index.json')
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as file:
+        index = json.load(file)
+
+    index['responses'] = {}
+    for task in index['tasks']:
+        for entry in task['responses']:
+            with gzip.open(os.path.join(root, store, entry['file']), 'rb') as file:
+                index['responses'][entry['url']] = (entry['status'], entry['content_type'], file.read())
+
+    return index
+
+def replay(module, index: dict, mined: list | None = None) -> (tuple[int, int]):
+    '''
+    Mine every recorded task of a store from memory, requests without a recording fail the task
+
+    Args:
+        module: Store module
+        index: Fixtures of the store, see load_fixtures
+        mined: List to keep the mined pages in, they are dropped as they are counted if None
+
+    Returns:
+        tuple: Pages and products mined
+    '''
+    def get(url: str, timeout: int = 120) -> requests.Response:
+        url = fetch.canonicalize(url)
+        if url not in index['responses']:
+            raise KeyError(f'No recorded response for {url}')
+        return response(url, *index['responses'][url])
+
+    pages = 0
+    products = 0
+
+    with patched(module, get, get):
+        for task in index['tasks']:
+            crawl = module.iter_products(decode_item(module, task['payload']))
+            try:
+                for page in itertools.islice(crawl, index['pages']):
+                    pages += 1
+                    products += len(page)
+                    if mined is not None:
+                        mined.append(page)
+            except MiningError:
+                pass
+            finally:
+                crawl.close()
+
+    return pages, products
+
+def bench_parsers(names: list[str] | None = None, repeat: int = 5, root: str = FIXTURES_DIR) -> dict[str, dict]:
+    '''
+    Time each store's page parsing and product mapping on its recorded pages, without any network. Timings are the
+    median of the repeats, memory is measured in a separate traced pass so tracing does not skew them.
+
+    Args:
+        names: Store names, all stores if None, stores without fixtures are skipped
+        repeat: Timed passes over the fixtures of each store
+        root: Fixtures directory
+
+    Returns:
+        dict[str, dict]: Results per store, source of the fixtures (live or synthetic), pages, products,
+        pages_per_second, us_per_product, peak_kib, the most memory allocated at once while replaying, and
+        allocated_blocks, the memory blocks held by the mined products, in total and per product
+    '''
+    results = {}
+
+    for store in stores.get_stores(names):
+        index = load_fixtures(store.name, root)
+
+        if index is None:
+            print(f'[DEBUG] No fixtures for {store.label}, record them with bench record...')
+            continue
+
+        module = stores.load(store)
+        # Warm up imports and caches before timing
+        pages, products = replay(module, index)
+
+        if not products:
+            print(f'[ERROR] The fixtures of {store.label} yield no products...')
+            continue
+
+        timings = []
+        for _ in range(repeat):
+            started = perf_counter()
+            replay(module, index)
+            timings.append(perf_counter() - started)
+        seconds = statistics.median(timings)
+
+        tracemalloc.start()
+        mined: list = []
+        replay(module, index, mined)
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        blocks = sum(stat.count for stat in snapshot.statistics('filename'))
+        del mined
+
+        source = index.get('source', 'live')
+        if source != 'live':
+            print(f'[DEBUG] The fixtures of {store.label} are {source} pages, not real-site throughput...')
+
+        results[store.name] = {
+            'source': source,
+            'pages': pages,
+            'products': products,
+            'pages_per_second': round(pages / seconds, 1),
+            'us_per_product': round(seconds / products * 1e6, 1),
+            'peak_kib': round(peak / 1024, 1),
+            'allocated_blocks': blocks,
+            'blocks_per_product': round(blocks / products, 1),
+        }
+
+    return results
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], threshold: float = REGRESSION_THRESHOLD) -> list[str]:
+    '''
+    Stores whose parsing got slower than the baseline by more than the threshold
+
+    Args:
+        results: Results of bench_parsers
+        baseline: Earlier results of bench_parsers
+        threshold: Allowed slowdown, 0.10 is 10% more microseconds per product
+
+    Returns:
+        list[str]: One line per regression
+    '''
+    regressions = []
+
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not before.get('us_per_product'):
+            continue
+
+        change = result['us_per_product'] / before['us_per_product'] - 1
+        if change > threshold:
+            regressions.append(f"{name}: {before['us_per_product']} -> {result['us_per_product']} us per product (+{change:.0%})")
+
+    return regressions
+
+def bench_json(names: list[str] | None = None, repeat: int = 20, root: str = FIXTURES_DIR) -> dict[str, dict]:
+    '''
+    Time decoding the recorded JSON responses of the API stores the way the miners used to, through response.text and
+    json.loads, against fetch.decode_json on the raw bytes: with the standard library, with orjson when installed, and
+    into the msgspec schemas the store declares in RESPONSE_SCHEMAS, which only materialize the fields it reads
+
+    Args:
+        names: Store names, the stores with recorded JSON responses if None
+        repeat: Timed passes over the responses of each store
+        root: Fixtures directory
+
+    Returns:
+        dict[str, dict]: Microseconds per response and MB/s of each decoder, per store
+    '''
+    decoders = {
+        'json_text': lambda url, status, content_type, body: json.loads(response(url, status, content_type, body).text),
+        'json_bytes': lambda url, status, content_type, body: json.loads(body),
+    }
+    if fetch.orjson is not None:
+        decoders['orjson'] = lambda url, status, content_type, body: fetch.orjson.loads(body)
+
+    results = {}
+
+    for store in stores.get_stores(names):
+        index = load_fixtures(store.name, root)
+        bodies = [(url, *entry) for url, entry in (index or {}).get('responses', {}).items() if entry[0] == 200 and 'json' in entry[1]]
+
+        if not bodies:
+            if names:
+                print(f'[DEBUG] No recorded JSON responses for {store.label}, record them with bench record...')
+            continue
+
+        store_decoders = dict(decoders)
+        schemas = getattr(stores.load(store), 'RESPONSE_SCHEMAS', None)
+        if schemas:
+            store_decoders['msgspec_schema'] = lambda url, status, content_type, body: fetch.decode_json(body, schemas[urlsplit(url).path])
+
+        size = sum(len(entry[3]) for entry in bodies)
+        results[store.name] = {'source': index.get('source', 'live'), 'responses': len(bodies), 'kib_per_response': round(size / len(bodies) / 1024, 1)}
+
+        for name, decode in store_decoders.items():
+            started = perf_counter()
+            for _ in range(repeat):
+                for entry in bodies:
+                    decode(*entry)
+            seconds = perf_counter() - started
+
+            results[store.name][name] = {
+                'us_per_response': round(seconds / (repeat * len(bodies)) * 1e6, 1),
+                'mb_per_second': round(size * repeat / seconds / 1e6, 1),
+            }
+
+    return results
@@ -1,10 +1,13 @@
-import requests
-import concurrent.futures
 from dataclasses import dataclass
 from unidecode import unidecode
 from hashlib import sha256
 from time import sleep
 import random
+from typing import Iterator
+import msgspec
+from miners import fetch
+from miners.mining import MiningError, collect
+from miners.orchestrator import run
 
 @dataclass
 class Category:
@@ -25,6 +28,30 @@ class Product:
     product_url: str
     category_name: str
 
+class Classification(msgspec.Struct):
+    id: int
+    name: str
+    slug: str
+
+class Classifications(msgspec.Struct):
+    items: list[Classification]
+
+class ArticleImage(msgspec.Struct):
+    src: str
+
+class Article(msgspec.Struct):
+    code: str | int
+    name: str
+    price: int | float | str
+    isOnOffer: bool
+    images: list[ArticleImage] | None = None
+
+class Articles(msgspec.Struct):
+    items: list[Article]
+
+# API responses by URL path, the schemas declare the fields the miner reads and the rest of a response is skipped
+RESPONSE_SCHEMAS = {'/api/classifications/web': Classifications, '/api/articles': Articles}
+
 def get_categories() -> (list[Category] | None):
     '''
     Retreive all categories from Biggie API, return a list of Category objects
@@ -34,13 +61,13 @@ def get_categories() -> (list[Category] | None):
         None: If error occurs
     '''
     try:
-        response = requests.get('https://api.app.biggie.com.py/api/classifications/web?take=-1')
+        response = fetch.get('https://api.app.biggie.com.py/api/classifications/web?take=-1')
         if response.status_code == 200:
             print('[DEBUG] Retreived categories from Biggie API successfully...')
-            categories = response.json()
+            categories = fetch.decode_json(response.content, Classifications)
             categories_list: list[Category] = []
-            for category in categories['items']:
-                categories_list.append(Category(category['id'], category['name'].strip(), category['slug']))
+            for category in categories.items:
+                categories_list.append(Category(category.id, category.name.strip(), category.slug, Category.url.format(slug=category.slug)))
             return categories_list
         else:
             print('[ERROR] Invalid response from Biggie API...')
@@ -50,98 +77,89 @@ def get_categories() -> (list[Category] | None):
         print('[ERROR] Failed to retreive categories from Biggie API...', e)
         return None
     
-def mine_products(category: Category) -> (list[Product] | None):
+def iter_products(category: Category) -> Iterator[list[Product]]:
     '''
-    Mine products from a category, operates like a thread function to not overload the API
+    Mine products from a category page by page, operates like a thread function to not overload the API
 
     Args:
         category: Category object to mine products from
 
-    Returns:
-        list[Product]: List of Product objects mined from the category
-        None: If error occurs
+    Yields:
+        list[Product]: Product objects mined from each page of the category
+
+    Raises:
+        MiningError: If error occurs
     '''
     print(f'[DEBUG] Mining products from {category.name} category...')
 
     sleep(random.randint(0, 5))
 
-    products_list: list[Product] = []
+    skip = 0
     while True:
         try:
-            response = requests.get(f'https://api.app.biggie.com.py/api/articles?take=50&skip={len(products_list)}&classificationName={category.slug}', timeout=120)
+            response = fetch.get(f'https://api.app.biggie.com.py/api/articles?take=50&skip={skip}&classificationName={category.slug}', timeout=120)
             if response.status_code == 200:
-                products = response.json()
-                if products['items']:
-                    for product in products['items']:
-                        url: str = f"https://biggie.com.py/item/{unidecode(product['name'].lower()).replace(' ', '-')}-{product['code']}"
+                products = fetch.decode_json(response.content, Articles)
+                if products.items:
+                    page_products: list[Product] = []
+                    for product in products.items:
+                        url: str = f"https://biggie.com.py/item/{unidecode(product.name.lower()).replace(' ', '-')}-{product.code}"
                         sha256_code = sha256(url.encode()).hexdigest()
-                        products_list.append(Product(sha256_code,
+                        page_products.append(Product(sha256_code,
                                                      'biggie',
-                                                     product['code'], 
-                                                     product['name'],
-                                                     product['price'], 
-                                                     product['isOnOffer'], 
-                                                     product['images'][0]['src'] if product['images'] else "https://biggie.com.py/_nuxt/img/bdefault1.2002ae6.png",
+                                                     product.code, 
+                                                     product.name,
+                                                     product.price, 
+                                                     product.isOnOffer, 
+                                                     product.images[0].src if product.images else "https://biggie.com.py/_nuxt/img/bdefault1.2002ae6.png",
                                                      url, 
                                                      category.name))
 
+                    skip += len(page_products)
+
                 else:
-                    print(f'[DEBUG] No products found in {category.name} category...') if not products_list else print(f'[DEBUG] All products from {category.name} category retreived, total of {len(products_list)}...')
-                    break
+                    print(f'[DEBUG] No products found in {category.name} category...') if not skip else print(f'[DEBUG] All products from {category.name} category retreived, total of {skip}...')
+                    return
             else:
                 print(f'[ERROR] Failed to retreive products from {category.name} category...')
                 print(response.status_code)
-                return None
+                raise MiningError(category.name)
+
+        except MiningError:
+            raise
 
         except Exception as e:
             print(f'[ERROR] Failed to retreive products from {category.name} category...')
             print(e)
-            return None
+            raise MiningError(category.name) from e
 
-    return products_list
+        yield page_products
 
-def main():
-
-    categories: list[Category] = get_categories()
-    print(f'[DEBUG] {categories}')
-    if categories:
-        print('[DEBUG] Categories retreived successfully...')
-        print('[DEBUG] Mining products from categories...')
-        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-            product_tracker: dict[str, Product] = {}
-
-            futures = [executor.submit(mine_products, category) for category in categories]
-
-            for future in concurrent.futures.as_completed(futures):
-                print(f"[DEBUG] Total products retreived: {len(future.result())}")
-
-                if future.result() is not None:
-                    for product in future.result():
-                        if product.id not in product_tracker:
-                            product_tracker[product.id] = product
-                        else:
-                            continue
-
-            print(f"[DEBUG] Found a total of {len(product_tracker)} products from Biggie...")
+def mine_products(category: Category) -> (list[Product] | None):
+    '''
+    Mine every product from a category at once
 
-            for i in range(0, len(product_tracker), 1000):
-                try:
-                    print(f"[DEBUG] Sending {i} to {i+1000} products to the API...")
-                    response = requests.post('http://api:8080/products/', json=[product.__dict__ for product in list(product_tracker.values())[i:i+1000]], timeout=120)
+    Args:
+        category: Category object to mine products from
 
-                    if response.status_code == 201:
-                        print('[DEBUG] Products sent to the API...')
-                    else:
-                        print('[ERROR] Failed to send products to the API...')
-                        print(response.status_code)
-                        continue
+    Returns:
+        list[Product]: List of Product objects mined from the category
+        None: If error occurs
+    '''
+    return collect(iter_products(category))
 
-                except Exception as e:
-                    print('[ERROR] Failed to send products to the API...', e)
+def get_tasks() -> (list[Category] | None):
+    '''
+    Work items for the orchestrator, one per category
 
+    Returns:
+        list[Category]: Categories to mine
+        None: If error occurs
+    '''
+    return get_categories()
 
-    else:
-        print('[ERROR] Failed to retreive categories from Biggie API...')
+def main():
+    run(['biggie'])
 
 if __name__ == '__main__':
     print('[DEBUG] Starting Biggie Miner...')
@@ -0,0 +1,23 @@
+import os
+
+# Base URL of the Go API the miners upload products to
+API_URL: str = os.getenv('API_URL', 'http://api:8080')
+
+# Global number of worker threads shared by every store in a run
+WORKERS: int = int(os.getenv('MINERS_WORKERS', '16'))
+
+# Shared task queue of the distributed crawl mode, a SQLite path or sqlite:/// URL
+QUEUE_URL: str = os.getenv('MINERS_QUEUE', 'queue.db')
+
+# Local state of the miners, recrawl history, price history, caches
+DATA_DIR: str = os.getenv('MINERS_DATA_DIR', 'data')
+
+# Where uploaded products go, the API base URL, a mongodb:// URI or mongo for MONGO_URI, see sinks.open_sink
+SINK_URL: str = os.getenv('MINERS_SINK', API_URL)
+
+# Upload batches in flight at once, for sinks that accept concurrent writes
+UPLOADERS: int = int(os.getenv('MINERS_UPLOADERS', '4'))
+
+# MongoDB the API writes to, used by the direct MongoDB sink
+MONGO_URI: str = os.getenv('MONGO_URI', 'mongodb://mongo:27017')
+MONGO_DATABASE: str = os.getenv('MONGO_DATABASE', 'mongo')
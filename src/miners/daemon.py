@@ -0,0 +1,189 @@
+import signal
+import threading
+from datetime import datetime, timedelta
+from time import time
+
+from miners import stores
+from miners.config import SINK_URL
+from miners.orchestrator import Orchestrator
+from miners.sinks import open_sink
+from miners.spool import SpooledSink
+
+def parse_interval(value: str) -> float:
+    '''
+    Parse an interval like 90, 90s, 30m, 6h or 1d into seconds
+    '''
+    units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+    value = value.strip().lower()
+
+    if value[-1:] in units:
+        return float(value[:-1]) * units[value[-1]]
+
+    return float(value)
+
+def parse_field(field: str, low: int, high: int) -> set[int]:
+    '''
+    Values matched by one cron field: *, */step, a, a-b, a-b/step and comma separated lists of them
+    '''
+    values: set[int] = set()
+
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/')
+            step = int(step_text)
+
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(bound) for bound in part.split('-'))
+        else:
+            start = end = int(part)
+
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f'Invalid cron field: {field}')
+
+        values.update(range(start, end + 1, step))
+
+    return values
+
+class Cron:
+    '''
+    Five field cron schedule, minute hour day-of-month month day-of-week, in local time. Day of week 0 and 7 are both
+    Sunday. As in cron, when both day fields are restricted a day matching either one fires.
+    '''
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+
+        if len(fields) != 5:
+            raise ValueError(f'Cron expressions have 5 fields: {expression}')
+
+        self.minutes = parse_field(fields[0], 0, 59)
+        self.hours = parse_field(fields[1], 0, 23)
+        self.days = parse_field(fields[2], 1, 31)
+        self.months = parse_field(fields[3], 1, 12)
+        self.weekdays = {day % 7 for day in parse_field(fields[4], 0, 7)}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def matches_day(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next(self, after: float) -> float:
+        '''
+        First time strictly after the given one the schedule fires
+
+        Args:
+            after: Epoch seconds
+
+        Returns:
+            float: Epoch seconds of the next run
+        '''
+        moment = datetime.fromtimestamp(after).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = moment + timedelta(days=366 * 5)
+
+        while moment < limit:
+            if moment.month not in self.months or not self.matches_day(moment):
+                moment = (moment + timedelta(days=1)).replace(hour=0, minute=0)
+            elif moment.hour not in self.hours:
+                moment = (moment + timedelta(hours=1)).replace(minute=0)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment.timestamp()
+
+        raise ValueError('The cron expression never fires')
+
+class Interval:
+    '''
+    Fixed interval schedule, measured from the start of the previous run
+    '''
+
+    def __init__(self, seconds: float):
+        if seconds <= 0:
+            raise ValueError('The interval must be positive')
+        self.seconds = seconds
+
+    def next(self, after: float) -> float:
+        return after + self.seconds
+
+class Daemon:
+    '''
+    Keeps the miners resident and runs the crawl on a schedule. One orchestrator serves every run, so connection
+    pools, the sink and its spool, the recrawl, sitemap and image caches, and the discovered categories of each store
+    are loaded once and reused, and modules are only imported by the first run that needs them. A run that outlasts
+    its slot delays the next one, runs never overlap.
+    '''
+
+    def __init__(self, orchestrator: Orchestrator, schedule: Cron | Interval):
+        self.orchestrator = orchestrator
+        self.schedule = schedule
+        self.runs = 0
+
+        self._stop = threading.Event()
+
+    def stop(self, *_) -> None:
+        print('[DEBUG] Stopping the miners daemon after the current run...')
+        self._stop.set()
+
+    def serve(self, immediately: bool = True) -> None:
+        '''
+        Run until stopped by SIGTERM or SIGINT
+
+        Args:
+            immediately: Start the first run now instead of waiting for the schedule
+        '''
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        due = time() if immediately else self.schedule.next(time())
+
+        while not self._stop.is_set():
+            print(f'[DEBUG] Next run at {datetime.fromtimestamp(due).isoformat(timespec="seconds")}...')
+
+            if self._stop.wait(max(0.0, due - time())):
+                break
+
+            started = time()
+            self.runs += 1
+            print(f'[DEBUG] Starting run {self.runs}...')
+
+            try:
+                self.orchestrator.run()
+            except Exception as e:
+                print(f'[ERROR] Run {self.runs} failed...', e)
+
+            print(f'[DEBUG] Run {self.runs} finished in {time() - started:.0f}s...')
+
+            due = self.schedule.next(started)
+            while due <= time():
+                due = self.schedule.next(due)
+
+def serve(names: list[str] | None, schedule: Cron | Interval, immediately: bool = True, **options) -> None:
+    '''
+    Open the sink once and serve scheduled runs until stopped
+
+    Args:
+        names: Store names to mine, all stores if None
+        schedule: When to run
+        immediately: Start the first run now
+        options: Orchestrator options, plus sink, spool and wait as taken by orchestrator.run
+    '''
+    destination = open_sink(options.pop('sink', SINK_URL))
+
+    if options.pop('spool', True):
+        destination = SpooledSink(destination)
+
+    if options.pop('wait', True):
+        destination.wait()
+
+    try:
+        Daemon(Orchestrator(stores.get_stores(names), sink=destination, **options), schedule).serve(immediately)
+    finally:
+        destination.close()
@@ -0,0 +1,245 @@
+import threading
+from time import sleep
+
+from miners import stores
+from miners.config import SINK_URL, UPLOADERS
+from miners.enrich import DetailStage
+from miners.images import ImageStage
+from miners.mining import MiningError
+from miners.pipeline import UploadPipeline
+from miners.planner import plan
+from miners.sinks import open_sink
+from miners.spool import SpooledSink
+from miners.taskqueue import LEASE_TIMEOUT, Broker, SqliteBroker, Task, decode_item, encode_item, new_worker_id
+
+def open_broker(url: str) -> Broker:
+    '''
+    Open a broker from a queue URL, a bare path or sqlite:///path opens a SqliteBroker
+
+    Args:
+        url: Queue location
+
+    Returns:
+        Broker: The opened broker
+    '''
+    if url.startswith('sqlite:///'):
+        return SqliteBroker(url[len('sqlite:///'):])
+
+    if '://' in url:
+        raise ValueError(f'Unsupported queue URL: {url}')
+
+    return SqliteBroker(url)
+
+def publish(broker: Broker, names: list[str] | None = None) -> int:
+    '''
+    Start a new crawl, run discovery for each store and publish one task per work item of the crawl to the shared
+    queue
+
+    Args:
+        broker: Queue to publish to
+        names: Store names, all stores if None
+
+    Returns:
+        int: Number of tasks published
+    '''
+    total = 0
+    broker.begin()
+
+    for store in stores.get_stores(names):
+        module = stores.load(store)
+        tasks = module.get_tasks()
+
+        if not tasks:
+            print(f'[ERROR] No Categories found for {store.label}...')
+            continue
+
+        tasks = plan(store, tasks)
+
+        total += broker.publish(store.name, [encode_item(task) for task in tasks])
+        print(f'[DEBUG] Published {len(tasks)} tasks from {store.label}...')
+
+    return total
+
+class Heartbeat:
+    '''
+    Keeps extending a task lease while it is being mined, so only dead workers lose their tasks
+    '''
+
+    def __init__(self, broker: Broker, task: Task, worker: str, timeout: int = LEASE_TIMEOUT):
+        self.broker = broker
+        self.task = task
+        self.worker = worker
+        self.timeout = timeout
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.timeout / 3):
+            if not self.broker.extend(self.task, self.worker, self.timeout):
+                print(f'[ERROR] Lost the lease on task {self.task.id}...')
+                return
+
+class CrawlCategories:
+    '''
+    Categories the tasks of this worker process mined, per crawl and store, for PriceHistory.record_run. Every worker
+    records its own share of a crawl, and the history joins them.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._crawls: dict[tuple[float, str], dict[str, set[str]]] = {}
+
+    def add(self, crawl: float, store: str, categories: set[str], complete: bool) -> None:
+        with self._lock:
+            recorded = self._crawls.setdefault((crawl, store), {'crawled': set(), 'incomplete': set()})
+            recorded['crawled' if complete else 'incomplete'].update(categories)
+
+    def record(self, history, before: float | None = None) -> None:
+        '''
+        Record the categories of every crawl older than before, or of all of them, in the price history and forget them
+
+        Args:
+            history: PriceHistory the crawls were recorded in
+            before: Crawl id of the crawl still running
+        '''
+        with self._lock:
+            keys = [key for key in self._crawls if before is None or key[0] < before]
+            crawls = [(key, self._crawls.pop(key)) for key in keys]
+
+        for (crawl, store), categories in crawls:
+            try:
+                history.record_run(store, crawl, categories['crawled'], categories['incomplete'])
+            except Exception as e:
+                print(f'[ERROR] Failed to record the categories crawled from {store}...', e)
+
+def run_task(broker: Broker, pipeline: UploadPipeline, task: Task, worker: str, categories: set[str] | None = None) -> bool:
+    '''
+    Mine a single leased task page by page, dedup each page against every other worker and send the new products to
+    the pipeline. The task is only completed once its products were handed to the sink, a worker dying before that
+    leaves the task to be leased again with its claims released.
+
+    Args:
+        broker: Queue the task was leased from
+        pipeline: Upload pipeline of this worker process
+        task: Leased task
+        worker: Id of the worker holding the lease
+        categories: Filled with the category names of every product mined, duplicates included
+
+    Returns:
+        bool: Whether the task was mined whole
+    '''
+    store = stores.STORES[task.store]
+    module = stores.load(store)
+
+    try:
+        with Heartbeat(broker, task, worker):
+            for products in module.iter_products(decode_item(module, task.payload)):
+                if categories is not None:
+                    categories.update(product.category_name for product in products)
+
+                new_ids = broker.claim(task, [product.id for product in products])
+                products = [product for product in products if product.id in new_ids]
+
+                if store.dedup_by_name:
+                    new_names = broker.claim(task, [f'name:{product.name}' for product in products])
+                    products = [product for product in products if f'name:{product.name}' in new_names]
+
+                pipeline.submit(store, products)
+
+            # Claims outlive a completed task, so its products must reach the sink first
+            pipeline.handoff(store)
+    except MiningError:
+        print(f'[ERROR] Task {task.id} from {store.label} failed, returning it to the queue...')
+        broker.fail(task, worker)
+        return False
+
+    broker.complete(task, worker)
+    return True
+
+def work(broker: Broker, workers: int = 4, follow: bool = False, poll: int = 5, history: bool = True, images: bool = False, sink: str = SINK_URL, spool: bool = True, uploaders: int = UPLOADERS, details: bool = False) -> None:
+    '''
+    Pull tasks from the shared queue until it is drained, any number of these can run on any number of nodes
+
+    Args:
+        broker: Queue to pull from
+        workers: Number of worker threads in this process
+        follow: Keep polling for new tasks instead of exiting once the queue is drained
+        poll: Seconds to wait when no task is available
+        history: Append the mined prices to the local price history
+        images: Cache the product images and their thumbnails locally
+        sink: Where to write the products, see sinks.open_sink
+        spool: Spool every batch to disk first and retry the failed ones instead of dropping them
+        uploaders: Upload batches in flight at once
+        details: Fetch and cache the detail pages of new and changed products
+    '''
+    destination = open_sink(sink)
+
+    if spool:
+        destination = SpooledSink(destination)
+
+    destination.wait()
+
+    price_history = None
+    if history:
+        from miners.history import PriceHistory
+        price_history = PriceHistory()
+
+    pipeline = UploadPipeline(destination, uploaders, history=price_history, images=ImageStage() if images else None, details=DetailStage() if details else None)
+    crawl = {'id': None}
+    crawl_lock = threading.Lock()
+    crawled = CrawlCategories()
+
+    def loop():
+        worker = new_worker_id()
+        while True:
+            task = broker.lease(worker)
+
+            if task is None:
+                if not follow and broker.drained():
+                    return
+                sleep(poll)
+                continue
+
+            # Every worker of a crawl records it under the crawl id, and a following worker dedups each crawl afresh
+            with crawl_lock:
+                if crawl['id'] is None or task.crawl > crawl['id']:
+                    crawl['id'] = task.crawl
+                    pipeline.begin(task.crawl)
+
+                    if price_history is not None:
+                        crawled.record(price_history, before=task.crawl)
+                run = crawl['id']
+
+            categories = set()
+
+            try:
+                complete = run_task(broker, pipeline, task, worker, categories)
+            except Exception as e:
+                print(f'[ERROR] Task {task.id} failed...', e)
+                broker.fail(task, worker)
+                complete = False
+
+            crawled.add(run, task.store, categories, complete)
+
+    threads = [threading.Thread(target=loop, daemon=True) for _ in range(workers)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    pipeline.close()
+    destination.close()
+
+    if price_history is not None:
+        crawled.record(price_history)
@@ -0,0 +1,333 @@
+import copy
+import json
+import os
+import queue
+import threading
+from hashlib import sha256
+from time import time
+from urllib.parse import urlsplit
+
+from miners import fetch, stores
+from miners.config import DATA_DIR
+from miners.stores import Store
+
+# Detail page downloads in flight at once per host
+DETAIL_HOST_LIMIT: int = 2
+
+# Seconds parsed details are trusted before the detail page is fetched again
+DETAIL_TTL: int = 7 * 24 * 3600
+
+# Seconds after their fetch that cached details are dropped on save, so products no longer listed leave the cache
+DETAIL_PRUNE_AGE: int = 4 * DETAIL_TTL
+
+# Detail pages queued per host, products past it are left for the next run
+DETAIL_QUEUE_SIZE: int = 256
+
+# schema.org properties kept from a product's structured data
+DETAIL_PROPERTIES = ('sku', 'gtin', 'gtin8', 'gtin12', 'gtin13', 'gtin14', 'mpn', 'brand', 'description', 'availability')
+
+# Details that become the product code of models.Product, the first one found wins
+CODE_PROPERTIES = ('sku', 'gtin13', 'gtin', 'gtin14', 'gtin12', 'gtin8', 'mpn')
+
+def listing_fingerprint(product) -> str:
+    '''
+    Hash of what a listing page shows of a product, details are fetched again when it changes
+    '''
+    row = f"{product.name}:{product.price}:{getattr(product, 'is_discounted', '')}:{getattr(product, 'mayorista_price', '')}:{product.image_url}"
+    return sha256(row.encode()).hexdigest()[:16]
+
+def schema_products(data) -> list[dict]:
+    '''
+    Every schema.org Product object in a JSON-LD document, including the ones inside @graph and nested lists
+    '''
+    if isinstance(data, list):
+        return [product for item in data for product in schema_products(item)]
+
+    if not isinstance(data, dict):
+        return []
+
+    kind = data.get('@type')
+    if kind == 'Product' or (isinstance(kind, list) and 'Product' in kind):
+        return [data]
+
+    return schema_products(data.get('@graph', []))
+
+def schema_value(value) -> (str | None):
+    if isinstance(value, dict):
+        value = value.get('name') or value.get('@id')
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if value is None:
+        return None
+    return str(value).strip().removeprefix('https://schema.org/').removeprefix('http://schema.org/') or None
+
+def parse_details(html: str) -> dict:
+    '''
+    Product details from the structured data of a detail page, the schema.org JSON-LD most store platforms emit, or
+    its microdata otherwise: SKU and EAN codes, brand, description, stock availability and specifications
+
+    Args:
+        html: Detail page
+
+    Returns:
+        dict: The details found, empty if the page has no structured data
+    '''
+    from lxml import html as lxml_html
+
+    document = lxml_html.fromstring(html)
+    details: dict = {}
+
+    for script in document.xpath('//script[@type="application/ld+json"]'):
+        try:
+            found = schema_products(json.loads(script.text_content()))
+        except ValueError:
+            continue
+
+        for product in found:
+            offers = product.get('offers') or {}
+            offers = offers[0] if isinstance(offers, list) and offers else offers
+
+            for name in DETAIL_PROPERTIES:
+                value = schema_value(product.get(name, offers.get(name) if isinstance(offers, dict) else None))
+                if value:
+                    details.setdefault(name, value)
+
+            specifications = {
+                schema_value(item.get('name')): schema_value(item.get('value'))
+                for item in product.get('additionalProperty') or [] if isinstance(item, dict) and item.get('name')
+            }
+            if specifications:
+                details.setdefault('specifications', specifications)
+
+    if details:
+        return details
+
+    for element in document.xpath('//*[@itemprop]'):
+        name = element.get('itemprop')
+        if name in DETAIL_PROPERTIES and name not in details:
+            value = schema_value(element.get('content') or element.get('href') or element.text_content())
+            if value:
+                details[name] = value
+
+    return details
+
+def merge_details(product, details: dict) -> None:
+    '''
+    Add details to a product the way they are uploaded: the product code from the SKU or GTIN when the listing had
+    none, and every detail under details
+    '''
+    if not getattr(product, 'code', None):
+        code = next((details[name] for name in CODE_PROPERTIES if details.get(name)), None)
+        if code:
+            product.code = code
+
+    product.details = details
+
+class DetailCache:
+    '''
+    Parsed product details per product URL, persisted as JSON under DATA_DIR/details/<store>.json with the listing
+    fingerprint the details were fetched for and when. Entries older than prune_age are dropped when the cache is saved,
+    products still listed are fetched again long before that.
+    '''
+
+    def __init__(self, root: str | None = None, ttl: int = DETAIL_TTL, prune_age: int = DETAIL_PRUNE_AGE):
+        self.root = root or os.path.join(DATA_DIR, 'details')
+        self.ttl = ttl
+        self.prune_age = prune_age
+        self.stores: dict[str, dict[str, dict]] = {}
+
+        self._lock = threading.Lock()
+
+    def entries(self, store: str) -> dict[str, dict]:
+        with self._lock:
+            if store not in self.stores:
+                path = os.path.join(self.root, f'{store}.json')
+                self.stores[store] = {}
+                if os.path.exists(path):
+                    with open(path) as file:
+                        self.stores[store] = json.load(file)
+            return self.stores[store]
+
+    def fresh(self, store: str, product, now: float | None = None) -> bool:
+        '''
+        Whether the cached details of a product are still valid, its listing did not change and they are within the TTL
+        '''
+        now = time() if now is None else now
+        entry = self.entries(store).get(product.product_url)
+        return entry is not None and entry['listing'] == listing_fingerprint(product) and now - entry['fetched'] < self.ttl
+
+    def put(self, store: str, product, details: dict, now: float | None = None) -> None:
+        entries = self.entries(store)
+
+        with self._lock:
+            entries[product.product_url] = {'listing': listing_fingerprint(product), 'fetched': time() if now is None else now, 'details': details}
+
+    def get(self, store: str, product_url: str) -> (dict | None):
+        entry = self.entries(store).get(product_url)
+        return entry['details'] if entry else None
+
+    def save(self, now: float | None = None) -> None:
+        now = time() if now is None else now
+        os.makedirs(self.root, exist_ok=True)
+
+        with self._lock:
+            for entries in self.stores.values():
+                for url in [url for url, entry in entries.items() if now - entry['fetched'] >= self.prune_age]:
+                    del entries[url]
+
+            data = {store: dict(entries) for store, entries in self.stores.items()}
+
+        for store, entries in data.items():
+            path = os.path.join(self.root, f'{store}.json')
+            with open(f'{path}.tmp', 'w') as file:
+                json.dump(entries, file, ensure_ascii=False)
+            os.replace(f'{path}.tmp', path)
+
+class DetailStage:
+    '''
+    Optional pipeline stage that fetches the detail pages of deduplicated products, only for products that are new or
+    whose listing changed since their details were cached, so its cost follows the catalog churn. Every host has its
+    own queue and at most DETAIL_HOST_LIMIT downloads in flight. Stores parse details with the parse_details function
+    of their module when they have one, and with the generic structured data parser otherwise.
+
+    Cached details are merged into the products on submit, before they are uploaded. Products whose details are
+    fetched later come back from drain as enriched copies, for the pipeline to upload again. Submitting never blocks
+    the pipeline, products past a full host queue are deferred to the next run, like the ones still queued when the
+    stage is closed at a deadline.
+    '''
+
+    def __init__(self, cache: DetailCache | None = None, host_limit: int = DETAIL_HOST_LIMIT, queue_size: int = DETAIL_QUEUE_SIZE):
+        self.cache = cache or DetailCache()
+        self.host_limit = host_limit
+        self.queue_size = queue_size
+        self.stats: dict[str, int] = {'cached': 0, 'fetched': 0, 'empty': 0, 'failed': 0, 'deferred': 0}
+
+        self._lock = threading.Lock()
+        self._queues: dict[str, queue.Queue] = {}
+        self._threads: list[threading.Thread] = []
+        self._seen: set[str] = set()
+        self._enriched: list[tuple[Store, object]] = []
+        self._closed = threading.Event()
+        self._stopped = threading.Event()
+
+    def submit(self, store: Store, products: list) -> None:
+        '''
+        Merge the cached details of products into them, and queue the detail pages of the ones whose cached details
+        are missing, stale or for an older listing, see drain
+
+        Args:
+            store: Store the products were mined from
+            products: Product objects with a product_url
+        '''
+        for product in products:
+            url = getattr(product, 'product_url', None)
+
+            if not url or not url.startswith(('http://', 'https://')):
+                continue
+
+            details = self.cache.get(store.name, url)
+            if details:
+                merge_details(product, details)
+
+            if url in self._seen:
+                continue
+
+            self._seen.add(url)
+
+            if self.cache.fresh(store.name, product):
+                self._count('cached')
+                continue
+
+            try:
+                self._queue(urlsplit(url).netloc).put_nowait((store, product))
+            except queue.Full:
+                self._seen.discard(url)
+                self._count('deferred')
+
+    def drain(self) -> list[tuple[Store, object]]:
+        '''
+        Take the products whose details were fetched since the last call
+
+        Returns:
+            list: Store and enriched copy of each product
+        '''
+        with self._lock:
+            enriched, self._enriched = self._enriched, []
+        return enriched
+
+    def close(self, deadline: float | None = None) -> None:
+        '''
+        Wait for the queued detail pages, until deadline at most, and persist the cache
+
+        Args:
+            deadline: Time to stop at, pages still queued then are deferred to the next run
+        '''
+        self._closed.set()
+
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time()))
+
+        self._stopped.set()
+
+        with self._lock:
+            for host_queue in self._queues.values():
+                while True:
+                    try:
+                        host_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    self.stats['deferred'] += 1
+
+        self.cache.save()
+        print(f"[DEBUG] Details {', '.join(f'{kind} {count}' for kind, count in self.stats.items())}...")
+
+    def _queue(self, host: str) -> queue.Queue:
+        with self._lock:
+            if host not in self._queues:
+                self._queues[host] = queue.Queue(maxsize=self.queue_size)
+                for i in range(self.host_limit):
+                    thread = threading.Thread(target=self._run, args=(self._queues[host],), name=f'details-{host}-{i}', daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+            return self._queues[host]
+
+    def _run(self, host_queue: queue.Queue) -> None:
+        while not self._stopped.is_set():
+            try:
+                item = host_queue.get(timeout=1)
+            except queue.Empty:
+                if self._closed.is_set():
+                    return
+                continue
+
+            store, product = item
+
+            try:
+                response = fetch.get(product.product_url, timeout=60)
+
+                if response.status_code != 200:
+                    print(f'[ERROR] Invalid status code {response.status_code} for details of {product.product_url}...')
+                    self._count('failed')
+                    continue
+
+                parser = getattr(stores.load(store), 'parse_details', parse_details)
+                details = parser(response.text)
+            except Exception as e:
+                print(f'[ERROR] Failed to fetch details of {product.product_url}...', e)
+                self._count('failed')
+                continue
+
+            self.cache.put(store.name, product, details)
+            self._count('fetched' if details else 'empty')
+
+            if details and not self._stopped.is_set():
+                # A copy, the product itself may be in a batch being uploaded
+                enriched = copy.copy(product)
+                merge_details(enriched, details)
+
+                with self._lock:
+                    self._enriched.append((store, enriched))
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.stats[kind] += 1
@@ -0,0 +1,262 @@
+import codecs
+import functools
+import json
+import re
+import threading
+from itertools import chain
+from typing import Callable, Iterator
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Connections kept open per host, shared by every worker mining that host
+POOL_SIZE: int = 32
+
+# Bytes handed to the HTML parser at a time while a page streams in
+CHUNK_SIZE: int = 16 * 1024
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Charset declared by a <meta charset> or <meta http-equiv="Content-Type"> tag
+META_CHARSET = re.compile(rb'<meta[^>]+charset\s*=\s*["\']?\s*([a-zA-Z0-9_:.-]+)', re.IGNORECASE)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def canonicalize(url: str) -> str:
+    '''
+    Normalize a page URL so the same page is always requested, and deduplicated, under the same string: lowercase
+    scheme and host, no default port, no fragment and no repeated slashes in the path. The query is kept as is,
+    store paginators append the page number to it.
+
+    Args:
+        url: URL to normalize
+
+    Returns:
+        str: Canonical URL
+    '''
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+
+    path = re.sub(r'/{2,}', '/', parts.path) or '/'
+
+    return urlunsplit((scheme, host, path, parts.query, ''))
+
+class SingleFlight:
+    '''
+    Collapses concurrent calls with the same key into one, every caller gets the result (or exception) of the call
+    that was already in flight
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[str, dict] = {}
+
+    def do(self, key: str, fn: Callable):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {'done': threading.Event(), 'result': None, 'error': None}
+                self._calls[key] = call
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+_sessions: dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+_flight = SingleFlight()
+
+def session(url: str) -> requests.Session:
+    '''
+    Pooled session of the URL's host, created on first use
+    '''
+    host = urlsplit(url).netloc
+
+    with _sessions_lock:
+        if host not in _sessions:
+            pooled = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE)
+            pooled.mount('http://', adapter)
+            pooled.mount('https://', adapter)
+            _sessions[host] = pooled
+        return _sessions[host]
+
+def get(url: str, timeout: int = 120) -> requests.Response:
+    '''
+    GET a page through the pooled session of its host. Identical requests already in flight from another worker
+    are not sent again, the response is shared.
+
+    Args:
+        url: Page URL
+        timeout: Seconds before giving up
+
+    Returns:
+        requests.Response: The response
+    '''
+    url = canonicalize(url)
+    return _flight.do(url, lambda: session(url).get(url, timeout=timeout))
+
+def stream(url: str, timeout: int = 120) -> requests.Response:
+    '''
+    GET a page through the pooled session of its host without reading the body, see iter_elements. Streamed
+    requests are not shared between workers, and responses other than 200 are closed right away.
+
+    Args:
+        url: Page URL
+        timeout: Seconds before giving up
+
+    Returns:
+        requests.Response: The response, its body still unread
+    '''
+    url = canonicalize(url)
+    response = session(url).get(url, timeout=timeout, stream=True)
+
+    if response.status_code != 200:
+        response.close()
+
+    return response
+
+@functools.cache
+def json_decoder(schema: type):
+    '''
+    Reusable msgspec decoder of a response schema, built once per schema
+    '''
+    import msgspec
+
+    return msgspec.json.Decoder(schema)
+
+def decode_json(content: bytes, schema: type | None = None):
+    '''
+    Decode a JSON response body straight from its bytes, with orjson when it is installed. Unlike response.json() and
+    json.loads(response.text) the body is never decoded to str first, so no charset detection runs on it. With a
+    schema, a msgspec.Struct declaring the fields a miner reads, only those fields are materialized and type checked,
+    the rest of the document is skipped.
+
+    Args:
+        content: Response body, response.content
+        schema: Type to decode the body into
+
+    Returns:
+        The decoded document, an instance of schema if given
+
+    Raises:
+        msgspec.ValidationError: If the body does not match schema
+    '''
+    if schema is not None:
+        return json_decoder(schema).decode(content)
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def meta_charset(head: bytes) -> (str | None):
+    '''
+    Charset a page declares in its <meta> tags, looked for in the first bytes of the page
+
+    Returns:
+        str: Codec name
+        None: If the page declares none, or one Python does not know
+    '''
+    match = META_CHARSET.search(head)
+
+    if match is None:
+        return None
+
+    try:
+        return codecs.lookup(match.group(1).decode('ascii')).name
+    except LookupError:
+        return None
+
+def has_class(element, class_: str) -> bool:
+    '''
+    Match an element the way BeautifulSoup matches class_: a single class matches any of the element's classes, several
+    space separated classes must match the class attribute exactly
+    '''
+    classes = element.get('class') or ''
+    if ' ' in class_:
+        return ' '.join(classes.split()) == class_
+    return class_ in classes.split()
+
+def iter_nodes(response: requests.Response, tag: str, class_: str, grid: bool = False) -> Iterator:
+    '''
+    Parse a streamed page while it downloads and yield every tag with the given class as soon as it closes, the same
+    tags soup.find_all(tag, class_=class_) would find, as lxml elements. An element is only valid until the next one
+    is requested, the rest of the page is dropped as it is parsed. The page is decoded with the charset of the
+    Content-Type header, else the one its <meta> tags declare in the first chunk, else UTF-8.
+
+    Args:
+        response: Response returned by stream
+        tag: Tag name of the product elements
+        class_: Class of the product elements, matched like BeautifulSoup does
+        grid: Stop reading the page once the element holding the first match closes, the end of the product grid
+
+    Yields:
+        lxml.etree._Element: Each matched element
+    '''
+    from lxml import etree
+
+    content_type = response.headers.get('Content-Type', '')
+    charset = content_type.split('charset=')[1].split(';')[0].strip() if 'charset=' in content_type else None
+
+    container = None
+    depth = 0
+
+    def events() -> Iterator[tuple]:
+        chunks = response.iter_content(CHUNK_SIZE)
+        first = next(chunks, b'')
+        parser = etree.HTMLPullParser(events=('start', 'end'), encoding=charset or meta_charset(first) or 'utf-8')
+
+        for chunk in chain([first] if first else [], chunks):
+            parser.feed(chunk)
+            yield from parser.read_events()
+        parser.close()
+        yield from parser.read_events()
+
+    try:
+        for event, element in events():
+            matched = element.tag == tag and has_class(element, class_)
+
+            if event == 'start':
+                if matched:
+                    depth += 1
+                    if container is None:
+                        container = element.getparent()
+                continue
+
+            if matched:
+                depth -= 1
+                yield element
+
+            if grid and element is container:
+                return
+
+            if depth == 0:
+                element.clear()
+                # Drop the elements already read, a cleared element still stays in the tree
+                parent = element.getparent()
+                if parent is not None:
+                    while element.getprevious() is not None:
+                        del parent[0]
+    finally:
+        response.close()
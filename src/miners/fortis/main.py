@@ -1,9 +1,19 @@
-import requests
-import concurrent.futures
 from dataclasses import dataclass
 from unidecode import unidecode
 from hashlib import sha256
 from bs4 import BeautifulSoup
+from lxml import etree
+from typing import Iterator
+from miners import fetch
+from miners.mining import MiningError, collect
+from miners.orchestrator import run
+from miners.platforms import class_xpath, text
+
+LINK = etree.XPath('(.//a)[1]/@href', smart_strings=False)
+NAME = etree.XPath(f'(.//h5[{class_xpath("text-black my-3 px-2 text-uppercase fw-bold")}])[1]')
+PRICE = etree.XPath(f'((.//div[{class_xpath("bg-white d-flex justify-content-between align-items-center py-1 px-1")}])[1]//h5[{class_xpath("card-text precio mb-0")}])[1]')
+MAYORISTA_PRICE = etree.XPath(f'((.//div[{class_xpath("bg-gray-new d-flex justify-content-between align-items-top py-1 px-1")}])[1]//h5[{class_xpath("card-text precio mb-0")}])[1]')
+IMAGE = etree.XPath('(.//img)[1]/@src', smart_strings=False)
 
 @dataclass
 class Category:
@@ -33,7 +43,7 @@ def get_categories() -> (list[Category] | None):
     print("[DEBUG] Getting categories from Fortis main page...")
 
     try:
-        request = requests.get('https://www.fortis.com.py/')
+        request = fetch.get('https://www.fortis.com.py/')
 
         if request.status_code == 200:
             print("[DEBUG] Categories retreived successfully...")
@@ -59,107 +69,96 @@ def get_categories() -> (list[Category] | None):
         return None
     
     
-def mine_products(category: Category) -> (list[Product] | None):
+def iter_products(category: Category) -> Iterator[list[Product]]:
     '''
-    Mine products from a category, operates like a thread function to not overload the website
+    Mine products from a category page by page, operates like a thread function to not overload the website
 
     Args:
         category: Category object to mine products from
 
-    Returns:
-        list[Product]: List of Product objects mined from the category
-        None: If error occurs
+    Yields:
+        list[Product]: Product objects mined from each page of the category
+
+    Raises:
+        MiningError: If error occurs
     '''
     print(f'[DEBUG] Mining products from {category.name} category...')
     try:
-        category_products: list[Product] = []
+        total = 0
 
         page_number = 1
         while True:
-            response = requests.get(f'{category.url}{page_number}', timeout=120)
+            response = fetch.stream(f'{category.url}{page_number}', timeout=120)
             if response.status_code == 200:
                 
-                soup = BeautifulSoup(response.text, 'lxml')
+                products = fetch.iter_nodes(response, 'div', 'col-6 col-sm-6 col-md-4 col-lg-3 mb-5')
 
-                products = soup.find_all('div', class_='col-6 col-sm-6 col-md-4 col-lg-3 mb-5')
+                page_products: list[Product] = []
+                found = 0
 
-                if len(products) == 0 and len(category_products) == 0:
-                    print(f'[DEBUG] {len(products)} products found in the {category.name} category...')
-                    return None
-                elif len(products) == 0:
-                    print(f'[DEBUG] {len(category_products)} products found in the {category.name} category...')
-                    return category_products
-                
                 for product in products:
+                    found += 1
                     new_product: Product = Product(
-                        id=sha256(product.find('a')['href'].encode()).hexdigest(),
+                        id=sha256(LINK(product)[0].encode()).hexdigest(),
                         origin='Fortis',
-                        name=unidecode(product.find('h5', class_="text-black my-3 px-2 text-uppercase fw-bold").text.strip()),
-                        price=int(product.find('div', class_='bg-white d-flex justify-content-between align-items-center py-1 px-1').find("h5", class_="card-text precio mb-0").text.replace('Gs', '').replace('.', '').strip()),
-                        mayorista_price=int(product.find('div', class_='bg-gray-new d-flex justify-content-between align-items-top py-1 px-1').find("h5", class_="card-text precio mb-0").text.replace('Gs', '').replace('.', '').strip()),
-                        image_url=product.find('img')['src'],
-                        product_url=f"https://www.fortis.com.py{product.find('a')['href']}",
+                        name=unidecode(text(NAME(product)[0]).strip()),
+                        price=int(text(PRICE(product)[0]).replace('Gs', '').replace('.', '').strip()),
+                        mayorista_price=int(text(MAYORISTA_PRICE(product)[0]).replace('Gs', '').replace('.', '').strip()),
+                        image_url=IMAGE(product)[0],
+                        product_url=f"https://www.fortis.com.py{LINK(product)[0]}",
                         category_name=category.name
                         )
 
-                    category_products.append(new_product)
+                    page_products.append(new_product)
+
+                if found == 0:
+                    print(f'[DEBUG] {total} products found in the {category.name} category...')
+                    return
+
+                total += len(page_products)
+                yield page_products
 
             else:
                 print(f'[ERROR] Invalid response from {category.name} category...')
                 print(response.status_code)
-                return category_products
+                return
             
             page_number += 1
 
     except Exception as e:
         print(f'[ERROR] Failed to mine products from {category.name} category... {e}')
+        raise MiningError(category.name) from e
+
+def mine_products(category: Category) -> (list[Product] | None):
+    '''
+    Mine every product from a category at once
+
+    Args:
+        category: Category object to mine products from
+
+    Returns:
+        list[Product]: List of Product objects mined from the category
+        None: If error occurs
+    '''
+    return collect(iter_products(category))
+
+def get_tasks() -> (list[Category] | None):
+    '''
+    Work items for the orchestrator, one per category
+
+    Returns:
+        list[Category]: Categories to mine, sorted by slug in reverse
+        None: If error occurs
+    '''
+    categories = get_categories()
+
+    if categories is None:
         return None
-    
-        
+
+    return sorted(categories, key=lambda x: x.slug, reverse=True)
 
 def main():
-    categories: list[Category] = get_categories()
-
-    categories = sorted(categories, key=lambda x: x.slug, reverse=True)
-
-    if categories is not None:
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            product_tracker: dict[str, Product] = {}
-
-            futures = [executor.submit(mine_products, category) for category in categories]
-
-            for future in concurrent.futures.as_completed(futures):
-                print(f"[DEBUG] Results from search {len(future.result()) if future.result() is not None else 0} products...")
-
-                if future.result() is not None:
-                    for product in future.result():
-                        if product.id not in product_tracker:
-                            product_tracker[product.id] = product
-                        else:
-                            continue
-
-            print(f"[DEBUG] Found a total of {len(product_tracker)} products from Fortis...")
-
-            # upload to api, 1000 products at a time
-            for i in range(0, len(product_tracker), 1000):
-                try:
-                    print(f"[DEBUG] Sending {i} to {i+1000} products to the API...")
-                    response = requests.post('http://api:8080/products/', json=[product.__dict__ for product in list(product_tracker.values())[i:i+1000]], timeout=120)
-
-                    if response.status_code == 201:
-                        print('[DEBUG] Products sent to the API...')
-                    else:
-                        print('[ERROR] Invalid status code from API...')
-                        print(response.status_code)
-                        continue
-                except Exception as e:
-                    print('[ERROR] Failed to send products to the API...', e)
-                    continue
-                    
-    else:
-        print('[ERROR] No Categories found on the Fortis front page...')
-    
-    
+    run(['fortis'])
 
 if __name__ == '__main__':
     print("[DEBUG] Running Fortis Miner...")
@@ -1,9 +1,11 @@
-import requests
-import concurrent.futures
 from dataclasses import dataclass
 from unidecode import unidecode
 from hashlib import sha256
-import json
+from typing import Iterator
+import msgspec
+from miners import fetch
+from miners.mining import MiningError, collect
+from miners.orchestrator import run
 
 @dataclass
 class Product:
@@ -16,6 +18,30 @@ class Product:
     product_url: str
     category_name: str
 
+class ListingCategory(msgspec.Struct):
+    nombre: str
+
+class ListingProductInfo(msgspec.Struct):
+    categoria: ListingCategory
+
+class Listing(msgspec.Struct):
+    url_ver: str
+    nombre: str
+    getPrecio: int | float | str
+    precio_oferta: int | float | str | None
+    primera_imagen: str | None
+    producto: ListingProductInfo
+
+class Pagination(msgspec.Struct):
+    last_page: int
+    data: list[Listing]
+
+class ProductsPage(msgspec.Struct):
+    paginacion: Pagination
+
+# API responses by URL path, the schemas declare the fields the miner reads and the rest of a response is skipped
+RESPONSE_SCHEMAS = {'/get-productos': ProductsPage}
+
 def get_pages() -> ( int | None):
     '''
     Retreive all categories from the Gonzalez Gimenez main page, with BeautifulSoup, parse the HTML, and return a list of Category objects
@@ -25,12 +51,12 @@ def get_pages() -> ( int | None):
         None: If error occurs
     '''
     try:
-        response = requests.get('https://www.gonzalezgimenez.com.py/get-productos', timeout=120)
+        response = fetch.get('https://www.gonzalezgimenez.com.py/get-productos', timeout=120)
         if response.status_code == 200:
             # parse JSON
-            data = json.loads(response.text)
+            data = fetch.decode_json(response.content, ProductsPage)
             # get total pages
-            return data['paginacion']['last_page']
+            return data.paginacion.last_page
         else:
             print('[ERROR] Invalid response from Gonzalez Gimenez...')
             print(response.status_code)
@@ -39,85 +65,85 @@ def get_pages() -> ( int | None):
         print('[ERROR] Failed to retreive categories from Gonzalez Gimenez...', e)
         return None
     
-def mine_products(url: str) -> (list[Product] | None):
+def iter_products(url: str) -> Iterator[list[Product]]:
     '''
-    Mine products from a category, operates like a thread function to not overload the website
+    Mine products from a products page, operates like a thread function to not overload the website
 
     Args:
-        category: Category object to mine products from
+        url: Products page to mine
 
-    Returns:
-        list[Product]: List of Product objects mined from the category
-        None: If error occurs
+    Yields:
+        list[Product]: Product objects mined from the page
+
+    Raises:
+        MiningError: If error occurs
     '''
     try:
-        response = requests.get(url, timeout=120)
+        response = fetch.get(url, timeout=120)
 
         if response.status_code == 200:
             print(f'[DEBUG] Retreived products from {url} successfully...')
-            data = json.loads(response.text)
+            data = fetch.decode_json(response.content, ProductsPage)
             products_list: list[Product] = []
 
-            for product in data['paginacion']['data']:
+            for product in data.paginacion.data:
                 products_list.append(Product(
-                    id=sha256(product['url_ver'].encode()).hexdigest(),
+                    id=sha256(product.url_ver.encode()).hexdigest(),
                     origin='Gonzalez Gimenez',
-                    name=unidecode(product['nombre']),
-                    price=product['getPrecio'] if product['precio_oferta'] == 0 else product['precio_oferta'],
-                    is_discounted=True if product['precio_oferta'] != 0 else False,
-                    image_url=product['primera_imagen'],
-                    product_url=product['url_ver'],
-                    category_name=product['producto']['categoria']['nombre']
+                    name=unidecode(product.nombre),
+                    price=product.getPrecio if product.precio_oferta == 0 else product.precio_oferta,
+                    is_discounted=True if product.precio_oferta != 0 else False,
+                    image_url=product.primera_imagen,
+                    product_url=product.url_ver,
+                    category_name=product.producto.categoria.nombre
                 ))
 
-            return products_list
-        
         else:
             print('[ERROR] Invalid response from Gonzalez Gimenez...')
             print(response.status_code)
-            return None
-        
+            raise MiningError(url)
+
+    except MiningError:
+        raise
+
     except Exception as e:
         print('[ERROR] Failed to retreive products from Gonzalez Gimenez...')
         print(e)
-        return None
+        raise MiningError(url) from e
+
+    yield products_list
+
+def mine_products(url: str) -> (list[Product] | None):
+    '''
+    Mine every product from a products page at once
+
+    Args:
+        url: Products page to mine
+
+    Returns:
+        list[Product]: List of Product objects mined from the page
+        None: If error occurs
+    '''
+    return collect(iter_products(url))
     
+def get_tasks() -> (list[str] | None):
+    '''
+    Work items for the orchestrator, one per products page
+
+    Returns:
+        list[str]: Page URLs to mine
+        None: If error occurs
+    '''
+    pages = get_pages()
+
+    if pages is None:
+        return None
+
+    return [f'https://www.gonzalezgimenez.com.py/get-productos?page={page}' for page in range(1, pages + 1)]
+
 def main():
+    run(['gg'])
 
-    pages: list[str] = [f'https://www.gonzalezgimenez.com.py/get-productos?page={page}' for page in range(1, get_pages() + 1)]
-
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        product_tracker: dict[str, Product] = {}
-
-        futures = [executor.submit(mine_products, page) for page in pages]
-
-        for future in concurrent.futures.as_completed(futures):
-            # Send a request to the API to save the products
-            
-            if future.result() is not None:
-                for product in future.result():
-                    if product.id not in product_tracker:
-                        product_tracker[product.id] = product
-                    else:
-                        continue
-
-        print(f"[DEBUG] Found a total of {len(product_tracker)} products from Gonzalez Gimenez...")
-
-        for i in range(0, len(product_tracker), 1000):
-            try:
-                print(f"[DEBUG] Sending {i} to {i+1000} products to the API...")
-                response = requests.post('http://api:8080/products/', json=[product.__dict__ for product in list(product_tracker.values())[i:i+1000]], timeout=120)
-
-                if response.status_code == 201:
-                    print('[DEBUG] Products sent to the API...')
-                else:
-                    print('[ERROR] Invalid status code from API...')
-                    print(response.status_code)
-                    continue
-            except Exception as e:
-                print('[ERROR] Failed to send products to the API...', e)
-                continue
-        
 if __name__ == '__main__':
     print("[DEBUG] Running Gonzalez Gimenez Miner...")
     main()
@@ -0,0 +1,253 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from time import time
+
+import numpy as np
+
+from miners.config import DATA_DIR
+
+# One row per product per run, ids are the raw 32 bytes of the sha256 product id
+ROW = np.dtype([
+    ('id', 'S32'),
+    ('timestamp', '<i8'),
+    ('price', '<i8'),
+    ('mayorista_price', '<i8'),
+    ('is_discounted', '<i1'),
+    ('category', '<i4'),
+])
+
+def id_bytes(product_id: str) -> bytes:
+    return bytes.fromhex(product_id)
+
+def id_hex(value: bytes) -> str:
+    # numpy strips trailing null bytes from S32 items
+    return value.ljust(32, b'\0').hex()
+
+def day_of(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%d')
+
+class PriceHistory:
+    '''
+    Append-only columnar price history, partitioned by store and UTC day:
+
+        <root>/<store>/categories.json      category dictionary of the store
+        <root>/<store>/<YYYY-MM-DD>/*.npy   segments of ROW records
+        <root>/<store>/runs/*.json          categories each run crawled whole
+
+    Every run writes new segments, readers memory map them, and compact merges the segments of a partition into one
+    file sorted by (timestamp, id). Runs that skip categories, under a budget, a deadline, probes or sitemaps, say
+    which categories they crawled whole, so missing products are only read as removed where both runs looked.
+    '''
+
+    def __init__(self, root: str | None = None):
+        self.root = root or os.path.join(DATA_DIR, 'history')
+
+        self._lock = threading.Lock()
+        self._categories: dict[str, list[str]] = {}
+
+    def categories(self, store: str) -> list[str]:
+        '''
+        Category dictionary of a store, the category column holds indices into it
+        '''
+        with self._lock:
+            return list(self._load_categories(store))
+
+    def _load_categories(self, store: str) -> list[str]:
+        if store not in self._categories:
+            path = os.path.join(self.root, store, 'categories.json')
+            if os.path.exists(path):
+                with open(path) as file:
+                    self._categories[store] = json.load(file)
+            else:
+                self._categories[store] = []
+        return self._categories[store]
+
+    def _encode_categories(self, store: str, names: list[str]) -> np.ndarray:
+        with self._lock:
+            dictionary = self._load_categories(store)
+            index = {name: i for i, name in enumerate(dictionary)}
+            added = False
+
+            for name in names:
+                if name not in index:
+                    index[name] = len(dictionary)
+                    dictionary.append(name)
+                    added = True
+
+            if added:
+                path = os.path.join(self.root, store, 'categories.json')
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(f'{path}.tmp', 'w') as file:
+                    json.dump(dictionary, file)
+                os.replace(f'{path}.tmp', path)
+
+            return np.fromiter((index[name] for name in names), dtype='<i4', count=len(names))
+
+    def append(self, store: str, products: list, timestamp: float | None = None) -> int:
+        '''
+        Write the products of a run as a new segment of the store's partition for that day
+
+        Args:
+            store: Store name, the partition key
+            products: Product objects to record
+            timestamp: Time of the run, defaults to the current time
+
+        Returns:
+            int: Number of rows written
+        '''
+        if not products:
+            return 0
+
+        timestamp = time() if timestamp is None else timestamp
+
+        rows = np.empty(len(products), dtype=ROW)
+        rows['id'] = [id_bytes(product.id) for product in products]
+        rows['timestamp'] = int(timestamp)
+        rows['price'] = [product.price for product in products]
+        rows['mayorista_price'] = [getattr(product, 'mayorista_price', 0) or 0 for product in products]
+        rows['is_discounted'] = [-1 if getattr(product, 'is_discounted', None) is None else int(product.is_discounted) for product in products]
+        rows['category'] = self._encode_categories(store, [product.category_name for product in products])
+
+        partition = os.path.join(self.root, store, day_of(timestamp))
+        os.makedirs(partition, exist_ok=True)
+
+        path = os.path.join(partition, f'seg-{int(timestamp)}-{uuid.uuid4().hex[:8]}.npy')
+        np.save(f'{path}.tmp.npy', rows)
+        os.replace(f'{path}.tmp.npy', path)
+
+        return len(rows)
+
+    def record_run(self, store: str, timestamp: float, crawled: set[str], incomplete: set[str] = frozenset()) -> None:
+        '''
+        Record which categories a run crawled. Every process of a distributed crawl writes its own file for the run.
+
+        Args:
+            store: Store name
+            timestamp: Time of the run, as passed to append
+            crawled: Category names of the tasks the run mined whole
+            incomplete: Category names of the tasks that failed or were cut short
+        '''
+        directory = os.path.join(self.root, store, 'runs')
+        os.makedirs(directory, exist_ok=True)
+
+        path = os.path.join(directory, f'{int(timestamp)}-{uuid.uuid4().hex[:8]}.json')
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump({'crawled': sorted(crawled), 'incomplete': sorted(incomplete)}, file)
+        os.replace(f'{path}.tmp', path)
+
+    def crawled(self, store: str, timestamp: float) -> (set[str] | None):
+        '''
+        Categories a run crawled whole, by every process that recorded it
+
+        Returns:
+            set[str]: Category names
+            None: If the run recorded none, runs before categories were recorded crawled everything
+        '''
+        directory = os.path.join(self.root, store, 'runs')
+        prefix = f'{int(timestamp)}-'
+        names = sorted(name for name in os.listdir(directory) if name.startswith(prefix) and name.endswith('.json')) if os.path.isdir(directory) else []
+
+        if not names:
+            return None
+
+        crawled, incomplete = set(), set()
+        for name in names:
+            with open(os.path.join(directory, name)) as file:
+                recorded = json.load(file)
+            crawled.update(recorded['crawled'])
+            incomplete.update(recorded['incomplete'])
+
+        return crawled - incomplete
+
+    def partitions(self, store: str, start: float | None = None, end: float | None = None) -> list[str]:
+        '''
+        Partition directories of a store whose day overlaps [start, end)
+        '''
+        directory = os.path.join(self.root, store)
+        if not os.path.isdir(directory):
+            return []
+
+        first = day_of(start) if start is not None else None
+        last = day_of(end) if end is not None else None
+
+        return [
+            os.path.join(directory, day) for day in sorted(os.listdir(directory))
+            if day != 'runs' and os.path.isdir(os.path.join(directory, day)) and (first is None or day >= first) and (last is None or day <= last)
+        ]
+
+    def segments(self, partition: str) -> list[str]:
+        return sorted(os.path.join(partition, name) for name in os.listdir(partition) if name.endswith('.npy') and not name.endswith('.tmp.npy'))
+
+    def scan(self, store: str, start: float | None = None, end: float | None = None) -> np.ndarray:
+        '''
+        Read every row of a store with start <= timestamp < end. Only the partitions of the days in range are opened,
+        and segments are memory mapped so the filter runs without reading rows twice.
+
+        Args:
+            store: Store name
+            start: Inclusive lower bound, unbounded if None
+            end: Exclusive upper bound, unbounded if None
+
+        Returns:
+            np.ndarray: ROW records
+        '''
+        chunks: list[np.ndarray] = []
+
+        for partition in self.partitions(store, start, end):
+            for segment in self.segments(partition):
+                rows = np.load(segment, mmap_mode='r')
+                mask = np.ones(len(rows), dtype=bool)
+
+                if start is not None:
+                    mask &= rows['timestamp'] >= int(start)
+                if end is not None:
+                    mask &= rows['timestamp'] < int(end)
+
+                chunks.append(rows[mask])
+
+        if not chunks:
+            return np.empty(0, dtype=ROW)
+
+        return np.concatenate(chunks)
+
+    def compact(self, store: str, before: float | None = None) -> int:
+        '''
+        Merge the segments of each partition into a single file sorted by (timestamp, id), dropping duplicate rows.
+        Partitions of the current day are left alone unless before says otherwise, since runs may still append to them.
+
+        Args:
+            store: Store name
+            before: Only compact partitions of days before this time, defaults to the current day
+
+        Returns:
+            int: Number of partitions compacted
+        '''
+        limit = day_of(time() if before is None else before)
+        compacted = 0
+
+        for partition in self.partitions(store):
+            segments = self.segments(partition)
+
+            if os.path.basename(partition) >= limit or len(segments) <= 1:
+                continue
+
+            rows = np.concatenate([np.load(segment) for segment in segments])
+            rows = rows[np.lexsort((rows['id'], rows['timestamp']))]
+
+            keep = np.ones(len(rows), dtype=bool)
+            keep[1:] = rows[1:] != rows[:-1]
+            rows = rows[keep]
+
+            path = os.path.join(partition, f'compact-{uuid.uuid4().hex[:8]}.npy')
+            np.save(f'{path}.tmp.npy', rows)
+            os.replace(f'{path}.tmp.npy', path)
+
+            for segment in segments:
+                os.remove(segment)
+
+            compacted += 1
+
+        return compacted
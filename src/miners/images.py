@@ -0,0 +1,262 @@
+import io
+import json
+import os
+import queue
+import threading
+from hashlib import sha256
+from time import time
+
+from miners import fetch
+from miners.config import DATA_DIR
+
+# Download threads of the image stage
+IMAGE_WORKERS: int = 8
+
+# Seconds a cached image is trusted before it is revalidated against its server
+IMAGE_TTL: int = 7 * 24 * 3600
+
+# Images queued for download, images past it are left for the next run
+IMAGE_QUEUE_SIZE: int = 1024
+
+# Longest side of generated thumbnails, in pixels
+THUMBNAIL_SIZE: int = 256
+
+class ImageCache:
+    '''
+    Content-addressed on-disk image cache:
+
+        <root>/index.json               image URL to content hash and HTTP validators
+        <root>/objects/<ab>/<hash>      original image, named after the sha256 of its bytes
+        <root>/thumbs/<ab>/<hash>.jpg   thumbnail, generated once per distinct content
+
+    URLs serving the same bytes, like a store's placeholder image, share one object and one thumbnail. Cached URLs are
+    only revalidated once IMAGE_TTL has passed, with a conditional request that costs no body when nothing changed.
+    '''
+
+    def __init__(self, root: str | None = None, ttl: int = IMAGE_TTL):
+        self.root = root or os.path.join(DATA_DIR, 'images')
+        self.ttl = ttl
+        self.index: dict[str, dict] = {}
+        self.stats: dict[str, int] = {'cached': 0, 'revalidated': 0, 'downloaded': 0, 'stored': 0, 'failed': 0}
+
+        self._lock = threading.Lock()
+        self._storing: set[str] = set()
+
+        path = os.path.join(self.root, 'index.json')
+        if os.path.exists(path):
+            with open(path) as file:
+                self.index = json.load(file)
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], digest)
+
+    def thumbnail_path(self, digest: str) -> str:
+        return os.path.join(self.root, 'thumbs', digest[:2], f'{digest}.jpg')
+
+    def fetch(self, url: str, now: float | None = None) -> (str | None):
+        '''
+        Make sure an image is in the cache, downloading it only when it is missing or changed on the server
+
+        Args:
+            url: Image URL
+            now: Fetch time, defaults to the current time
+
+        Returns:
+            str: Content hash of the image
+            None: If the image could not be fetched
+        '''
+        now = time() if now is None else now
+
+        with self._lock:
+            entry = dict(self.index.get(url) or {})
+
+        cached = entry and os.path.exists(self.object_path(entry['hash']))
+
+        if cached and now - entry.get('checked', 0) < self.ttl:
+            self._count('cached')
+            return entry['hash']
+
+        headers = {}
+        if cached and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if cached and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        try:
+            response = fetch.session(url).get(url, headers=headers, timeout=60)
+        except Exception as e:
+            print(f'[ERROR] Failed to download image {url}...', e)
+            self._count('failed')
+            return None
+
+        if response.status_code == 304 and cached:
+            entry['checked'] = now
+            self._update(url, entry)
+            self._count('revalidated')
+            return entry['hash']
+
+        if response.status_code != 200:
+            print(f'[ERROR] Invalid status code {response.status_code} for image {url}...')
+            self._count('failed')
+            return None
+
+        self._count('downloaded')
+        digest = sha256(response.content).hexdigest()
+        self.store(digest, response.content)
+
+        self._update(url, {
+            'hash': digest,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'checked': now,
+        })
+
+        return digest
+
+    def store(self, digest: str, content: bytes) -> None:
+        '''
+        Write an image object and its thumbnail unless that content is already cached
+
+        Args:
+            digest: sha256 hex digest of content
+            content: Image bytes
+        '''
+        path = self.object_path(digest)
+
+        with self._lock:
+            if digest in self._storing or os.path.exists(path):
+                return
+            self._storing.add(digest)
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f'{path}.tmp', 'wb') as file:
+                file.write(content)
+            os.replace(f'{path}.tmp', path)
+            self._count('stored')
+
+            self.thumbnail(digest, content)
+        finally:
+            with self._lock:
+                self._storing.discard(digest)
+
+    def thumbnail(self, digest: str, content: bytes) -> None:
+        '''
+        Write the JPEG thumbnail of an image, skipped when Pillow is not installed or the image cannot be decoded
+        '''
+        try:
+            from PIL import Image
+        except ImportError:
+            return
+
+        path = self.thumbnail_path(digest)
+
+        try:
+            with Image.open(io.BytesIO(content)) as image:
+                image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                image.convert('RGB').save(f'{path}.tmp', 'JPEG', quality=85)
+            os.replace(f'{path}.tmp', path)
+        except Exception as e:
+            print(f'[ERROR] Failed to generate the thumbnail of {digest}...', e)
+
+    def save(self) -> None:
+        os.makedirs(self.root, exist_ok=True)
+        path = os.path.join(self.root, 'index.json')
+
+        with self._lock:
+            data = dict(self.index)
+
+        with open(f'{path}.tmp', 'w') as file:
+            json.dump(data, file)
+
+        os.replace(f'{path}.tmp', path)
+
+    def _update(self, url: str, entry: dict) -> None:
+        with self._lock:
+            self.index[url] = entry
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.stats[kind] += 1
+
+class ImageStage:
+    '''
+    Optional pipeline stage that caches the images of deduplicated products on a pool of download threads, every URL
+    is handled once per run no matter how many products share it. Submitting never blocks the pipeline, images past a
+    full queue are deferred to the next run, like the ones still queued when the stage is closed at a deadline.
+    '''
+
+    def __init__(self, cache: ImageCache | None = None, workers: int = IMAGE_WORKERS, queue_size: int = IMAGE_QUEUE_SIZE):
+        self.cache = cache or ImageCache()
+        self.stats: dict[str, int] = {'deferred': 0}
+
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._seen: set[str] = set()
+        self._closed = threading.Event()
+        self._stopped = threading.Event()
+        self._threads = [threading.Thread(target=self._run, name=f'image-{i}', daemon=True) for i in range(workers)]
+
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, products: list) -> None:
+        '''
+        Queue the images of products for caching
+
+        Args:
+            products: Product objects with an image_url
+        '''
+        for product in products:
+            url = getattr(product, 'image_url', None)
+
+            if not url or not url.startswith(('http://', 'https://')) or url in self._seen:
+                continue
+
+            self._seen.add(url)
+
+            try:
+                self._queue.put_nowait(url)
+            except queue.Full:
+                self._seen.discard(url)
+                self._count('deferred')
+
+    def close(self, deadline: float | None = None) -> None:
+        '''
+        Wait for the queued images, until deadline at most, and persist the cache index
+
+        Args:
+            deadline: Time to stop at, images still queued then are deferred to the next run
+        '''
+        self._closed.set()
+
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time()))
+
+        self._stopped.set()
+
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self._count('deferred')
+
+        self.cache.save()
+        print(f"[DEBUG] Images {', '.join(f'{kind} {count}' for kind, count in {**self.cache.stats, **self.stats}.items())}...")
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                url = self._queue.get(timeout=1)
+            except queue.Empty:
+                if self._closed.is_set():
+                    return
+                continue
+
+            self.cache.fetch(url)
+
+    def _count(self, kind: str) -> None:
+        with self._lock:
+            self.stats[kind] += 1
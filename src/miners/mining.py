@@ -0,0 +1,22 @@
+from typing import Iterator
+
+class MiningError(Exception):
+    '''
+    Raised by a store's iter_products when a work item cannot be mined, pages already yielded stay valid
+    '''
+
+def collect(pages: Iterator[list]) -> (list | None):
+    '''
+    Gather every page of a store's iter_products into one list, for callers that want the whole work item at once
+
+    Args:
+        pages: Generator returned by a store's iter_products
+
+    Returns:
+        list: Every product mined
+        None: If mining failed
+    '''
+    try:
+        return [product for page in pages for product in page]
+    except MiningError:
+        return None
@@ -1,10 +1,20 @@
-import requests
-import concurrent.futures
 from dataclasses import dataclass
 from unidecode import unidecode
 from urllib.parse import urlparse
 from hashlib import sha256
 from bs4 import BeautifulSoup
+from lxml import etree
+from typing import Iterator
+from miners import fetch
+from miners.mining import MiningError, collect
+from miners.orchestrator import run
+from miners.platforms import class_xpath, text
+
+LINK = etree.XPath(f'(.//a[{class_xpath("product-item-link")}])[1]')
+PRICE_BOX = etree.XPath(f'(.//div[{class_xpath("price-box price-final_price")}])[1]')
+SPECIAL_PRICE = etree.XPath(f'(.//span[{class_xpath("special-price")}])[1]')
+PRICE = etree.XPath(f'(.//span[{class_xpath("price")}])[1]')
+IMAGE = etree.XPath(f'((.//span[{class_xpath("main-photo")}])[1]//img)[1]')
 
 @dataclass
 class Category:
@@ -34,7 +44,7 @@ def get_categories() -> (list[Category] | None):
     print("[DEBUG] Getting categories from Nissei main page...")
 
     try:
-        request = requests.get('https://nissei.com/py/', timeout=120)
+        request = fetch.get('https://nissei.com/py/', timeout=120)
 
         if request.status_code == 200:
             print("[DEBUG] Categories retreived successfully...")
@@ -60,53 +70,51 @@ def get_categories() -> (list[Category] | None):
         return None
     
     
-def mine_products(category: Category) -> (list[Product] | None):
+def iter_products(category: Category) -> Iterator[list[Product]]:
     '''
-    Mine products from a category, operates like a thread function to not overload the website
+    Mine products from a category page by page, operates like a thread function to not overload the website
 
     Args:
         category: Category object to mine products from
 
-    Returns:
-        list[Product]: List of Product objects mined from the category
-        None: If error occurs
+    Yields:
+        list[Product]: Product objects mined from each page of the category
+
+    Raises:
+        MiningError: If error occurs
     '''
     print(f'[DEBUG] Mining products from {category.name} category...')
     try:
-        category_products: list[Product] = []
+        total = 0
 
         page_number = 1
         while True:
-            response = requests.get(f'{category.url}{page_number}', timeout=120)
+            response = fetch.stream(f'{category.url}{page_number}', timeout=120)
 
             if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'lxml')
+                products = fetch.iter_nodes(response, 'li', 'item product product-item tp-5-col col-xl-3 col-lg-4 col-md-4 col-sm-6 col-6', grid=True)
 
-                products = soup.find_all('li', class_='item product product-item tp-5-col col-xl-3 col-lg-4 col-md-4 col-sm-6 col-6')
-
-                if len(products) == 0 and len(category_products) == 0:
-                    print(f'[DEBUG] {len(products)} products found in the {category.name} category...')
-                    return category_products
-                
-                elif len(products) == 0:
-                    print(f'[DEBUG] {len(category_products)} products found in the {category.name} category...')
-                    return category_products
+                page_products: list[Product] = []
+                found = 0
 
                 for product in products:
+                    found += 1
                     try:
                         try:
-                            name = product.find('a', class_='product-item-link').text.strip()
+                            name = text(LINK(product)[0]).strip()
                         except Exception as e:
                             print(f'[ERROR] Failed to parse product name on: {category.url}{page_number}')
                             continue
                         try:
-                            if product.find('div', class_='price-box price-final_price').find('span', class_='special-price') is None:
-                                price = int(unidecode(product.find('div', class_='price-box price-final_price').find('span', class_='price').text).replace('Gs', '').replace('.', '').strip())
+                            price_box = PRICE_BOX(product)[0]
+                            special_price = SPECIAL_PRICE(price_box)
+                            if not special_price:
+                                price = int(unidecode(text(PRICE(price_box)[0])).replace('Gs', '').replace('.', '').strip())
                                 # print(price)
                                 is_discounted = False
                                 # print(is_discounted)
                             else:
-                                price = int(unidecode(product.find('div', class_='price-box price-final_price').find('span', class_='special-price').find("span", class_="price").text).replace('Gs', '').replace('.', '').strip())
+                                price = int(unidecode(text(PRICE(special_price[0])[0])).replace('Gs', '').replace('.', '').strip())
                                 # print(price)
                                 is_discounted = True
                                 # print(is_discounted)
@@ -116,20 +124,21 @@ def mine_products(category: Category) -> (list[Product] | None):
                         
                         try:
                             # check if product has data-src attribute
-                            if product.find('span', class_='main-photo').find('img').has_attr('data-src'):
-                                image_url = product.find('span', class_='main-photo').find('img')['data-src']
+                            image = IMAGE(product)[0]
+                            if 'data-src' in image.attrib:
+                                image_url = image.get('data-src')
                             else:
-                                image_url = product.find('span', class_='main-photo').find('img')['src']
+                                image_url = image.attrib['src']
                         except Exception as e:
                             print(f'[ERROR] Failed to parse product image on: {category.url}{page_number}: {name}')
                             continue
                         try:
-                            product_url = product.find('a', class_='product-item-link')['href']
+                            product_url = LINK(product)[0].attrib['href']
                         except Exception as e:
                             print(f'[ERROR] Failed to parse product url on: {category.url}{page_number}: {name}')
                             continue
 
-                        category_products.append(Product(
+                        page_products.append(Product(
                             id=sha256(product_url.encode()).hexdigest(),
                             origin='Nissei',
                             name=unidecode(name),
@@ -144,6 +153,13 @@ def mine_products(category: Category) -> (list[Product] | None):
                         print(f'[ERROR] Failed to parse product on: {category.url}{page_number}, {e}')
                         continue
 
+                if found == 0:
+                    print(f'[DEBUG] {total} products found in the {category.name} category...')
+                    return
+
+                total += len(page_products)
+                yield page_products
+
             else:
                 print(f'[ERROR] Invalid response from {category.name} category...')
                 print(response.status_code)
@@ -152,62 +168,38 @@ def mine_products(category: Category) -> (list[Product] | None):
 
     except Exception as e:
         print("[ERROR] Failed to mine products from Nissei...", e)
-        return None
-        
-
-
-def main():
-    categories: list[Category] = get_categories()
-
-    categories = sorted(categories, key=lambda x: x.slug, reverse=True)
-
-    print(categories)
-
-    if categories is not None:
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            product_tracker: dict[str, Product] = {}
-
-            redundant_tracker: dict[str, bool] = {}
-
-            futures = [executor.submit(mine_products, category) for category in categories]
-
-            for future in concurrent.futures.as_completed(futures):
-                print(f"[DEBUG] Results from search {len(future.result()) if future.result() is not None else 0} products...")
+        raise MiningError(category.name) from e
 
-                if future.result() is not None:
-                    for product in future.result():
-                        if product.id not in product_tracker and product.name not in redundant_tracker:
-                            product_tracker[product.id] = product
-                            redundant_tracker[product.name] = True
-                        else:
-                            continue
+def mine_products(category: Category) -> (list[Product] | None):
+    '''
+    Mine every product from a category at once
 
-            print(f"[DEBUG] Found a total of {len(product_tracker)} products from Nissei...")
+    Args:
+        category: Category object to mine products from
 
+    Returns:
+        list[Product]: List of Product objects mined from the category
+        None: If error occurs
+    '''
+    return collect(iter_products(category))
 
+def get_tasks() -> (list[Category] | None):
+    '''
+    Work items for the orchestrator, one per category
 
-            # upload to api, 1000 products at a time
-            for i in range(0, len(product_tracker), 1000):
-                try:
-                    print(f"[DEBUG] Sending {i} to {i+1000} products to the API...")
-                    response = requests.post('http://api:8080/products/', json=[product.__dict__ for product in list(product_tracker.values())[i:i+1000]], timeout=120)
+    Returns:
+        list[Category]: Categories to mine, sorted by slug in reverse
+        None: If error occurs
+    '''
+    categories = get_categories()
 
-                    if response.status_code == 201:
-                        print('[DEBUG] Products sent to the API...')
-                    else:
-                        print('[ERROR] Invalid status code from API...')
-                        print(response.status_code)
-                        continue
-                except Exception as e:
-                    print('[ERROR] Failed to send products to the API...', e)
-                    continue
-                    
-    else:
-        print('[ERROR] No Categories found on the Nissei front page...')
+    if categories is None:
+        return None
 
+    return sorted(categories, key=lambda x: x.slug, reverse=True)
 
-    
-    
+def main():
+    run(['nissei'])
 
 if __name__ == '__main__':
     print("[DEBUG] Running Nissei Miner...")
@@ -0,0 +1,486 @@
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from time import time
+from typing import Callable, Iterator
+
+from miners import stores
+from miners.config import SINK_URL, UPLOADERS, WORKERS
+from miners.enrich import DetailCache, DetailStage
+from miners.images import ImageCache, ImageStage
+from miners.pipeline import UploadPipeline
+from miners.mining import MiningError
+from miners.planner import plan
+from miners.recrawl import Fingerprint, RecrawlHistory, task_key
+from miners.sinks import Sink, open_sink
+from miners.sitemap import SitemapState
+from miners.spool import SpooledSink
+from miners.stores import Store
+
+class Scheduler:
+    '''
+    Runs tasks from many stores on one pool of worker threads. The pool size is the global budget, and every store has
+    its own in-flight limit so a single host never takes all the workers. A free worker goes to the store with the
+    most estimated work left per allowed worker, so the store that would finish last starts first, and stores with
+    equal backlogs, or no estimates, are served round-robin.
+    '''
+
+    def __init__(self, workers: int = WORKERS):
+        self.workers = workers
+
+        self._cond = threading.Condition()
+        self._order: list[str] = []
+        self._pending: dict[str, deque] = {}
+        self._inflight: dict[str, int] = {}
+        self._limits: dict[str, int] = {}
+        self._backlog: dict[str, float] = {}
+        self._cursor = 0
+
+    def add_store(self, name: str, limit: int) -> None:
+        '''
+        Register a store queue, tasks can only be submitted for registered stores
+
+        Args:
+            name: Store name
+            limit: Maximum number of tasks of this store running at once
+        '''
+        with self._cond:
+            if name not in self._pending:
+                self._order.append(name)
+                self._pending[name] = deque()
+                self._inflight[name] = 0
+                self._backlog[name] = 0.0
+            self._limits[name] = max(1, min(limit, self.workers))
+
+    def submit(self, name: str, fn: Callable, *args, cost: float = 0.0) -> None:
+        '''
+        Queue a task for a store, safe to call from inside a running task
+
+        Args:
+            name: Store name the task belongs to
+            fn: Function to run
+            args: Arguments for fn
+            cost: Estimated seconds the task takes
+        '''
+        with self._cond:
+            self._pending[name].append((fn, args, cost))
+            self._backlog[name] += cost
+            self._cond.notify_all()
+
+    def run(self) -> None:
+        '''
+        Run every queued task, and any task they submit, until all store queues are drained
+        '''
+        threads = [threading.Thread(target=self._worker, name=f'miner-{i}', daemon=True) for i in range(self.workers)]
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+    def _next_task(self) -> (tuple | None):
+        chosen = None
+
+        for offset in range(len(self._order)):
+            name = self._order[(self._cursor + offset) % len(self._order)]
+
+            if self._pending[name] and self._inflight[name] < self._limits[name]:
+                load = self._backlog[name] / self._limits[name]
+                if chosen is None or load > chosen[2]:
+                    chosen = (name, offset, load)
+
+        if chosen is None:
+            return None
+
+        name, offset, _ = chosen
+        self._cursor = (self._cursor + offset + 1) % len(self._order)
+        self._inflight[name] += 1
+        fn, args, cost = self._pending[name].popleft()
+        self._backlog[name] = max(0.0, self._backlog[name] - cost)
+        return name, fn, args
+
+    def _idle(self) -> bool:
+        return not any(self._pending.values()) and not any(self._inflight.values())
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                task = self._next_task()
+                while task is None:
+                    if self._idle():
+                        self._cond.notify_all()
+                        return
+                    self._cond.wait()
+                    task = self._next_task()
+
+            name, fn, args = task
+            try:
+                fn(*args)
+            except Exception as e:
+                print(f'[ERROR] Task from {name} failed...', e)
+            finally:
+                with self._cond:
+                    self._inflight[name] -= 1
+                    self._cond.notify_all()
+
+# Seconds the work items a store's discovery returned are reused by later runs of the same process
+TASKS_TTL: int = 6 * 3600
+
+# Seconds of a deadline kept for the upload pipeline to flush, at most half of the deadline
+DEADLINE_FLUSH: float = 30.0
+
+# Seconds after which a probed category is crawled in full even if its first page did not change
+PROBE_MAX_AGE: float = 24 * 3600
+
+@dataclass
+class Crawl:
+    '''
+    A category crawl already under way, its page generator and what was mined from it so far
+    '''
+    pages: Iterator
+    fingerprint: Fingerprint = field(default_factory=Fingerprint)
+    probe: Fingerprint | None = None
+    seconds: float = 0.0
+    categories: set[str] = field(default_factory=set)
+
+class Orchestrator:
+    '''
+    Multi-store runs, owns the scheduler and the upload pipeline of each run, and the state kept between runs: the
+    recrawl history of every store, the sitemap, price history and image caches, the search index, and the work items
+    discovered.
+
+    With a deadline, each store's tasks are queued most valuable first, see RecrawlHistory.rank, and mining stops
+    between pages once the deadline is near, leaving time for the pipeline to upload what was mined.
+
+    With probing, paginated categories are first mined one page each, and only the ones whose first page changed since
+    their last full crawl, or whose full crawl is older than PROBE_MAX_AGE, are crawled further.
+    '''
+
+    def __init__(self, selected: list[Store], workers: int = WORKERS, budget: int | None = None, history: bool = True, sitemaps: bool = False, images: bool = False, sink: Sink | None = None, uploaders: int = UPLOADERS, deadline: float | None = None, probe: bool = False, details: bool = False, search: bool = False):
+        self.selected = selected
+        self.workers = workers
+        self.budget = budget
+        self.deadline = deadline
+        self.probe = probe
+        self.sink = sink
+        self.uploaders = uploaders
+        self.sitemaps = SitemapState() if sitemaps else None
+        self.images = ImageCache() if images else None
+        self.details = DetailCache() if details else None
+        self.search = None
+        self.histories: dict[str, RecrawlHistory] = {store.name: RecrawlHistory(store.name) for store in selected}
+        self.tasks: dict[str, tuple[float, list]] = {}
+        self.coverage: dict[str, dict] = {}
+        self.crawled: dict[str, dict[str, set[str]]] = {}
+        self.spent: dict[str, int] = {}
+        self.cutoff: float | None = None
+
+        self._lock = threading.Lock()
+
+        self.history = None
+        if history:
+            from miners.history import PriceHistory
+            self.history = PriceHistory()
+
+        if search:
+            from miners.search import SearchIndex
+            self.search = SearchIndex()
+
+    def discover(self, store: Store) -> None:
+        '''
+        Import a store module and queue one mining task per work item it reports, after removing duplicate and
+        overlapping categories. With sitemap discovery only the categories whose pages changed since they were
+        last crawled whole are kept, and with a request budget only the ones worth refreshing. Tasks are queued longest first by the duration of their last
+        crawl, or by value with a deadline.
+
+        Args:
+            store: Store to discover
+        '''
+        module = stores.load(store)
+        tasks = self.get_tasks(store, module)
+
+        if not tasks:
+            print(f'[ERROR] No Categories found for {store.label}...')
+            return
+
+        planned = plan(store, tasks)
+        print(f'[DEBUG] Planned {len(planned)} of {len(tasks)} tasks from {store.label} after removing overlaps...')
+        tasks = planned
+
+        if self.sitemaps is not None and store.sitemap:
+            try:
+                changed = self.sitemaps.discover(store.name, store.sitemap, tasks)
+                print(f'[DEBUG] Sitemap of {store.label} changed {len(changed)} of {len(tasks)} tasks...')
+                tasks = changed
+            except Exception as e:
+                print(f'[ERROR] Failed to read the sitemap of {store.label}, crawling every category...', e)
+
+        history = self.histories[store.name]
+
+        if self.budget is not None:
+            # Until a category of the store was crawled, a new category is assumed to take one full page of products
+            # plus the empty page that ends its pagination
+            selected = history.select(tasks, self.budget, pages=store.estimate_pages(store.page_size or 1))
+            print(f'[DEBUG] Refreshing {len(selected)} of {len(tasks)} tasks from {store.label} under a budget of {self.budget} pages...')
+            tasks = selected
+
+        if self.cutoff is not None:
+            tasks = history.rank(tasks)
+
+        costs = history.estimate(tasks)
+
+        if self.cutoff is None:
+            # Longest first, so the biggest categories do not start last and leave a tail of idle workers
+            order = sorted(range(len(tasks)), key=lambda i: costs[i], reverse=True)
+            tasks, costs = [tasks[i] for i in order], [costs[i] for i in order]
+
+        with self._lock:
+            self.coverage[store.name].update(tasks=len(tasks), expected_products=history.expected_products(tasks))
+
+        print(f'[DEBUG] Queued {len(tasks)} tasks from {store.label}...')
+
+        for task, cost in zip(tasks, costs):
+            if self.probe and store.page_size is not None:
+                self.scheduler.submit(store.name, self.probe_task, store, module, task, cost=history.page_seconds())
+            else:
+                self.scheduler.submit(store.name, self.mine, store, module, task, cost=cost)
+
+    def probe_task(self, store: Store, module, task) -> None:
+        '''
+        Mine the first page of a work item and queue the rest of it only if that page changed since the last full crawl
+        or the crawl is stale. The queued crawl resumes the same page generator, so the first page is not fetched twice,
+        and runs after the probes already queued.
+
+        Args:
+            store: Store the task belongs to
+            module: The store's main module
+            task: Work item returned by the store's get_tasks
+        '''
+        if self.expired() or not self.spend(store):
+            self.count(store, 'skipped')
+            return
+
+        started = time()
+        crawl = Crawl(module.iter_products(task), probe=Fingerprint())
+
+        try:
+            first = next(crawl.pages, [])
+        except MiningError as e:
+            print(f'[ERROR] Failed to probe {e} from {store.label}...')
+            self.count(store, 'failed')
+            return
+
+        crawl.probe.update(first)
+        crawl.categories.update(product.category_name for product in first)
+        self.count(store, 'pages', products=len(first))
+
+        if self.histories[store.name].unchanged(task_key(task), crawl.probe, PROBE_MAX_AGE):
+            crawl.pages.close()
+            self.count(store, 'unchanged')
+            return
+
+        crawl.fingerprint.update(first)
+        crawl.seconds = time() - started
+        self.pipeline.submit(store, first)
+        history = self.histories[store.name]
+        self.scheduler.submit(store.name, self.mine, store, module, task, crawl, cost=max(0.0, history.estimate([task])[0] - crawl.seconds))
+
+    def get_tasks(self, store: Store, module) -> (list | None):
+        '''
+        Work items of a store, reused from an earlier run of this orchestrator for up to TASKS_TTL seconds
+        '''
+        cached = self.tasks.get(store.name)
+
+        if cached is not None and time() - cached[0] < TASKS_TTL:
+            return cached[1]
+
+        tasks = module.get_tasks()
+
+        if tasks:
+            self.tasks[store.name] = (time(), tasks)
+
+        return tasks
+
+    def mine(self, store: Store, module, task, crawl: Crawl | None = None) -> None:
+        '''
+        Mine a single work item page by page, every page goes to the upload pipeline as soon as it is parsed, so a
+        worker only holds one page of products and blocks while the pipeline is behind. The item is recorded in the
+        recrawl history once it is mined whole. Every page requested is taken from the store's budget, and mining stops
+        before a page once it is spent.
+
+        Args:
+            store: Store the task belongs to
+            module: The store's main module
+            task: Work item returned by the store's get_tasks
+            crawl: Crawl started by a probe, to resume instead of starting from the first page
+        '''
+        if self.expired():
+            if crawl is not None:
+                crawl.pages.close()
+                self.count(store, 'partial')
+                self.record(store, crawl, 'incomplete')
+            else:
+                self.count(store, 'skipped')
+            return
+
+        crawl = crawl or Crawl(module.iter_products(task))
+        fingerprint = crawl.fingerprint
+        started = time()
+
+        try:
+            while True:
+                # Stores without pagination request a single page per task
+                if (store.page_size is not None or crawl.probe is None) and not self.spend(store):
+                    crawl.pages.close()
+                    print(f'[DEBUG] Budget spent, stopped mining {task_key(task)} from {store.label} after {fingerprint.count} products...')
+                    self.count(store, 'partial' if crawl.probe is not None else 'skipped')
+                    self.record(store, crawl, 'incomplete')
+                    return
+
+                products = next(crawl.pages, None)
+
+                if products is None:
+                    break
+
+                if crawl.probe is None:
+                    crawl.probe = Fingerprint()
+                    crawl.probe.update(products)
+
+                fingerprint.update(products)
+                crawl.categories.update(product.category_name for product in products)
+                self.pipeline.submit(store, products)
+                self.count(store, 'pages', products=len(products))
+
+                if self.expired():
+                    crawl.pages.close()
+                    print(f'[DEBUG] Deadline reached, stopped mining {task_key(task)} from {store.label} after {fingerprint.count} products...')
+                    self.count(store, 'partial')
+                    self.record(store, crawl, 'incomplete')
+                    return
+        except MiningError as e:
+            print(f'[ERROR] Failed to mine {e} from {store.label} after {fingerprint.count} products...')
+            self.count(store, 'failed')
+            self.record(store, crawl, 'incomplete')
+            return
+
+        print(f'[DEBUG] Results from search {fingerprint.count} products...')
+
+        self.count(store, 'complete')
+        self.record(store, crawl, 'crawled')
+
+        if self.sitemaps is not None and store.sitemap:
+            self.sitemaps.crawled(store.name, task)
+        self.histories[store.name].observe(task_key(task), fingerprint, store.estimate_pages(fingerprint.count), seconds=crawl.seconds + time() - started, probe=crawl.probe or Fingerprint())
+
+    def expired(self) -> bool:
+        return self.cutoff is not None and time() >= self.cutoff
+
+    def count(self, store: Store, kind: str, products: int = 0) -> None:
+        with self._lock:
+            coverage = self.coverage[store.name]
+            coverage[kind] += 1
+            coverage['products'] += products
+
+    def spend(self, store: Store) -> bool:
+        '''
+        Take a page from the store's request budget before requesting it
+
+        Returns:
+            bool: False if the budget is already spent
+        '''
+        with self._lock:
+            if self.budget is not None and self.spent[store.name] >= self.budget:
+                return False
+            self.spent[store.name] += 1
+            return True
+
+    def record(self, store: Store, crawl: Crawl, kind: str) -> None:
+        '''
+        Remember the categories of a crawl, crawled when it was mined whole and incomplete otherwise, see
+        PriceHistory.record_run
+        '''
+        with self._lock:
+            self.crawled[store.name][kind].update(crawl.categories)
+
+    def report(self) -> None:
+        '''
+        Print how much of each store the run covered
+        '''
+        for store in self.selected:
+            coverage = self.coverage[store.name]
+            expected = f" of {coverage['expected_products']} last seen" if coverage['expected_products'] else ''
+            unchanged = f", {coverage['unchanged']} unchanged on probe" if self.probe else ''
+            budget = f" ({self.spent[store.name]} of {self.budget} budgeted requests)" if self.budget is not None else ''
+            print(f"[DEBUG] Coverage of {store.label}: {coverage['complete']} of {coverage['tasks']} tasks complete{unchanged}, {coverage['partial']} partial, "
+                  f"{coverage['skipped']} skipped, {coverage['failed']} failed, {coverage['products']} products{expected} in {coverage['pages']} pages{budget}...")
+
+    def run(self) -> None:
+        '''
+        Run one crawl of every selected store, can be called again for the next run
+        '''
+        self.scheduler = Scheduler(self.workers)
+        self.cutoff = time() + self.deadline - min(DEADLINE_FLUSH, self.deadline / 2) if self.deadline is not None else None
+        self.coverage = {store.name: dict.fromkeys(('tasks', 'complete', 'unchanged', 'partial', 'skipped', 'failed', 'pages', 'products', 'expected_products'), 0) for store in self.selected}
+        self.crawled = {store.name: {'crawled': set(), 'incomplete': set()} for store in self.selected}
+        self.spent = dict.fromkeys((store.name for store in self.selected), 0)
+        self.pipeline = UploadPipeline(self.sink, self.uploaders, history=self.history, images=ImageStage(self.images) if self.images is not None else None, details=DetailStage(self.details) if self.details is not None else None, search=self.search)
+
+        for store in self.selected:
+            self.scheduler.add_store(store.name, store.max_workers)
+            self.scheduler.submit(store.name, self.discover, store)
+
+        print(f"[DEBUG] Mining {', '.join(store.label for store in self.selected)} with {self.scheduler.workers} workers...")
+
+        self.scheduler.run()
+        self.pipeline.close(self.cutoff)
+
+        if self.history is not None:
+            for store, categories in self.crawled.items():
+                try:
+                    self.history.record_run(store, self.pipeline.started, categories['crawled'], categories['incomplete'])
+                except Exception as e:
+                    print(f'[ERROR] Failed to record the categories crawled from {store}...', e)
+
+        if self.cutoff is not None or self.probe or self.budget is not None:
+            self.report()
+
+        for history in self.histories.values():
+            history.save()
+
+        if self.sitemaps is not None:
+            self.sitemaps.save()
+
+def run(names: list[str] | None = None, workers: int = WORKERS, wait: bool = True, budget: int | None = None, history: bool = True, sitemaps: bool = False, images: bool = False, sink: str = SINK_URL, spool: bool = True, uploaders: int = UPLOADERS, deadline: float | None = None, probe: bool = False, details: bool = False, search: bool = False) -> None:
+    '''
+    Mine several stores in one process under a shared worker budget and a shared upload pipeline
+
+    Args:
+        names: Store names to mine, all stores if None
+        workers: Global number of worker threads
+        wait: Wait for the sink to answer before mining
+        budget: Pages each store may request this cycle, categories are picked by estimated change rate, no limit if None
+        history: Append the mined prices to the local price history
+        sitemaps: Only crawl the categories whose pages changed in the store sitemap since the last run
+        images: Cache the product images and their thumbnails locally
+        sink: Where to write the products, see sinks.open_sink
+        spool: Spool every batch to disk first and retry the failed ones instead of dropping them
+        uploaders: Upload batches in flight at once
+        deadline: Seconds the run may take, mining the most valuable pages first and stopping in time to upload them
+        probe: Mine the first page of every category first and the rest only for categories it shows changed or stale
+        details: Fetch and cache the detail pages of new and changed products
+        search: Add the uploaded products to the local search index
+    '''
+    selected = stores.get_stores(names)
+    destination = open_sink(sink)
+
+    if spool:
+        destination = SpooledSink(destination)
+
+    if wait:
+        destination.wait()
+
+    try:
+        Orchestrator(selected, workers, budget, history, sitemaps, images, destination, uploaders, deadline, probe, details, search).run()
+    finally:
+        destination.close()
@@ -0,0 +1,324 @@
+import json
+import queue
+import threading
+from time import perf_counter, time
+from typing import TYPE_CHECKING, Callable
+
+from miners.config import UPLOADERS
+from miners.enrich import DetailStage
+from miners.images import ImageStage
+from miners.sinks import HttpSink, Sink
+from miners.stores import Store
+from miners.validation import Quarantine, validate
+
+if TYPE_CHECKING:
+    from miners.history import PriceHistory
+    from miners.search import SearchIndex
+
+# Rows buffered per store before they are written as a price history segment
+HISTORY_SEGMENT_SIZE: int = 20_000
+
+# Encoded size an upload batch starts at, grown while uploads are fast and shrunk when they are slow or fail. The
+# maximum stays under the 4 MB default body limit of the Fiber API.
+BATCH_BYTES: int = 512 * 1024
+MIN_BATCH_BYTES: int = 32 * 1024
+MAX_BATCH_BYTES: int = 3 * 1024 * 1024
+
+# Upload latency, in seconds, batch sizes are steered towards
+BATCH_LATENCY: float = 2.0
+
+class BatchSizer:
+    '''
+    Picks the number of products per upload batch from their encoded size and the latency of previous uploads.
+    Batches grow additively while uploads finish well under the target latency, and shrink multiplicatively when they
+    are slow or fail, so the batch settles where the sink is fastest without timing out.
+    '''
+
+    def __init__(self, target_bytes: int = BATCH_BYTES, latency: float = BATCH_LATENCY, sample_every: int = 64):
+        self.target_bytes = target_bytes
+        self.latency = latency
+        self.sample_every = sample_every
+        self.product_bytes = 500.0
+
+        self._lock = threading.Lock()
+        self._seen = 0
+
+    def sample(self, product) -> None:
+        '''
+        Keep a moving average of the encoded product size, only every sample_every-th product is encoded
+        '''
+        self._seen += 1
+
+        if self._seen % self.sample_every == 1:
+            size = len(json.dumps(product.__dict__, ensure_ascii=False).encode())
+            with self._lock:
+                self.product_bytes = 0.9 * self.product_bytes + 0.1 * size
+
+    def size(self) -> int:
+        with self._lock:
+            return max(1, int(self.target_bytes / self.product_bytes))
+
+    def record(self, seconds: float, stored: bool) -> None:
+        '''
+        Adjust the batch size after an upload
+
+        Args:
+            seconds: Time the upload took
+            stored: Whether the sink stored the batch
+        '''
+        with self._lock:
+            if not stored or seconds > self.latency:
+                self.target_bytes = max(MIN_BATCH_BYTES, int(self.target_bytes * 0.5))
+            elif seconds < self.latency / 2:
+                self.target_bytes = min(MAX_BATCH_BYTES, self.target_bytes + BATCH_BYTES // 4)
+
+class Handoff:
+    '''
+    Marker queued behind the products of a store, see UploadPipeline.handoff
+    '''
+
+    def __init__(self, store: str):
+        self.store = store
+        self.batch: int | None = None
+        self.queued = threading.Event()
+
+class UploadPipeline:
+    '''
+    Shared upload stage for every store in a run, products are written to the sink, the API by default, while the crawl
+    is still going. One background thread validates, deduplicates and batches, and several upload threads keep batches
+    in flight at once, sized by BatchSizer.
+
+    Products the API would reject go to the quarantine. The deduplicated ones are also handed to the optional stages:
+    price history, images, details and search index. A failing stage is logged and skipped, the upload goes on.
+    Products whose detail pages are fetched after their upload are uploaded again with the details, sinks upsert them.
+    '''
+
+    def __init__(self, sink: Sink | None = None, uploaders: int = UPLOADERS, history: 'PriceHistory | None' = None, images: ImageStage | None = None, details: DetailStage | None = None, quarantine: Quarantine | None = None, search: 'SearchIndex | None' = None):
+        self.sink = sink or HttpSink()
+        self._owns_sink = sink is None
+        self.sizer = BatchSizer()
+        self.history = history
+        self.images = images
+        self.details = details
+        self.quarantine = quarantine or Quarantine()
+        self.search = search
+        self.totals: dict[str, int] = {}
+        self.started = time()
+
+        self._queue: queue.Queue = queue.Queue(maxsize=64)
+        self._seen_ids: dict[str, set[str]] = {}
+        self._seen_names: dict[str, set[str]] = {}
+        self._buffers: dict[str, list] = {}
+        self._history_buffer: dict[str, list] = {}
+        self._batches = 0
+        self._in_flight: set[int] = set()
+        self._written = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='upload-pipeline', daemon=True)
+        self._thread.start()
+
+        uploaders = uploaders if self.sink.concurrent else 1
+        self._uploads: queue.Queue = queue.Queue(maxsize=uploaders * 2)
+        self._uploaders = [threading.Thread(target=self._upload, name=f'uploader-{i}', daemon=True) for i in range(uploaders)]
+
+        for thread in self._uploaders:
+            thread.start()
+
+    def submit(self, store: Store, products: list) -> None:
+        '''
+        Queue mined products for deduplication and upload, blocks while the queue is full
+
+        Args:
+            store: Store the products were mined from
+            products: A page of Product objects yielded by the store's iter_products
+        '''
+        self._queue.put((store, products))
+
+    def handoff(self, store: Store) -> None:
+        '''
+        Wait until every product of a store submitted so far was handed to the sink, for workers that must not report
+        a task done before its products are safe. The store's buffered products are sent at once instead of waiting
+        for a full batch.
+
+        Args:
+            store: Store the products were submitted for
+        '''
+        marker = Handoff(store.name)
+        self._queue.put(marker)
+        marker.queued.wait()
+
+        with self._written:
+            self._written.wait_for(lambda: not any(batch <= marker.batch for batch in self._in_flight))
+
+    def begin(self, started: float) -> None:
+        '''
+        Start a new run in the same pipeline, for workers that mine crawl after crawl: what is buffered is flushed under
+        the current run, products are deduplicated afresh, and the price history records the next ones at started
+
+        Args:
+            started: Time of the new run, the crawl id in a distributed crawl
+        '''
+        self._queue.put(float(started))
+
+    def close(self, deadline: float | None = None) -> None:
+        '''
+        Flush the remaining products and wait for the upload threads to finish
+
+        Args:
+            deadline: Time the detail and image stages stop fetching at, see DetailStage.close and ImageStage.close
+        '''
+        self._queue.put(None)
+        self._thread.join()
+
+        if self.details is not None:
+            self.details.close(deadline)
+            self._enrich()
+            self._flush()
+
+        for _ in self._uploaders:
+            self._uploads.put(None)
+
+        for thread in self._uploaders:
+            thread.join()
+
+        if self._owns_sink:
+            self.sink.close()
+
+        if self.images is not None:
+            self.images.close(deadline)
+
+        if self.search is not None:
+            self.search.save()
+            print(f'[DEBUG] Search index holds {len(self.search)} products...')
+
+        for store, total in self.totals.items():
+            print(f'[DEBUG] Found a total of {total} products from {store}...')
+
+        self.quarantine.report()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+
+            if item is None:
+                self._flush()
+                return
+
+            if isinstance(item, Handoff):
+                buffer = self._buffers.pop(item.store, [])
+                if buffer:
+                    self._send(item.store, buffer)
+                item.batch = self._batches
+                item.queued.set()
+                continue
+
+            if isinstance(item, float):
+                self._flush()
+                self._seen_ids, self._seen_names = {}, {}
+                self.started = item
+                continue
+
+            store, products = item
+
+            try:
+                self._process(store, products)
+            except Exception as e:
+                print(f'[ERROR] Failed to process a page of products from {store.label}...', e)
+
+    def _process(self, store: Store, products: list) -> None:
+        seen_ids = self._seen_ids.setdefault(store.name, set())
+        seen_names = self._seen_names.setdefault(store.name, set())
+        buffer = self._buffers.setdefault(store.name, [])
+        history_buffer = self._history_buffer.setdefault(store.name, [])
+        new = []
+
+        for product in products:
+            error = validate(product)
+            if error is not None:
+                self.quarantine.put(store.name, product, error)
+                continue
+
+            if product.id in seen_ids or (store.dedup_by_name and product.name in seen_names):
+                continue
+
+            seen_ids.add(product.id)
+            seen_names.add(product.name)
+            self.totals[store.label] = self.totals.get(store.label, 0) + 1
+            buffer.append(product)
+            history_buffer.append(product)
+            new.append(product)
+            self.sizer.sample(product)
+
+        if self.images is not None:
+            self._stage('image', store, self.images.submit, new)
+
+        if self.details is not None:
+            self._stage('detail', store, self.details.submit, store, new)
+            self._enrich()
+
+        if self.search is not None:
+            self._stage('search', store, self.search.add, new)
+
+        if self.history is not None and len(history_buffer) >= HISTORY_SEGMENT_SIZE:
+            self._record(store.name)
+
+        size = self.sizer.size()
+        while len(self._buffers[store.name]) >= size:
+            self._send(store.name, self._buffers[store.name][:size])
+            self._buffers[store.name] = self._buffers[store.name][size:]
+
+    def _enrich(self) -> None:
+        for store, product in self.details.drain():
+            self._buffers.setdefault(store.name, []).append(product)
+
+    def _stage(self, name: str, store: Store, submit: Callable, *args) -> None:
+        try:
+            submit(*args)
+        except Exception as e:
+            print(f'[ERROR] The {name} stage failed on products from {store.label}...', e)
+
+    def _flush(self) -> None:
+        for store, buffer in self._buffers.items():
+            if buffer:
+                self._send(store, buffer)
+        self._buffers = {}
+
+        if self.history is not None:
+            for store in self._history_buffer:
+                self._record(store)
+
+    def _record(self, store: str) -> None:
+        try:
+            self.history.append(store, self._history_buffer[store], self.started)
+        except Exception as e:
+            print(f'[ERROR] Failed to record the price history of {store}...', e)
+        self._history_buffer[store] = []
+
+    def _send(self, store: str, batch: list) -> None:
+        self._batches += 1
+
+        with self._written:
+            self._in_flight.add(self._batches)
+
+        self._uploads.put((store, batch, self._batches))
+
+    def _upload(self) -> None:
+        while True:
+            item = self._uploads.get()
+
+            if item is None:
+                return
+
+            store, batch, number = item
+            started = perf_counter()
+
+            try:
+                stored = self.sink.write(store, batch)
+            except Exception as e:
+                print(f'[ERROR] Failed to upload {len(batch)} products from {store}...', e)
+                stored = False
+            finally:
+                with self._written:
+                    self._in_flight.discard(number)
+                    self._written.notify_all()
+
+            self.sizer.record(perf_counter() - started, stored)
@@ -0,0 +1,100 @@
+from dataclasses import replace
+from urllib.parse import urlsplit, urlunsplit
+
+from miners.fetch import canonicalize
+from miners.stores import Store
+
+def base_url(url: str) -> str:
+    '''
+    Canonical URL of a category without its query and trailing slash, the pagination parameter included
+    '''
+    parts = urlsplit(canonicalize(url))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path.rstrip('/'), '', ''))
+
+def task_url(task) -> (str | None):
+    '''
+    Base URL of a store work item, None for items without a single URL
+    '''
+    if isinstance(task, str):
+        return base_url(task)
+    url = getattr(task, 'url', None)
+    return base_url(url) if isinstance(url, str) else None
+
+def canonical_task(task):
+    '''
+    Rewrite the page URLs of a work item in canonical form, see fetch.canonicalize
+    '''
+    if isinstance(task, str):
+        return canonicalize(task)
+    if isinstance(getattr(task, 'url', None), str):
+        return replace(task, url=canonicalize(task.url))
+    if isinstance(getattr(task, 'urls', None), list):
+        return replace(task, urls=[canonicalize(url) for url in task.urls])
+    return task
+
+def is_under(path: str, parent: str) -> bool:
+    return path.startswith(f'{parent}/')
+
+def drop_overlaps(tasks: list, keep: str) -> list:
+    '''
+    Build the category tree from the URL paths and drop the categories whose products another crawled category
+    already lists
+
+    Args:
+        tasks: Work items with a single URL each
+        keep: 'parent' drops subcategories of a crawled category, 'children' drops categories that have a crawled
+            subcategory
+
+    Returns:
+        list: The remaining tasks, in their original order
+    '''
+    urls = {id(task): task_url(task) for task in tasks}
+    ordered = sorted((url for url in urls.values() if url), key=len)
+    dropped: set[str] = set()
+
+    for i, url in enumerate(ordered):
+        for other in ordered[i + 1:]:
+            if is_under(other, url):
+                dropped.add(other if keep == 'parent' else url)
+
+    return [task for task in tasks if urls[id(task)] not in dropped]
+
+def plan(store: Store, tasks: list) -> list:
+    '''
+    Turn the categories found by a store's discovery into a crawl plan without duplicate downloads: URLs are
+    canonicalized, categories listed more than once in the menu are kept once, overlapping parent and child
+    categories are collapsed following store.overlap, and page URLs shared by several multi-URL categories (Tupi)
+    are only kept in the first one.
+
+    Args:
+        store: Store the tasks belong to
+        tasks: Work items returned by the store's get_tasks
+
+    Returns:
+        list: The planned tasks
+    '''
+    planned = []
+    seen: set[str] = set()
+
+    for task in map(canonical_task, tasks):
+        urls = getattr(task, 'urls', None)
+
+        if isinstance(urls, list):
+            unique = [url for url in dict.fromkeys(urls) if url not in seen]
+            seen.update(unique)
+            if unique:
+                planned.append(replace(task, urls=unique))
+            continue
+
+        key = task if isinstance(task, str) else getattr(task, 'url', None)
+
+        if key is None:
+            planned.append(task)
+        elif key not in seen:
+            seen.add(key)
+            planned.append(task)
+
+    if store.overlap is not None:
+        planned = drop_overlaps(planned, store.overlap)
+
+    return planned
@@ -0,0 +1,87 @@
+import random
+from dataclasses import dataclass
+from time import sleep
+from typing import Callable, Iterator
+
+import requests
+from lxml import etree
+
+from miners import fetch
+
+@dataclass
+class Category:
+    name: str
+    slug: str
+    url: str
+
+@dataclass
+class Product:
+    id: str
+    origin: str
+    name: str
+    price: int
+    is_discounted: bool
+    image_url: str
+    product_url: str
+    category_name: str
+
+# Text of an element and its descendants, like BeautifulSoup's .text
+text = etree.XPath('string()', smart_strings=False)
+
+def class_xpath(class_: str) -> str:
+    '''
+    XPath predicate matching elements by class like BeautifulSoup's class_ and fetch.has_class: a single class matches
+    any of the element's classes, several space separated classes must match the class attribute exactly
+    '''
+    if ' ' in class_:
+        return f'normalize-space(@class) = "{class_}"'
+    return f'contains(concat(" ", normalize-space(@class), " "), " {class_} ")'
+
+class Platform:
+    '''
+    Mining engine shared by the stores running the same storefront platform, configured per store. Pages of a
+    category are streamed and parsed in the worker mining it, and parsing works on the lxml elements of the product
+    grid with compiled XPath, without building a BeautifulSoup tree per product.
+    '''
+
+    def __init__(self, label: str, origin: str, delay: int = 0):
+        self.label = label
+        self.origin = origin
+        self.delay = delay
+
+    def pause(self) -> None:
+        '''
+        Random politeness delay before a category is mined, up to delay seconds
+        '''
+        if self.delay:
+            sleep(random.randint(0, self.delay))
+
+    def pages(self, url: Callable[[int], str], parse: Callable[[requests.Response, int], tuple[int, list]]) -> Iterator[tuple[int, list]]:
+        '''
+        Products of a category's pages in order, from page 1 until a page without products or until the consumer
+        stops. Every page is streamed into parse while it downloads, in the consumer's thread. A page is only requested
+        once the consumer asks for it, so a consumer that stops after a page, like a probe or a crawl out of budget,
+        never requests the next one.
+
+        Args:
+            url: URL of a page number
+            parse: Reads a streamed page of a page number, returns the product elements found and the products
+
+        Yields:
+            tuple: The page number and its products
+        '''
+        number = 1
+
+        while True:
+            response = fetch.stream(url(number))
+
+            try:
+                found, products = parse(response, number)
+            finally:
+                response.close()
+
+            if found == 0:
+                return
+
+            yield number, products
+            number += 1
@@ -0,0 +1,147 @@
+from hashlib import sha256
+from typing import Iterator
+from urllib.parse import urlparse
+
+from bs4 import BeautifulSoup
+from lxml import etree
+from unidecode import unidecode
+
+from miners import fetch
+from miners.mining import MiningError
+from miners.platforms import Category, Platform, Product, class_xpath, text
+
+TITLE = etree.XPath(f'(.//a[{class_xpath("product-title-link")}])[1]')
+PRICES = etree.XPath(f'(.//div[{class_xpath("prices")}])[1]//span[{class_xpath("price-label")}]')
+IMAGE = etree.XPath(f'(.//a[{class_xpath("picture-link")}])[1]//img[1]/@src', smart_strings=False)
+
+class AspNetStore(Platform):
+    '''
+    ASP.NET default.aspx storefronts (Superseis, Stock): categories are the links of the catnav menu, and category
+    pages are paged with ?pageindex=N until a page without products
+    '''
+
+    def __init__(self, label: str, origin: str, home: str, delay: int = 0):
+        super().__init__(label, origin, delay)
+        self.home = home
+
+    def get_categories(self) -> (list[Category] | None):
+        '''
+        Retreive all categories from the main page menu
+
+        Returns:
+            list[Category]: List of Category objects
+            None: If error occurs
+        '''
+        print(f'[DEBUG] Getting categories from {self.label} main page...')
+
+        try:
+            response = fetch.get(self.home)
+
+            if response.status_code != 200:
+                print(f'[ERROR] Invalid response from {self.label} main page...')
+                print(response.status_code)
+                return None
+
+            print('[DEBUG] Categories retreived successfully...')
+            soup = BeautifulSoup(response.text, 'lxml')
+
+            categories_list: list[Category] = []
+
+            for category in soup.find_all('ul', class_='catnav wstabitem clearfix')[0].find_all('a'):
+                if category.has_attr('href'):
+                    categories_list.append(Category(
+                        name=category.text.strip(),
+                        slug=urlparse(category['href']).path,
+                        url=f"{category['href']}?pageindex="
+                    ))
+
+            return categories_list
+
+        except Exception as e:
+            print(f'[ERROR] Failed to retreive categories from {self.label}...', e)
+            return None
+
+    def parse_product(self, product, category: Category) -> Product:
+        title = TITLE(product)[0]
+        prices = PRICES(product)
+        product_url = title.get('href')
+
+        return Product(
+            id=sha256(product_url.encode()).hexdigest(),
+            origin=self.origin,
+            name=unidecode(text(title).strip()),
+            price=int(text(prices[0]).replace('.', '').strip()),
+            is_discounted=len(prices) > 1,
+            image_url=IMAGE(product)[0],
+            product_url=product_url,
+            category_name=category.name
+        )
+
+    def parse_page(self, response, category: Category, page_number: int) -> (tuple[int, list[Product]]):
+        '''
+        Parse a streamed category page
+
+        Returns:
+            tuple: Product elements found and the products parsed from them
+
+        Raises:
+            MiningError: If the page did not load
+        '''
+        if response.status_code != 200:
+            print(f'[ERROR] Invalid response from {category.name} category...')
+            print(response.status_code)
+            raise MiningError(category.name)
+
+        page_products: list[Product] = []
+        found = 0
+
+        for product in fetch.iter_nodes(response, 'div', 'col-lg-2 col-md-3 col-sm-4 col-xs-6 producto'):
+            found += 1
+            try:
+                page_products.append(self.parse_product(product, category))
+            except Exception as e:
+                print(f'[ERROR] Failed to parse product on: {category.url}{page_number}, {e}')
+
+        return found, page_products
+
+    def iter_products(self, category: Category) -> Iterator[list[Product]]:
+        '''
+        Mine products from a category page by page
+
+        Args:
+            category: Category object to mine products from
+
+        Yields:
+            list[Product]: Product objects mined from each page of the category
+
+        Raises:
+            MiningError: If error occurs
+        '''
+        print(f'[DEBUG] Mining products from {category.name} category...')
+        self.pause()
+
+        try:
+            total = 0
+
+            for page_number, page_products in self.pages(lambda number: f'{category.url}{number}', lambda response, number: self.parse_page(response, category, number)):
+                total += len(page_products)
+                yield page_products
+
+            print(f'[DEBUG] {total} products found in the {category.name} category...')
+
+        except MiningError:
+            raise
+
+        except Exception as e:
+            print(f'[ERROR] Failed to mine products from {self.label}...', e)
+            raise MiningError(category.name) from e
+
+    def get_tasks(self) -> (list[Category] | None):
+        '''
+        Work items for the orchestrator, one per category
+
+        Returns:
+            list[Category]: Categories to mine
+            None: If error occurs
+        '''
+        return self.get_categories()
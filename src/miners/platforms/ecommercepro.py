@@ -0,0 +1,154 @@
+from hashlib import sha256
+from typing import Iterator
+from urllib.parse import urljoin, urlparse
+
+from bs4 import BeautifulSoup
+from lxml import etree
+from unidecode import unidecode
+
+from miners import fetch
+from miners.mining import MiningError
+from miners.platforms import Category, Platform, Product, class_xpath, text
+
+NAME = etree.XPath('(.//h2)[1]')
+AMOUNTS = etree.XPath(f'.//span[{class_xpath("amount")}]')
+IMAGE = etree.XPath('(.//img)[1]/@data-src', smart_strings=False)
+LINK = etree.XPath(f'(.//a[{class_xpath("ecommercepro-LoopProduct-link")}])[1]/@href', smart_strings=False)
+ON_SALE = etree.XPath(f'boolean(.//span[{class_xpath("onsale")}])')
+
+# Menu entries of the departments menu that are categories
+MENU_CLASSES = ['yamm-tfw_ yamm-hw menu-item menu-item-has-children animate-dropdown dropdown-submenu', 'menu-item animate-dropdown']
+
+class EcommerceProStore(Platform):
+    '''
+    EcommercePro storefronts (Arete, Casarica): categories are the entries of the #menu-departments-menu, category
+    pages are paged with .N suffixes until a page without div.product elements, and prices are the span.amount
+    elements of a product, the lowest being the current one
+    '''
+
+    def __init__(self, label: str, origin: str, base: str, delay: int = 5):
+        super().__init__(label, origin, delay)
+        self.base = base
+
+    def get_categories(self) -> (list[Category] | None):
+        '''
+        Retreive all categories from the departments menu of the main page
+
+        Returns:
+            list[Category]: List of Category objects
+            None: If error occurs
+        '''
+        try:
+            response = fetch.get(self.base)
+
+            if response.status_code != 200:
+                print(f'[ERROR] Invalid response from {self.label} main page...')
+                print(response.status_code)
+                return None
+
+            print(f'[DEBUG] Retreived categories from {self.label} main page successfully...')
+            soup = BeautifulSoup(response.text, 'lxml')
+            categories_list: list[Category] = []
+
+            for menu in soup.find_all('ul', id='menu-departments-menu'):
+                for li in menu.find_all('li', class_=MENU_CLASSES):
+                    a = li.find('a')
+                    # Title and href are the name and slug of the category
+                    slug: str = a['href'] if self.base not in a['href'] else urlparse(a['href']).path
+                    slug = slug[1:] if slug.startswith('/') else slug
+                    categories_list.append(Category(
+                        name=a['title'].capitalize(),
+                        slug=slug,
+                        url=f'{self.base}{slug}'))
+
+            return categories_list
+
+        except Exception as e:
+            print(f'[ERROR] Failed to retreive categories from {self.label} main page...')
+            print(e)
+            return None
+
+    def parse_product(self, product, category: Category) -> Product:
+        prices = [text(amount).replace('₲', '').replace('.', '').strip() for amount in AMOUNTS(product)]
+        product_url = self.base + LINK(product)[0]
+
+        return Product(
+            id=sha256(product_url.encode()).hexdigest(),
+            origin=self.origin,
+            name=unidecode(text(NAME(product)[0])).capitalize(),
+            price=min(int(price) for price in prices if price.isnumeric()),
+            is_discounted=ON_SALE(product),
+            image_url=urljoin(self.base, IMAGE(product)[0]),
+            product_url=product_url,
+            category_name=category.name
+        )
+
+    def parse_page(self, response, category: Category, page_number: int) -> (tuple[int, list[Product]]):
+        '''
+        Parse a streamed category page
+
+        Returns:
+            tuple: Product elements found and the products parsed from them
+
+        Raises:
+            MiningError: If the page did not load
+        '''
+        if response.status_code != 200:
+            print(f'[ERROR] Invalid response from {category.url}...')
+            print(response.status_code)
+            raise MiningError(category.name)
+
+        page_products: list[Product] = []
+        found = 0
+
+        for product in fetch.iter_nodes(response, 'div', 'product'):
+            found += 1
+            try:
+                page_products.append(self.parse_product(product, category))
+            except Exception as e:
+                print(f'[ERROR] Failed to parse product on: {category.url}.{page_number}, {e}')
+
+        return found, page_products
+
+    def iter_products(self, category: Category) -> Iterator[list[Product]]:
+        '''
+        Mine products from a category page by page
+
+        Args:
+            category: Category object to mine products from
+
+        Yields:
+            list[Product]: Product objects mined from each page of the category
+
+        Raises:
+            MiningError: If error occurs
+        '''
+        print(f'[DEBUG] Mining products from {category.name} category...')
+        self.pause()
+
+        try:
+            total = 0
+
+            for page_number, page_products in self.pages(lambda number: f'{category.url}.{number}', lambda response, number: self.parse_page(response, category, number)):
+                total += len(page_products)
+                yield page_products
+
+            print(f'[DEBUG] {total} products found in the {category.name} category...')
+
+        except MiningError:
+            raise
+
+        except Exception as e:
+            print(f'[ERROR] Failed to retreive products from {self.label}...')
+            print(e)
+            raise MiningError(category.name) from e
+
+    def get_tasks(self) -> (list[Category] | None):
+        '''
+        Work items for the orchestrator, one per category
+
+        Returns:
+            list[Category]: Categories to mine
+            None: If error occurs
+        '''
+        return self.get_categories()
@@ -0,0 +1,282 @@
+import json
+import math
+import os
+import threading
+from dataclasses import asdict, dataclass
+from hashlib import sha256
+from time import time
+
+from miners.config import DATA_DIR
+
+# Lowest change rate (changes per second) assumed for a category, so categories that never changed are still revisited
+MIN_RATE: float = 1 / (30 * 24 * 3600)
+
+# Seconds a page is assumed to take in a store with no timed crawl yet
+PAGE_SECONDS: float = 2.0
+
+@dataclass
+class CategoryStats:
+    fingerprint: str = ''
+    last_crawled: float = 0.0
+    visits: int = 0
+    changes: int = 0
+    interval_total: float = 0.0
+    products: int = 0
+    pages: int = 1
+    seconds: float = 0.0
+    probe: str = ''
+
+    def rate(self) -> float:
+        '''
+        Estimate the change rate of the category from its visit history, assuming changes arrive as a Poisson process.
+        Only whether the category changed between two visits is known, not how many times, so the biased ratio of
+        changes over time is replaced by the estimator -log((n - X + 0.5) / (n + 0.5)) / mean interval.
+
+        Returns:
+            float: Estimated changes per second
+        '''
+        if self.visits == 0 or self.interval_total <= 0:
+            return MIN_RATE
+
+        n = self.visits
+        x = self.changes
+        mean_interval = self.interval_total / n
+
+        return max(MIN_RATE, -math.log((n - x + 0.5) / (n + 0.5)) / mean_interval)
+
+    def stale_probability(self, now: float) -> float:
+        '''
+        Probability that the category changed since it was last crawled
+        '''
+        return 1 - math.exp(-self.rate() * max(0.0, now - self.last_crawled))
+
+def task_key(task) -> str:
+    '''
+    Stable key of a store work item, the category slug or the page URL
+    '''
+    return task if isinstance(task, str) else task.slug
+
+class Fingerprint:
+    '''
+    Hash of the ids and prices of a category's products, two crawls with the same fingerprint saw no change. Rows are
+    hashed one by one and summed modulo 2**256, so the fingerprint is built page by page as products stream in and does
+    not depend on the order pages arrive in.
+    '''
+
+    def __init__(self):
+        self.total = 0
+        self.count = 0
+
+    def update(self, products: list) -> None:
+        for product in products:
+            row = f"{product.id}:{product.price}:{getattr(product, 'is_discounted', '')}:{getattr(product, 'mayorista_price', '')}"
+            self.total = (self.total + int.from_bytes(sha256(row.encode()).digest(), 'big')) % (1 << 256)
+            self.count += 1
+
+    def hexdigest(self) -> str:
+        return f'{self.total:064x}'
+
+class RecrawlHistory:
+    '''
+    Per category change history of one store, persisted as JSON under DATA_DIR/recrawl/<store>.json
+    '''
+
+    def __init__(self, store: str, path: str | None = None):
+        self.store = store
+        self.path = path or os.path.join(DATA_DIR, 'recrawl', f'{store}.json')
+        self.categories: dict[str, CategoryStats] = {}
+
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                self.categories = {key: CategoryStats(**stats) for key, stats in json.load(file).items()}
+
+    def observe(self, key: str, fingerprint: Fingerprint, pages: int | None = None, now: float | None = None, seconds: float | None = None, probe: Fingerprint | None = None) -> bool:
+        '''
+        Record a crawl of a category
+
+        Args:
+            key: Category key, see task_key
+            fingerprint: Fingerprint of every product mined from the category
+            pages: Pages requested, estimated from the previous crawl if None
+            now: Crawl time, defaults to the current time
+            seconds: Time the crawl took, kept from the previous crawl if None
+            probe: Fingerprint of the first page, compared by later probes, see unchanged
+
+        Returns:
+            bool: True if the category changed since the previous crawl
+        '''
+        now = time() if now is None else now
+        current = fingerprint.hexdigest()
+
+        with self._lock:
+            stats = self.categories.setdefault(key, CategoryStats())
+            changed = stats.fingerprint != current
+
+            if stats.fingerprint:
+                stats.visits += 1
+                stats.changes += int(changed)
+                stats.interval_total += now - stats.last_crawled
+
+            stats.fingerprint = current
+            stats.last_crawled = now
+            stats.products = fingerprint.count
+            stats.pages = pages if pages is not None else stats.pages
+            stats.seconds = seconds if seconds is not None else stats.seconds
+            stats.probe = probe.hexdigest() if probe is not None else stats.probe
+
+            return changed
+
+    def unchanged(self, key: str, probe: Fingerprint, max_age: float, now: float | None = None) -> bool:
+        '''
+        Whether a probe of a category's first page shows it unchanged since its last full crawl, which is not older
+        than max_age seconds
+
+        Args:
+            key: Category key, see task_key
+            probe: Fingerprint of the first page just mined
+            max_age: Seconds after which the category needs a full crawl whatever its first page shows
+            now: Probe time, defaults to the current time
+
+        Returns:
+            bool: True if the full crawl can be skipped
+        '''
+        now = time() if now is None else now
+
+        with self._lock:
+            stats = self.categories.get(key)
+            return stats is not None and stats.probe == probe.hexdigest() and now - stats.last_crawled < max_age
+
+    def value(self, task, now: float) -> float:
+        '''
+        Expected number of changed products per page requested, infinite for categories never crawled
+        '''
+        stats = self.categories.get(task_key(task))
+        if stats is None:
+            return math.inf
+        return stats.stale_probability(now) * max(1, stats.products) / max(1, stats.pages)
+
+    def page_seconds(self) -> float:
+        '''
+        Mean time a page of this store took over the timed crawls, PAGE_SECONDS before the first one
+        '''
+        with self._lock:
+            timed = [stats for stats in self.categories.values() if stats.seconds > 0]
+
+        pages = sum(stats.pages for stats in timed)
+        return sum(stats.seconds for stats in timed) / pages if pages else PAGE_SECONDS
+
+    def cost(self, task, page_seconds: float | None = None) -> float:
+        '''
+        Expected seconds to crawl a category, its last crawl time or its pages at the store's mean page time
+        '''
+        stats = self.categories.get(task_key(task))
+        page_seconds = self.page_seconds() if page_seconds is None else page_seconds
+
+        if stats is None:
+            return page_seconds
+        if stats.seconds > 0:
+            return stats.seconds
+        return stats.pages * page_seconds
+
+    def estimate(self, tasks: list) -> list[float]:
+        '''
+        Expected seconds to crawl each task, see cost. Categories never crawled are assumed to take the mean time of
+        the ones that were timed.
+
+        Args:
+            tasks: Work items returned by the store's get_tasks
+
+        Returns:
+            list[float]: Seconds per task, in the order of tasks
+        '''
+        page_seconds = self.page_seconds()
+        costs = [self.cost(task, page_seconds) if task_key(task) in self.categories else None for task in tasks]
+        known = [cost for cost in costs if cost is not None]
+        default = sum(known) / len(known) if known else page_seconds
+
+        return [default if cost is None else cost for cost in costs]
+
+    def rank(self, tasks: list, now: float | None = None) -> list:
+        '''
+        Order tasks by expected value per second of crawling, the changed products a category is expected to have
+        over the time it is expected to take, for crawls that may be cut short. Categories never crawled come first,
+        in their original order.
+
+        Args:
+            tasks: Work items returned by the store's get_tasks
+            now: Ranking time, defaults to the current time
+
+        Returns:
+            list: The same tasks, most valuable first
+        '''
+        now = time() if now is None else now
+        page_seconds = self.page_seconds()
+
+        def density(task) -> float:
+            stats = self.categories.get(task_key(task))
+            if stats is None:
+                return math.inf
+            return stats.stale_probability(now) * max(1, stats.products) / max(1e-3, self.cost(task, page_seconds))
+
+        return sorted(tasks, key=density, reverse=True)
+
+    def expected_products(self, tasks: list) -> int:
+        '''
+        Products the tasks had on their last crawl, tasks never crawled count as none
+        '''
+        return sum(self.categories[task_key(task)].products for task in tasks if task_key(task) in self.categories)
+
+    def mean_pages(self, default: int = 1) -> int:
+        '''
+        Pages a category of this store is expected to take, the mean of the crawled ones, default before the first
+        '''
+        with self._lock:
+            pages = [stats.pages for stats in self.categories.values()]
+
+        return math.ceil(sum(pages) / len(pages)) if pages else default
+
+    def select(self, tasks: list, budget: int, now: float | None = None, pages: int = 1) -> list:
+        '''
+        Pick the tasks worth refreshing this cycle under a request budget. Categories never crawled come first, the
+        rest are ranked by the expected number of changed products per page requested. Categories never crawled are
+        expected to take the mean pages of the crawled ones.
+
+        Args:
+            tasks: Work items returned by the store's get_tasks
+            budget: Maximum number of pages to request
+            now: Selection time, defaults to the current time
+            pages: Pages expected of a category never crawled while no category of the store was crawled yet
+
+        Returns:
+            list: The selected tasks, in their original order
+        '''
+        now = time() if now is None else now
+        unknown = self.mean_pages(pages)
+
+        selected: set[int] = set()
+        spent = 0
+
+        for index in sorted(range(len(tasks)), key=lambda i: self.value(tasks[i], now), reverse=True):
+            stats = self.categories.get(task_key(tasks[index]))
+            cost = stats.pages if stats else unknown
+
+            if spent + cost > budget and selected:
+                continue
+
+            selected.add(index)
+            spent += cost
+
+        return [task for index, task in enumerate(tasks) if index in selected]
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        with self._lock:
+            data = {key: asdict(stats) for key, stats in self.categories.items()}
+
+        with open(f'{self.path}.tmp', 'w') as file:
+            json.dump(data, file)
+
+        os.replace(f'{self.path}.tmp', self.path)
@@ -0,0 +1,500 @@
+import json
+import os
+import re
+import threading
+from dataclasses import dataclass, field
+
+import numpy as np
+from unidecode import unidecode
+
+from miners.config import DATA_DIR
+
+# Characters names are indexed on after normalization, everything else becomes a word separator. Trigrams of this
+# alphabet are integers below len(ALPHABET) ** 3, so their postings are addressed directly without a dictionary.
+ALPHABET = ' abcdefghijklmnopqrstuvwxyz0123456789'
+TRIGRAMS: int = len(ALPHABET) ** 3
+
+# Longest word kept in the word index, longer words are still found through their trigrams
+MAX_TERM: int = 32
+
+# Share of the distinct trigrams of a fuzzy query a name must contain
+FUZZY_THRESHOLD: float = 0.5
+
+# Fraction of superseded documents that triggers a rewrite of the index without them on save
+COMPACT_RATIO: float = 0.2
+
+# Upper bounds of the price facet buckets, in guaraníes
+PRICE_BUCKETS = (10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000)
+
+SEPARATORS = re.compile(r'[^a-z0-9]+')
+
+CODES = np.zeros(256, dtype=np.int64)
+for code, char in enumerate(ALPHABET):
+    CODES[ord(char)] = code
+
+def normalize(name: str) -> str:
+    '''
+    Searchable form of a product name, transliterated to ASCII, lowercased, with runs of anything but letters and
+    digits collapsed to one space
+    '''
+    return SEPARATORS.sub(' ', unidecode(name).lower()).strip()
+
+def trigram_codes(text: str) -> np.ndarray:
+    '''
+    Trigram code starting at every position of a normalized text but the last two
+    '''
+    codes = CODES[np.frombuffer(text.encode(), dtype=np.uint8)]
+    return codes[:-2] * len(ALPHABET) ** 2 + codes[1:-1] * len(ALPHABET) + codes[2:]
+
+def trigrams(text: str) -> np.ndarray:
+    '''
+    Distinct trigram codes of a normalized text
+    '''
+    if len(text) < 3:
+        return np.empty(0, dtype=np.int64)
+
+    return np.unique(trigram_codes(text))
+
+def price_bucket(index: int) -> str:
+    low = PRICE_BUCKETS[index - 1] if index else 0
+    return f'{low}-{PRICE_BUCKETS[index]}' if index < len(PRICE_BUCKETS) else f'{low}+'
+
+@dataclass
+class Postings:
+    '''
+    Sorted document numbers per key, in compressed sparse row form: the documents of key k are
+    docs[offsets[k]:offsets[k + 1]]
+    '''
+    offsets: np.ndarray
+    docs: np.ndarray
+
+    @classmethod
+    def empty(cls, keys: int) -> 'Postings':
+        return cls(np.zeros(keys + 1, dtype=np.int64), np.empty(0, dtype=np.int32))
+
+    def get(self, key: int) -> np.ndarray:
+        return self.docs[self.offsets[key]:self.offsets[key + 1]]
+
+    def keys(self) -> np.ndarray:
+        '''
+        Key of every posting, aligned with docs
+        '''
+        return np.repeat(np.arange(len(self.offsets) - 1), np.diff(self.offsets))
+
+    @classmethod
+    def from_pairs(cls, keys: np.ndarray, docs: np.ndarray, count: int) -> 'Postings':
+        order = np.lexsort((docs, keys))
+        keys, docs = keys[order], docs[order]
+
+        keep = np.ones(len(keys), dtype=bool)
+        keep[1:] = (keys[1:] != keys[:-1]) | (docs[1:] != docs[:-1])
+        keys, docs = keys[keep], docs[keep]
+
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=count), out=offsets[1:])
+        return cls(offsets, docs.astype(np.int32))
+
+    def rekey(self, keys: np.ndarray, count: int) -> 'Postings':
+        '''
+        Move the postings of every key k to keys[k] out of count keys, keys must be increasing
+        '''
+        sizes = np.zeros(count, dtype=np.int64)
+        sizes[keys] = np.diff(self.offsets)
+
+        offsets = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        return Postings(offsets, self.docs)
+
+    def merge(self, other: 'Postings') -> 'Postings':
+        '''
+        Append the postings of other to these, key by key, without sorting. Every document of other must be numbered
+        after every document of these, so the documents of each key stay sorted.
+        '''
+        offsets = self.offsets + other.offsets
+        docs = np.empty(offsets[-1], dtype=np.int32)
+
+        # Each key's postings move up by the postings of the other side filed under earlier keys
+        docs[np.arange(len(self.docs)) + other.offsets[self.keys()]] = self.docs
+        docs[np.arange(len(other.docs)) + self.offsets[other.keys() + 1]] = other.docs
+        return Postings(offsets, docs)
+
+@dataclass
+class SearchResult:
+    '''
+    Matches of a query: how many there are, the best ones, and counts per origin, category and price bucket of all of
+    them
+    '''
+    total: int
+    hits: list[dict] = field(default_factory=list)
+    facets: dict[str, dict[str, int]] = field(default_factory=dict)
+
+class SearchIndex:
+    '''
+    Local search index over the names of uploaded products, so products can be found across stores without pulling
+    the whole collection from the API. Names are normalized with unidecode and indexed twice, by word for exact word
+    matches and word prefixes, and by trigram for substring and fuzzy matches. Origin, category and price are kept
+    as columns for filters and facets.
+
+    The index lives under DATA_DIR/search as NumPy arrays and JSON, and is updated incrementally: a product seen
+    again with the same name only updates its columns, and a renamed product supersedes its old document. On commit
+    only the postings of the new documents are sorted, they are numbered after every existing document, so they are
+    merged into the existing postings by appending them to each key. Superseded documents are dropped once they
+    pass COMPACT_RATIO.
+    '''
+
+    def __init__(self, root: str | None = None):
+        self.root = root or os.path.join(DATA_DIR, 'search')
+
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._slots: dict[str, int] | None = None
+        self._pending: list[tuple] = []
+        self._updates: dict[int, tuple] = {}
+        self._codes: dict[str, dict[str, int]] = {}
+
+    def load(self) -> None:
+        with self._lock:
+            self._load()
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+
+        self._loaded = True
+        path = os.path.join(self.root, 'documents.json')
+
+        if not os.path.exists(path):
+            self.ids, self.names, self.texts, self.urls = [], [], [], []
+            self.origins, self.categories = [], []
+            self.origin = np.empty(0, dtype=np.int32)
+            self.category = np.empty(0, dtype=np.int32)
+            self.price = np.empty(0, dtype=np.int64)
+            self.alive = np.empty(0, dtype=bool)
+            self.length = np.empty(0, dtype=np.int32)
+            self.terms = np.empty(0, dtype=f'<U{MAX_TERM}')
+            self.words = Postings.empty(0)
+            self.grams = Postings.empty(TRIGRAMS)
+            return
+
+        with open(path) as file:
+            documents = json.load(file)
+
+        self.ids, self.names, self.texts, self.urls = documents['ids'], documents['names'], documents['texts'], documents['urls']
+        self.origins, self.categories = documents['origins'], documents['categories']
+
+        arrays = np.load(os.path.join(self.root, 'index.npz'))
+        self.origin, self.category, self.price, self.alive, self.length = arrays['origin'], arrays['category'], arrays['price'], arrays['alive'], arrays['length']
+        self.terms = arrays['terms']
+        self.words = Postings(arrays['word_offsets'], arrays['word_docs'])
+        self.grams = Postings(arrays['gram_offsets'], arrays['gram_docs'])
+
+    def _code(self, kind: str, value: str) -> int:
+        '''
+        Index of an origin or category name in its dictionary, added if new
+        '''
+        values = getattr(self, kind)
+        codes = self._codes.get(kind)
+
+        if codes is None or len(codes) != len(values):
+            codes = self._codes[kind] = {value: code for code, value in enumerate(values)}
+
+        if value not in codes:
+            codes[value] = len(values)
+            values.append(value)
+
+        return codes[value]
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._load()
+            return int(self.alive.sum()) + len(self._pending)
+
+    def add(self, products: list) -> None:
+        '''
+        Index or update uploaded products, the new documents become searchable on commit
+
+        Args:
+            products: Product objects or dicts of any store, with id, origin, name, price, product_url and
+                category_name
+        '''
+        with self._lock:
+            self._load()
+
+            if self._slots is None:
+                self._slots = {id: doc for doc, id in enumerate(self.ids) if self.alive[doc]}
+
+            for product in products:
+                row = product if isinstance(product, dict) else product.__dict__
+                document = (row['id'], row['name'], row['origin'], row['category_name'], int(row['price']), row['product_url'])
+                doc = self._slots.get(row['id'])
+
+                if doc is not None and doc >= len(self.ids):
+                    # Added earlier in this commit, only the last version of the product is indexed
+                    self._pending[doc - len(self.ids)] = document
+                    continue
+
+                if doc is not None and self.names[doc] == row['name']:
+                    self._updates[doc] = document[2:]
+                    continue
+
+                if doc is not None:
+                    self.alive[doc] = False
+                    self._updates.pop(doc, None)
+
+                self._slots[row['id']] = len(self.ids) + len(self._pending)
+                self._pending.append(document)
+
+    def commit(self) -> None:
+        '''
+        Apply pending updates and build the postings of the documents added since the last commit
+        '''
+        with self._lock:
+            self._load()
+            self._commit()
+
+    def _commit(self) -> None:
+        for doc, (origin, category, price, url) in self._updates.items():
+            self.origin[doc] = self._code('origins', origin)
+            self.category[doc] = self._code('categories', category)
+            self.price[doc] = price
+            self.urls[doc] = url
+        self._updates = {}
+
+        if not self._pending:
+            return
+
+        first = len(self.ids)
+        columns = np.empty((len(self._pending), 3), dtype=np.int64)
+        word_keys, word_docs = [], []
+
+        for offset, (id, name, origin, category, price, url) in enumerate(self._pending):
+            text = normalize(name)
+            self.ids.append(id)
+            self.names.append(name)
+            self.texts.append(text)
+            self.urls.append(url)
+            columns[offset] = (self._code('origins', origin), self._code('categories', category), price)
+
+            terms = {term[:MAX_TERM] for term in text.split()}
+            word_keys.extend(terms)
+            word_docs.extend([first + offset] * len(terms))
+
+        # Trigrams of every new name at once, over the names padded with a space on each side and laid end to end,
+        # keeping the ones that start and end within the same name
+        padded = [f' {text} ' for text in self.texts[first:]]
+        ends = np.cumsum([len(text) for text in padded])
+        gram_keys = trigram_codes(''.join(padded))
+        gram_docs = np.searchsorted(ends, np.arange(len(gram_keys)), side='right')
+        within = np.arange(len(gram_keys)) + 2 < ends[gram_docs]
+
+        self.origin = np.concatenate([self.origin, columns[:, 0].astype(np.int32)])
+        self.category = np.concatenate([self.category, columns[:, 1].astype(np.int32)])
+        self.price = np.concatenate([self.price, columns[:, 2]])
+        self.alive = np.concatenate([self.alive, np.ones(len(self._pending), dtype=bool)])
+        self.length = np.concatenate([self.length, np.fromiter(map(len, self.texts[first:]), dtype=np.int32, count=len(self._pending))])
+        self._pending = []
+
+        new_terms = np.array(word_keys, dtype=self.terms.dtype)
+        terms = np.unique(np.concatenate([self.terms, new_terms]))
+        words = Postings.from_pairs(np.searchsorted(terms, new_terms), np.array(word_docs, dtype=np.int32), len(terms))
+        self.words = self.words.rekey(np.searchsorted(terms, self.terms), len(terms)).merge(words)
+        self.terms = terms
+
+        self.grams = self.grams.merge(Postings.from_pairs(gram_keys[within], gram_docs[within] + first, TRIGRAMS))
+
+    def compact(self) -> int:
+        '''
+        Drop superseded documents and renumber the rest
+
+        Returns:
+            int: Documents dropped
+        '''
+        with self._lock:
+            self._load()
+            self._commit()
+            return self._compact()
+
+    def _compact(self) -> int:
+        dropped = len(self.alive) - int(self.alive.sum())
+        if not dropped:
+            return 0
+
+        kept = np.flatnonzero(self.alive)
+        renumber = np.full(len(self.alive), -1, dtype=np.int64)
+        renumber[kept] = np.arange(len(kept))
+
+        for name in ('ids', 'names', 'texts', 'urls'):
+            values = getattr(self, name)
+            setattr(self, name, [values[doc] for doc in kept])
+
+        self.origin, self.category, self.price, self.length = self.origin[kept], self.category[kept], self.price[kept], self.length[kept]
+        self.alive = np.ones(len(kept), dtype=bool)
+
+        for name in ('words', 'grams'):
+            postings = getattr(self, name)
+            docs = renumber[postings.docs]
+            keep = docs >= 0
+            setattr(self, name, Postings.from_pairs(postings.keys()[keep], docs[keep], len(postings.offsets) - 1))
+
+        self._slots = None
+        return dropped
+
+    def save(self) -> None:
+        '''
+        Commit and write the index, compacting it first when enough documents were superseded
+        '''
+        with self._lock:
+            self._load()
+            self._commit()
+
+            if len(self.alive) and 1 - self.alive.mean() > COMPACT_RATIO:
+                print(f'[DEBUG] Compacted {self._compact()} superseded documents from the search index...')
+
+            os.makedirs(self.root, exist_ok=True)
+            path = os.path.join(self.root, 'index.npz')
+
+            with open(f'{path}.tmp', 'wb') as file:
+                np.savez(file, origin=self.origin, category=self.category, price=self.price, alive=self.alive, length=self.length, terms=self.terms,
+                         word_offsets=self.words.offsets, word_docs=self.words.docs, gram_offsets=self.grams.offsets, gram_docs=self.grams.docs)
+
+            documents = {'ids': self.ids, 'names': self.names, 'texts': self.texts, 'urls': self.urls, 'origins': self.origins, 'categories': self.categories}
+            with open(os.path.join(self.root, 'documents.json.tmp'), 'w') as file:
+                json.dump(documents, file, ensure_ascii=False)
+
+            os.replace(f'{path}.tmp', path)
+            os.replace(os.path.join(self.root, 'documents.json.tmp'), os.path.join(self.root, 'documents.json'))
+
+    def search(self, query: str, fuzzy: bool = False, origin: str | None = None, category: str | None = None, min_price: int | None = None, max_price: int | None = None, limit: int = 20) -> SearchResult:
+        '''
+        Find products by name. Every word of the query must appear in the name, anywhere for words of three or more
+        characters and at the start of a word for shorter ones, names with the query words as whole words first. A
+        fuzzy query instead ranks names by the share of the query's trigrams they contain, tolerating typos.
+
+        Args:
+            query: Words to look for, normalized like the names
+            fuzzy: Match names holding at least FUZZY_THRESHOLD of the query trigrams instead of every word
+            origin: Only products of this origin
+            category: Only products of this category name
+            min_price: Only products at this price or above
+            max_price: Only products at this price or below
+            limit: Number of hits returned
+
+        Returns:
+            SearchResult: Total matches, the best hits, and facet counts of all matches
+        '''
+        with self._lock:
+            self._load()
+            self._commit()
+
+            words = normalize(query).split()
+            if not words:
+                return SearchResult(0)
+
+            if fuzzy:
+                docs, score = self._fuzzy(words)
+            else:
+                docs = self._candidates(words)
+
+            keep = self.alive[docs]
+            if origin is not None:
+                keep &= self.origin[docs] == (self._code('origins', origin) if origin in self.origins else -1)
+            if category is not None:
+                keep &= self.category[docs] == (self._code('categories', category) if category in self.categories else -1)
+            if min_price is not None:
+                keep &= self.price[docs] >= min_price
+            if max_price is not None:
+                keep &= self.price[docs] <= max_price
+
+            if fuzzy:
+                docs, score = docs[keep], score[keep]
+            else:
+                docs = self._verify(docs[keep], words)
+                score = self._score(docs, words)
+
+            best = np.lexsort((self.length[docs], -score))[:limit]
+
+            return SearchResult(
+                total=len(docs),
+                hits=[{
+                    'id': self.ids[docs[hit]],
+                    'name': self.names[docs[hit]],
+                    'origin': self.origins[self.origin[docs[hit]]],
+                    'category_name': self.categories[self.category[docs[hit]]],
+                    'price': int(self.price[docs[hit]]),
+                    'product_url': self.urls[docs[hit]],
+                    'score': float(score[hit]),
+                } for hit in best],
+                facets={
+                    'origin': self._facet(self.origins, self.origin[docs]),
+                    'category': self._facet(self.categories, self.category[docs]),
+                    'price': {price_bucket(bucket): int(count) for bucket, count in enumerate(np.bincount(np.searchsorted(PRICE_BUCKETS, self.price[docs]), minlength=len(PRICE_BUCKETS) + 1)) if count},
+                }
+            )
+
+    def _word(self, word: str) -> np.ndarray:
+        '''
+        Documents with a word starting with word
+        '''
+        start, end = np.searchsorted(self.terms, [word, f'{word}~'])
+        docs = np.sort(self.words.docs[self.words.offsets[start]:self.words.offsets[end]])
+        return docs[np.concatenate([[True], docs[1:] != docs[:-1]])] if len(docs) else docs
+
+    def _candidates(self, words: list[str]) -> np.ndarray:
+        '''
+        Documents with every trigram of the longer words and a word starting with each shorter one, smallest postings
+        intersected first
+        '''
+        postings = []
+
+        for word in words:
+            if len(word) < 3:
+                postings.append(self._word(word))
+            else:
+                postings.extend(self.grams.get(gram) for gram in trigrams(word))
+
+        postings.sort(key=len)
+        docs = postings[0]
+
+        for found in postings[1:]:
+            if not len(docs):
+                break
+            docs = np.intersect1d(docs, found, assume_unique=True)
+
+        return docs
+
+    def _verify(self, docs: np.ndarray, words: list[str]) -> np.ndarray:
+        '''
+        Drop candidates holding the trigrams of a word but not the word, like "abcd" in "abc bcd"
+        '''
+        texts = self.texts
+
+        for word in words:
+            if len(word) > 3:
+                docs = np.array([doc for doc in docs.tolist() if word in texts[doc]], dtype=np.int32)
+
+        return docs
+
+    def _score(self, docs: np.ndarray, words: list[str]) -> np.ndarray:
+        '''
+        Number of query words each document has as a whole word
+        '''
+        score = np.zeros(len(docs))
+
+        for word in words:
+            index = np.searchsorted(self.terms, word)
+            if index < len(self.terms) and self.terms[index] == word:
+                score += np.isin(docs, self.words.get(index), assume_unique=True)
+
+        return score
+
+    def _fuzzy(self, words: list[str]) -> tuple[np.ndarray, np.ndarray]:
+        grams = np.unique(np.concatenate([trigrams(f' {word} ') for word in words]))
+        counts = np.bincount(np.concatenate([self.grams.get(gram) for gram in grams]), minlength=len(self.alive))
+
+        docs = np.flatnonzero(counts >= max(1, np.ceil(FUZZY_THRESHOLD * len(grams)))).astype(np.int32)
+        return docs, counts[docs] / len(grams)
+
+    @staticmethod
+    def _facet(values: list[str], codes: np.ndarray) -> dict[str, int]:
+        counts = np.bincount(codes, minlength=len(values))
+        return {values[code]: int(counts[code]) for code in np.argsort(-counts, kind='stable') if counts[code]}
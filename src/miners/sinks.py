@@ -0,0 +1,397 @@
+import gzip
+import json
+import os
+import random
+from datetime import datetime, timezone
+from time import sleep, time
+from typing import Iterable, Iterator
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from miners.config import API_URL, DATA_DIR, MONGO_DATABASE, MONGO_URI
+
+# Attempts of an API upload that times out or gets a 408, 429 or 5xx before the batch is reported as failed
+HTTP_ATTEMPTS: int = 4
+
+# Products per file before a file sink starts a new one
+FILE_ROWS: int = 100_000
+
+class BatchRejected(Exception):
+    '''
+    Raised by a sink's write when the destination refused the batch itself, sending it again cannot succeed
+    '''
+
+def wait_for_api(api_url: str = API_URL, interval: int = 5) -> None:
+    '''
+    Block until the API answers, replaces the curl loop every miner container used to run
+
+    Args:
+        api_url: Base URL of the API
+        interval: Seconds to wait between attempts
+    '''
+    while True:
+        try:
+            requests.get(f'{api_url}/', timeout=10)
+            return
+        except Exception:
+            print(f'[DEBUG] Waiting for the API on {api_url}...')
+            sleep(interval)
+
+def document(product) -> dict:
+    '''
+    MongoDB document of a product with the same _id and fields the API stores for models.Product, fields a store does
+    not mine get the zero value the Go struct would have. Details are only set when the product has them, like the
+    API omits them, so products uploaded without their details keep the stored ones.
+    '''
+    fields = {
+        '_id': product.id,
+        'origin': product.origin,
+        'code': getattr(product, 'code', ''),
+        'name': product.name,
+        'price': product.price,
+        'mayorista_price': getattr(product, 'mayorista_price', 0),
+        'is_discounted': getattr(product, 'is_discounted', None),
+        'image_url': product.image_url,
+        'product_url': product.product_url,
+        'category_name': product.category_name,
+    }
+
+    if getattr(product, 'details', None):
+        fields['details'] = product.details
+
+    return fields
+
+class Sink:
+    '''
+    Destination of the deduplicated product batches of an upload pipeline. Sinks that are concurrent can be written
+    from several upload threads at once.
+    '''
+    name: str = 'sink'
+    concurrent: bool = False
+
+    def wait(self) -> None:
+        '''
+        Block until the destination is ready to receive products
+        '''
+
+    def write(self, store: str, batch: list) -> bool:
+        '''
+        Store one batch of products
+
+        Args:
+            store: Store name the products were mined from
+            batch: Product objects
+
+        Returns:
+            bool: True if the batch was stored
+
+        Raises:
+            BatchRejected: If the batch must not be retried
+        '''
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+class HttpSink(Sink):
+    '''
+    Posts batches to the products endpoint of the Go API. Timeouts, connection errors, 408, 429 and 5xx responses are
+    retried with jittered exponential backoff, honouring Retry-After, other 4xx responses reject the batch and other
+    statuses fail it at once.
+    '''
+    name = 'http'
+    concurrent = True
+
+    path: str = '/products/'
+    content_type: str = 'application/json'
+    success: int = 201
+
+    def __init__(self, api_url: str = API_URL, timeout: int = 120, attempts: int = HTTP_ATTEMPTS):
+        self.api_url = api_url
+        self.timeout = timeout
+        self.attempts = attempts
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=32)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def wait(self) -> None:
+        wait_for_api(self.api_url)
+
+    def write(self, store: str, batch: list) -> bool:
+        for attempt in range(self.attempts):
+            delay = min(60.0, 2 ** attempt) * (0.5 + random.random())
+
+            try:
+                print(f'[DEBUG] Sending {len(batch)} products to the API...')
+                response = self.session.post(f'{self.api_url}{self.path}', data=self.body(batch), headers={'Content-Type': self.content_type}, timeout=self.timeout)
+
+                if response.status_code == self.success:
+                    print('[DEBUG] Products sent to the API...')
+                    self.report(response)
+                    return True
+
+                print('[ERROR] Invalid status code from API...')
+                print(response.status_code)
+
+                if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                    raise BatchRejected(f'{response.status_code} {response.text[:200]}')
+
+                if response.status_code not in (408, 429) and response.status_code < 500:
+                    return False
+
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    delay = float(retry_after)
+            except (requests.Timeout, requests.ConnectionError) as e:
+                print('[ERROR] Failed to send products to the API...', e)
+            except BatchRejected:
+                raise
+            except Exception as e:
+                print('[ERROR] Failed to send products to the API...', e)
+                return False
+
+            if attempt + 1 < self.attempts:
+                sleep(delay)
+
+        return False
+
+    def body(self, batch: list):
+        return json.dumps([product.__dict__ for product in batch], ensure_ascii=False).encode()
+
+    def report(self, response: requests.Response) -> None:
+        pass
+
+    def close(self) -> None:
+        self.session.close()
+
+def ndjson_lines(rows: Iterable[dict]) -> Iterator[bytes]:
+    '''
+    Encode rows as NDJSON lines, lazily so a request body can stream them
+    '''
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False).encode() + b'\n'
+
+class IngestSink(HttpSink):
+    '''
+    Streams batches as chunked NDJSON to the /products/ingest endpoint of the Go API, which upserts records while they
+    arrive. Records the API rejects are reported one by one instead of failing the batch, and batches are not bound by
+    the API body limit. Every request reuses the session's kept-alive connection.
+    '''
+    name = 'ingest'
+    path = '/products/ingest'
+    content_type = 'application/x-ndjson'
+    success = 200
+
+    def body(self, batch: list):
+        return ndjson_lines(product.__dict__ for product in batch)
+
+    def report(self, response: requests.Response) -> None:
+        data = response.json().get('data') or {}
+
+        if data.get('rejected'):
+            print(f"[ERROR] The API rejected {data['rejected']} of {data.get('received')} products...")
+            for error in data.get('errors', [])[:10]:
+                print(f"[ERROR] Record {error.get('record')} {error.get('id', '')}: {error.get('error')}")
+
+def ingest(api_url: str, rows: Iterable[dict], timeout: int = 3600) -> dict:
+    '''
+    Stream any number of products to the /products/ingest endpoint in a single request, for bulk loads of exported
+    files
+
+    Args:
+        api_url: Base URL of the API
+        rows: Product fields in models.Product JSON form
+        timeout: Seconds to wait for the API between chunks
+
+    Returns:
+        dict: The ingest summary, received, rejected, upserted, modified, matched and errors
+    '''
+    response = requests.post(f'{api_url}/products/ingest', data=ndjson_lines(rows), headers={'Content-Type': 'application/x-ndjson'}, timeout=timeout)
+    response.raise_for_status()
+    return response.json().get('data') or {}
+
+class MongoSink(Sink):
+    '''
+    Upserts batches straight into the products collection with unordered bulk writes, skipping the API hop. Writes
+    the same documents CreateProducts does.
+    '''
+    name = 'mongo'
+    concurrent = True
+
+    def __init__(self, uri: str = MONGO_URI, database: str = MONGO_DATABASE, collection: str = 'products', pool_size: int = 8):
+        from pymongo import MongoClient
+
+        self.client = MongoClient(uri, maxPoolSize=pool_size)
+        self.collection = self.client[database][collection]
+
+    def wait(self, interval: int = 5) -> None:
+        while True:
+            try:
+                self.client.admin.command('ping')
+                return
+            except Exception:
+                print('[DEBUG] Waiting for MongoDB...')
+                sleep(interval)
+
+    def write(self, store: str, batch: list) -> bool:
+        from pymongo import UpdateOne
+
+        operations = {}
+        for product in batch:
+            fields = document(product)
+            operations[fields.pop('_id')] = fields
+
+        try:
+            print(f'[DEBUG] Writing {len(operations)} products to MongoDB...')
+            self.collection.bulk_write([UpdateOne({'_id': id}, {'$set': fields}, upsert=True) for id, fields in operations.items()], ordered=False)
+            return True
+        except Exception as e:
+            print('[ERROR] Failed to write products to MongoDB...', e)
+            return False
+
+    def close(self) -> None:
+        self.client.close()
+
+class FileSink(Sink):
+    '''
+    Writes products to rotating compressed files for offline runs and bulk loading:
+
+        <root>/<store>/<run>/part-00000.ndjson.gz   gzipped NDJSON, one document per line, loads with mongoimport
+        <root>/<store>/<run>/part-00000.parquet     zstd compressed Parquet, needs pyarrow
+
+    Documents have the same _id and fields as the MongoDB sink. Files are written under a .tmp name and renamed once
+    complete, so loaders never pick up a partial file. NDJSON rows are streamed to disk as batches arrive, Parquet rows
+    are buffered until a file is full.
+    '''
+    name = 'file'
+
+    def __init__(self, root: str | None = None, format: str = 'ndjson', rows: int = FILE_ROWS):
+        if format not in ('ndjson', 'parquet'):
+            raise ValueError(f'Unsupported file format: {format}')
+
+        if format == 'parquet':
+            # Fail on startup rather than when the first file is full
+            import pyarrow
+
+        self.root = root or os.path.join(DATA_DIR, 'exports')
+        self.format = format
+        self.rows = rows
+        self.run = datetime.fromtimestamp(time(), timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+        self._files: dict[str, dict] = {}
+
+    def write(self, store: str, batch: list) -> bool:
+        try:
+            for product in batch:
+                current = self._files.get(store)
+
+                if current is None or current['rows'] >= self.rows:
+                    if current is not None:
+                        self._finish(current)
+                    current = self._files[store] = self._open(store, current['part'] + 1 if current else 0)
+
+                if self.format == 'ndjson':
+                    current['file'].write(json.dumps(document(product), ensure_ascii=False))
+                    current['file'].write('\n')
+                else:
+                    row = document(product)
+                    # Details vary in shape from product to product, Parquet keeps them as a JSON column
+                    row['details'] = json.dumps(row['details'], ensure_ascii=False) if 'details' in row else None
+                    current['buffer'].append(row)
+
+                current['rows'] += 1
+
+            return True
+        except Exception as e:
+            print(f'[ERROR] Failed to write products of {store} to {self.root}...', e)
+            return False
+
+    def close(self) -> None:
+        for current in self._files.values():
+            self._finish(current)
+            print(f"[DEBUG] Wrote {current['part'] + 1} files to {os.path.dirname(current['path'])}...")
+
+        self._files = {}
+
+    def _open(self, store: str, part: int) -> dict:
+        directory = os.path.join(self.root, store, self.run)
+        os.makedirs(directory, exist_ok=True)
+
+        extension = 'ndjson.gz' if self.format == 'ndjson' else 'parquet'
+        path = os.path.join(directory, f'part-{part:05d}.{extension}')
+        current = {'path': path, 'part': part, 'rows': 0, 'file': None, 'buffer': []}
+
+        if self.format == 'ndjson':
+            current['file'] = gzip.open(f'{path}.tmp', 'wt', encoding='utf-8', compresslevel=6)
+
+        return current
+
+    def _finish(self, current: dict) -> None:
+        if self.format == 'ndjson':
+            current['file'].close()
+        else:
+            import pyarrow
+            import pyarrow.parquet
+
+            pyarrow.parquet.write_table(pyarrow.Table.from_pylist(current['buffer']), f"{current['path']}.tmp", compression='zstd')
+            current['buffer'] = []
+
+        os.replace(f"{current['path']}.tmp", current['path'])
+
+def read_exports(paths: list[str]) -> Iterator[dict]:
+    '''
+    Read products back from NDJSON files written by FileSink, in the JSON form of models.Product
+
+    Args:
+        paths: .ndjson.gz files or directories holding them at any depth
+
+    Yields:
+        dict: Product fields with id instead of _id
+    '''
+    files = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names if name.endswith('.ndjson.gz')))
+        else:
+            files.append(path)
+
+    for file_path in files:
+        with gzip.open(file_path, 'rt', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    row = json.loads(line)
+                    row['id'] = row.pop('_id')
+                    yield row
+
+def open_sink(url: str) -> Sink:
+    '''
+    Open a sink from its URL, an http(s):// API base URL, the same URL prefixed with ingest+ to stream NDJSON to the
+    ingest endpoint, a mongodb:// or mongodb+srv:// URI, mongo for MONGO_URI, or ndjson or parquet followed by an
+    optional :<directory> for files under DATA_DIR/exports by default
+
+    Args:
+        url: Sink location
+
+    Returns:
+        Sink: The opened sink
+    '''
+    if url.startswith(('http://', 'https://')):
+        return HttpSink(url.rstrip('/'))
+
+    if url.startswith(('ingest+http://', 'ingest+https://')):
+        return IngestSink(url[len('ingest+'):].rstrip('/'))
+
+    if url == 'mongo':
+        return MongoSink()
+
+    if url.startswith(('mongodb://', 'mongodb+srv://')):
+        return MongoSink(url)
+
+    format, _, root = url.partition(':')
+    if format in ('ndjson', 'parquet'):
+        return FileSink(root or None, format)
+
+    raise ValueError(f'Unsupported sink URL: {url}')
@@ -0,0 +1,241 @@
+import gzip
+import json
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from time import time
+from typing import IO, Iterator
+from xml.etree.ElementTree import iterparse
+
+import requests
+
+from miners.config import DATA_DIR
+from miners.planner import base_url, task_url
+
+NAMESPACE = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+@dataclass
+class SitemapEntry:
+    loc: str
+    lastmod: float | None = None
+
+def parse_lastmod(value: str | None) -> (float | None):
+    '''
+    Parse a W3C datetime lastmod, dates without a time are taken as midnight UTC
+
+    Returns:
+        float: Epoch seconds
+        None: If the value is missing or malformed
+    '''
+    if not value:
+        return None
+
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+
+    return parsed.timestamp()
+
+def open_source(source: str) -> (tuple[IO, object]):
+    '''
+    Open a sitemap as a byte stream without reading it whole, from an http(s) URL, a file:// URL or a local path.
+    Gzipped sitemaps are decompressed on the fly.
+
+    Returns:
+        tuple: The stream and the object to close once done
+    '''
+    if source.startswith(('http://', 'https://')):
+        response = requests.get(source, stream=True, timeout=120)
+        response.raise_for_status()
+        response.raw.decode_content = True
+        stream, closer = response.raw, response
+    else:
+        path = source[len('file://'):] if source.startswith('file://') else source
+        stream = open(path, 'rb')
+        closer = stream
+
+    if source.endswith('.gz'):
+        stream = gzip.GzipFile(fileobj=stream)
+
+    return stream, closer
+
+def robots_sitemaps(source: str) -> list[str]:
+    '''
+    Sitemap locations declared by the Sitemap: lines of a robots.txt
+    '''
+    stream, closer = open_source(source)
+
+    try:
+        lines = stream.read().decode('utf-8', 'replace').splitlines()
+    finally:
+        closer.close()
+
+    return [line.split(':', 1)[1].strip() for line in lines if line.lower().startswith('sitemap:')]
+
+def iter_sitemap(source: str, since: float | None = None) -> Iterator[SitemapEntry]:
+    '''
+    Stream the URLs of a sitemap or sitemap index, parsing elements as they arrive. Child sitemaps of an index whose
+    lastmod is not after since are skipped without being fetched. A robots.txt source is followed to the sitemaps it
+    declares.
+
+    Args:
+        source: Sitemap or robots.txt URL or path
+        since: Only yield URLs modified after this time, URLs without lastmod are always yielded
+
+    Yields:
+        SitemapEntry: Changed URLs
+    '''
+    if source.endswith('robots.txt'):
+        for sitemap in robots_sitemaps(source):
+            yield from iter_sitemap(sitemap, since)
+        return
+
+    stream, closer = open_source(source)
+    children: list[str] = []
+
+    try:
+        for _, element in iterparse(stream, events=('end',)):
+            tag = element.tag.replace(NAMESPACE, '')
+
+            if tag not in ('url', 'sitemap'):
+                continue
+
+            loc = element.findtext(f'{NAMESPACE}loc') or element.findtext('loc')
+            lastmod = parse_lastmod(element.findtext(f'{NAMESPACE}lastmod') or element.findtext('lastmod'))
+            element.clear()
+
+            if not loc or (since is not None and lastmod is not None and lastmod <= since):
+                continue
+
+            if tag == 'sitemap':
+                children.append(loc.strip())
+            else:
+                yield SitemapEntry(loc.strip(), lastmod)
+    finally:
+        closer.close()
+
+    for child in children:
+        try:
+            yield from iter_sitemap(child, since)
+        except Exception as e:
+            print(f'[ERROR] Failed to read sitemap {child}...', e)
+
+def select_changed(tasks: list, entries: list[SitemapEntry], crawled: dict[str, float] | None = None) -> list:
+    '''
+    Keep the tasks whose page, or a page under it, is among the changed sitemap entries
+
+    Args:
+        tasks: Work items returned by the store's get_tasks
+        entries: Changed sitemap entries
+        crawled: Time each category page was last crawled whole, entries not modified after it are not changes and
+            categories missing from it are always kept
+
+    Returns:
+        list: The tasks to crawl
+    '''
+    changed = sorted((base_url(entry.loc), entry.lastmod) for entry in entries)
+    urls = [url for url, _ in changed]
+    selected = []
+
+    for task in tasks:
+        base = task_url(task)
+        if base is None or (crawled is not None and base not in crawled):
+            selected.append(task)
+            continue
+
+        since = crawled.get(base) if crawled is not None else None
+        # The page itself, then every page under it, which sort together right after f'{base}/'
+        matches = changed[bisect_left(urls, base):bisect_right(urls, base)] + changed[bisect_left(urls, f'{base}/'):bisect_left(urls, f'{base}0')]
+
+        if any(since is None or lastmod is None or lastmod > since for _, lastmod in matches):
+            selected.append(task)
+
+    return selected
+
+class SitemapState:
+    '''
+    Sitemap discovery state of each store, persisted as JSON under DATA_DIR/sitemaps.json. It keeps the time of the
+    discovery each category page was last crawled whole after, so a category whose crawl failed or was cut short is
+    still a change on the next discovery. It also keeps whether the sitemap listed any of the store's category pages,
+    a sitemap that only lists product pages cannot tell which categories changed and the store falls back to a full
+    crawl.
+    '''
+
+    def __init__(self, path: str | None = None):
+        self.path = path or os.path.join(DATA_DIR, 'sitemaps.json')
+        self.stores: dict[str, dict] = {}
+
+        self._lock = threading.Lock()
+        self._discovered: dict[str, float] = {}
+
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                self.stores = json.load(file)
+
+    def discover(self, store: str, source: str, tasks: list, now: float | None = None) -> list:
+        '''
+        Keep the tasks whose pages changed since each was last crawled whole, see crawled
+
+        Args:
+            store: Store name
+            source: Sitemap or robots.txt of the store
+            tasks: Work items returned by the store's get_tasks
+            now: Discovery time, defaults to the current time
+
+        Returns:
+            list: The tasks to crawl, all of them on the first discovery or when the sitemap is not usable
+        '''
+        now = time() if now is None else now
+        state = self.stores.get(store, {})
+        matched = state.get('matched', False)
+
+        # Categories gone from the store are forgotten
+        bases = {task_url(task) for task in tasks} - {None}
+        crawled = {url: at for url, at in state.get('crawled', {}).items() if url in bases}
+
+        # Only entries modified after the oldest crawl can be a change, categories never crawled are kept regardless
+        since = min(crawled.values()) if matched and crawled else None
+
+        entries = list(iter_sitemap(source, since))
+
+        if matched:
+            selected = select_changed(tasks, entries, crawled)
+        else:
+            matched = bool(select_changed(tasks, entries))
+            selected = tasks
+
+        with self._lock:
+            self._discovered[store] = now
+            self.stores[store] = {'matched': matched, 'crawled': crawled}
+
+        return selected
+
+    def crawled(self, store: str, task) -> None:
+        '''
+        Record a task of the store as crawled whole at its discovery time, its pages modified since are changes
+
+        Args:
+            store: Store name
+            task: Work item returned by discover
+        '''
+        base = task_url(task)
+
+        with self._lock:
+            if base is None or store not in self._discovered:
+                return
+            self.stores[store]['crawled'][base] = self._discovered[store]
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+
+        with self._lock:
+            with open(f'{self.path}.tmp', 'w') as file:
+                json.dump(self.stores, file)
+
+        os.replace(f'{self.path}.tmp', self.path)
@@ -0,0 +1,300 @@
+import gzip
+import json
+import os
+import threading
+import uuid
+from time import time
+from types import SimpleNamespace
+
+from miners.config import DATA_DIR
+from miners.sinks import BatchRejected, Sink
+
+# Seconds before the first retry of a failed batch, doubled on every failure up to RETRY_MAX
+RETRY_BASE: float = 5.0
+RETRY_MAX: float = 300.0
+
+# Seconds close spends sending the batches still spooled, the rest stay on disk for the next start
+CLOSE_TIMEOUT: float = 60.0
+
+class Spool:
+    '''
+    Durable on-disk spool of upload batches, one gzipped JSON file per batch:
+
+        <root>/<store>/<milliseconds>-<id>.json.gz
+
+    A batch is written, flushed to disk and renamed into place before it is sent, and only removed once the sink
+    stored it. Sinks upsert by product id, so sending a batch twice is harmless and a spool can always be replayed.
+    Batches the sink rejects are moved to the dead letter directory with the reason, since sending them again cannot
+    succeed:
+
+        <dead_letter>/<store>/<milliseconds>-<id>.json.gz
+        <dead_letter>/<store>/<milliseconds>-<id>.json.gz.error
+    '''
+
+    def __init__(self, root: str | None = None, dead_letter: str | None = None):
+        self.root = root or os.path.join(DATA_DIR, 'spool')
+        self.dead_letter = dead_letter or os.path.join(DATA_DIR, 'dead-letter')
+
+    def put(self, store: str, batch: list) -> str:
+        '''
+        Write a batch to the spool
+
+        Args:
+            store: Store name the products were mined from
+            batch: Product objects
+
+        Returns:
+            str: Path of the spooled batch
+        '''
+        directory = os.path.join(self.root, store)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{int(time() * 1000):013d}-{uuid.uuid4().hex[:8]}.json.gz')
+
+        with open(f'{path}.tmp', 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=1) as file:
+                file.write(json.dumps([product.__dict__ for product in batch], ensure_ascii=False).encode())
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        os.replace(f'{path}.tmp', path)
+        return path
+
+    def load(self, path: str) -> (tuple[str, list]):
+        '''
+        Read a spooled batch back
+
+        Returns:
+            tuple: The store name and the products, as objects with the attributes of the mined products
+        '''
+        with gzip.open(path, 'rb') as file:
+            rows = json.loads(file.read())
+
+        return os.path.basename(os.path.dirname(path)), [SimpleNamespace(**row) for row in rows]
+
+    def remove(self, path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def reject(self, path: str, reason: str) -> (str | None):
+        '''
+        Move a spooled batch to the dead letter directory
+
+        Args:
+            path: Path of the spooled batch
+            reason: Why the sink rejected it, written next to it
+
+        Returns:
+            str: New path of the batch
+            None: If it was no longer spooled
+        '''
+        directory = os.path.join(self.dead_letter, os.path.basename(os.path.dirname(path)))
+        os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, os.path.basename(path))
+
+        try:
+            os.replace(path, target)
+        except FileNotFoundError:
+            return None
+
+        with open(f'{target}.error', 'w') as file:
+            file.write(reason)
+
+        return target
+
+    def pending(self) -> list[str]:
+        '''
+        Paths of every spooled batch, oldest first
+        '''
+        if not os.path.isdir(self.root):
+            return []
+
+        paths = [
+            os.path.join(self.root, store, name)
+            for store in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, store))
+            for name in os.listdir(os.path.join(self.root, store)) if name.endswith('.json.gz')
+        ]
+
+        return sorted(paths, key=os.path.basename)
+
+    def replay(self, sink: Sink) -> (tuple[int, int]):
+        '''
+        Send every spooled batch to a sink, removing the ones it stored and moving the ones it rejected to the dead
+        letter directory
+
+        Args:
+            sink: Destination of the batches
+
+        Returns:
+            tuple: Batches sent and batches still spooled
+        '''
+        sent = 0
+        left = 0
+
+        for path in self.pending():
+            try:
+                store, batch = self.load(path)
+            except FileNotFoundError:
+                continue
+
+            try:
+                stored = sink.write(store, batch)
+            except BatchRejected as e:
+                print(f'[ERROR] Spooled batch {os.path.basename(path)} was rejected, moved to {self.dead_letter}...', e)
+                self.reject(path, str(e))
+                continue
+
+            if stored:
+                self.remove(path)
+                sent += 1
+            else:
+                left += 1
+
+        return sent, left
+
+class SpooledSink(Sink):
+    '''
+    Wraps a sink so no batch is lost when it fails. Every batch goes through the spool first, failed batches are
+    retried in the background with exponential backoff, and batches left over by a previous run are sent again on
+    start. Batches the sink rejects go to the dead letter directory instead of being retried. Batches still failing
+    when the run ends, or not sent within CLOSE_TIMEOUT, stay spooled for the next start or the replay command.
+    '''
+
+    def __init__(self, sink: Sink, spool: Spool | None = None):
+        self.sink = sink
+        self.spool = spool or Spool()
+        self.name = sink.name
+        self.concurrent = sink.concurrent
+
+        self._cond = threading.Condition()
+        self._lock = threading.Lock()
+        self._retries: dict[str, tuple[int, float]] = {path: (0, 0.0) for path in self.spool.pending()}
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='upload-spool', daemon=True)
+
+        if self._retries:
+            print(f'[DEBUG] Replaying {len(self._retries)} batches left in the spool...')
+
+        self._thread.start()
+
+    def wait(self) -> None:
+        self.sink.wait()
+
+    def write(self, store: str, batch: list) -> bool:
+        path = self.spool.put(store, batch)
+
+        try:
+            stored = self._write(store, batch)
+        except BatchRejected as e:
+            self._reject(path, e)
+            return False
+
+        if stored:
+            self.spool.remove(path)
+        else:
+            self._schedule(path, 0)
+
+        return stored
+
+    def close(self, timeout: float = CLOSE_TIMEOUT) -> None:
+        '''
+        Send the batches still spooled one last time, for at most timeout seconds, and close the sink
+
+        Args:
+            timeout: Seconds to spend, batches not sent by then stay spooled
+        '''
+        deadline = time() + timeout
+
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+
+        flush = threading.Thread(target=self._flush, args=(deadline,), name='upload-spool-flush', daemon=True)
+        flush.start()
+        flush.join(max(0.0, deadline - time()))
+
+        with self._cond:
+            left = len(self._retries)
+
+        if left:
+            print(f'[ERROR] {left} batches are still spooled under {self.spool.root}, they are sent again on the next start...')
+
+        self.sink.close()
+
+    def _write(self, store: str, batch: list) -> bool:
+        if self.concurrent:
+            return self.sink.write(store, batch)
+
+        with self._lock:
+            return self.sink.write(store, batch)
+
+    def _flush(self, deadline: float) -> None:
+        with self._cond:
+            paths = sorted(self._retries, key=os.path.basename)
+
+        for path in paths:
+            if time() >= deadline:
+                return
+            self._retry(path)
+
+    def _reject(self, path: str, error: BatchRejected) -> None:
+        print(f'[ERROR] Batch {os.path.basename(path)} was rejected, moved to {self.spool.dead_letter}...', error)
+        self.spool.reject(path, str(error))
+
+        with self._cond:
+            self._retries.pop(path, None)
+
+    def _schedule(self, path: str, attempts: int) -> None:
+        delay = min(RETRY_MAX, RETRY_BASE * 2 ** attempts)
+
+        with self._cond:
+            self._retries[path] = (attempts + 1, time() + delay)
+            self._cond.notify_all()
+
+    def _retry(self, path: str) -> bool:
+        try:
+            store, batch = self.spool.load(path)
+        except FileNotFoundError:
+            # Another process sharing the spool already sent it
+            with self._cond:
+                self._retries.pop(path, None)
+            return True
+
+        try:
+            stored = self._write(store, batch)
+        except BatchRejected as e:
+            self._reject(path, e)
+            return True
+
+        if stored:
+            self.spool.remove(path)
+            with self._cond:
+                self._retries.pop(path, None)
+
+        return stored
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+
+                now = time()
+                due = [path for path, (_, at) in self._retries.items() if at <= now]
+
+                if not due:
+                    upcoming = min((at for _, at in self._retries.values()), default=None)
+                    self._cond.wait(None if upcoming is None else upcoming - now)
+                    continue
+
+            for path in sorted(due, key=os.path.basename):
+                if self._stopped:
+                    return
+
+                attempts = self._retries.get(path, (0, 0.0))[0]
+
+                if not self._retry(path):
+                    print(f'[ERROR] Retry {attempts + 1} of spooled batch {os.path.basename(path)} failed...')
+                    self._schedule(path, attempts)
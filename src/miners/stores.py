@@ -0,0 +1,71 @@
+import importlib
+import math
+from dataclasses import dataclass
+from types import ModuleType
+
+@dataclass
+class Store:
+    name: str
+    label: str
+    module: str
+    host: str
+    max_workers: int = 8
+    dedup_by_name: bool = False
+    page_size: int | None = 24
+    sitemap: str | None = None
+    overlap: str | None = None
+
+    def estimate_pages(self, products: int) -> int:
+        '''
+        Pages a task requested, the product pages plus the empty page that ends the pagination.
+        Stores without page_size have one page per task.
+        '''
+        if self.page_size is None:
+            return 1
+        return math.ceil(products / self.page_size) + 1
+
+STORES: dict[str, Store] = {
+    'arete': Store('arete', 'Arete', 'miners.arete.main', 'www.arete.com.py', max_workers=4, sitemap='https://www.arete.com.py/robots.txt', overlap='parent'),
+    'biggie': Store('biggie', 'Biggie', 'miners.biggie.main', 'api.app.biggie.com.py', max_workers=5, page_size=50),
+    'casarica': Store('casarica', 'Casarica', 'miners.casarica.main', 'casarica.com.py', max_workers=4, sitemap='https://casarica.com.py/robots.txt', overlap='parent'),
+    'fortis': Store('fortis', 'Fortis', 'miners.fortis.main', 'www.fortis.com.py'),
+    'gg': Store('gg', 'Gonzalez Gimenez', 'miners.gg.main', 'www.gonzalezgimenez.com.py', page_size=None),
+    'nissei': Store('nissei', 'Nissei', 'miners.nissei.main', 'nissei.com', dedup_by_name=True, sitemap='https://nissei.com/robots.txt', overlap='parent'),
+    'stock': Store('stock', 'Stock', 'miners.stock.main', 'stock.com.py'),
+    'superseis': Store('superseis', 'Superseis', 'miners.superseis.main', 'superseis.com.py'),
+    'tupi': Store('tupi', 'Tupi', 'miners.tupi.main', 'tupi.com.py', page_size=15),
+}
+
+def get_stores(names: list[str] | None = None) -> list[Store]:
+    '''
+    Resolve store names to Store objects, keeping the given order
+
+    Args:
+        names: Store names, all stores if None or empty
+
+    Returns:
+        list[Store]: The matching stores
+
+    Raises:
+        KeyError: If a name is not a known store
+    '''
+    if not names:
+        return list(STORES.values())
+
+    unknown = [name for name in names if name not in STORES]
+    if unknown:
+        raise KeyError(f"Unknown stores: {', '.join(unknown)}")
+
+    return [STORES[name] for name in names]
+
+def load(store: Store) -> ModuleType:
+    '''
+    Import a store module on first use, so a run only pays for the stores it mines
+
+    Args:
+        store: Store to import
+
+    Returns:
+        ModuleType: The store's main module
+    '''
+    return importlib.import_module(store.module)
@@ -0,0 +1,291 @@
+import json
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, is_dataclass
+from time import time
+from typing import Iterator
+
+# Seconds a leased task stays with a worker before it is handed to someone else
+LEASE_TIMEOUT: int = 300
+
+# Times a task is leased before it is given up on
+MAX_ATTEMPTS: int = 5
+
+@dataclass
+class Task:
+    id: int
+    store: str
+    payload: str
+    attempts: int = 0
+    crawl: float = 0.0
+
+def encode_item(item) -> str:
+    '''
+    Serialize a store work item (a Category dataclass or a plain URL) for the queue
+
+    Args:
+        item: Work item returned by a store's get_tasks
+
+    Returns:
+        str: JSON payload
+    '''
+    return json.dumps(asdict(item) if is_dataclass(item) else item)
+
+def decode_item(module, payload: str):
+    '''
+    Rebuild a store work item from its queue payload
+
+    Args:
+        module: The store's main module, used for its Category class
+        payload: JSON payload written by encode_item
+
+    Returns:
+        The work item to pass to the store's iter_products
+    '''
+    item = json.loads(payload)
+    return module.Category(**item) if isinstance(item, dict) else item
+
+class Broker:
+    '''
+    Task queue shared by every worker of a distributed crawl. Leased tasks that are not completed or extended within
+    their lease timeout go back to the queue, so tasks held by dead workers are picked up by live ones.
+
+    Tasks belong to the crawl that was current when they were published, a crawl id is its start time. Product ids are
+    deduplicated per crawl, and every claim belongs to the task that made it. When a task fails or is leased again,
+    its claims are released, so the products of an attempt that never reached the sink are not dropped as duplicates.
+    '''
+
+    def begin(self) -> float:
+        '''
+        Start a new crawl, the tasks published from now on belong to it. Dedup claims of earlier crawls without open
+        tasks are dropped.
+
+        Returns:
+            float: Id of the new crawl
+        '''
+        raise NotImplementedError
+
+    def publish(self, store: str, payloads: list[str]) -> int:
+        raise NotImplementedError
+
+    def lease(self, worker: str, timeout: int = LEASE_TIMEOUT) -> (Task | None):
+        raise NotImplementedError
+
+    def extend(self, task: Task, worker: str, timeout: int = LEASE_TIMEOUT) -> bool:
+        raise NotImplementedError
+
+    def complete(self, task: Task, worker: str) -> None:
+        raise NotImplementedError
+
+    def fail(self, task: Task, worker: str) -> None:
+        raise NotImplementedError
+
+    def claim(self, task: Task, ids: list[str]) -> set[str]:
+        '''
+        Shared dedup, marks product ids as seen by a task and returns the ones no other task of its crawl has claimed
+        '''
+        raise NotImplementedError
+
+    def drained(self) -> bool:
+        raise NotImplementedError
+
+class MemoryBroker(Broker):
+    '''
+    In-process stand-in for a real broker, same lease semantics as SqliteBroker
+    '''
+
+    def __init__(self, max_attempts: int = MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+
+        self._lock = threading.Lock()
+        self._tasks: dict[int, dict] = {}
+        self._seen: dict[tuple[float, str, str], int] = {}
+        self._crawl = 0.0
+        self._next_id = 1
+
+    def begin(self) -> float:
+        with self._lock:
+            self._crawl = max(time(), self._crawl + 1e-3)
+            open_crawls = {task['crawl'] for task in self._tasks.values() if task['state'] != 'done' and task['attempts'] < self.max_attempts}
+            self._seen = {key: task_id for key, task_id in self._seen.items() if key[0] in open_crawls}
+            return self._crawl
+
+    def publish(self, store: str, payloads: list[str]) -> int:
+        with self._lock:
+            for payload in payloads:
+                self._tasks[self._next_id] = {'store': store, 'payload': payload, 'state': 'pending', 'worker': None, 'expires': 0.0, 'attempts': 0, 'crawl': self._crawl}
+                self._next_id += 1
+        return len(payloads)
+
+    def _release(self, task_id: int) -> None:
+        self._seen = {key: owner for key, owner in self._seen.items() if owner != task_id}
+
+    def lease(self, worker: str, timeout: int = LEASE_TIMEOUT) -> (Task | None):
+        with self._lock:
+            now = time()
+            for task_id, task in self._tasks.items():
+                expired = task['state'] == 'leased' and task['expires'] < now
+                if (task['state'] == 'pending' or expired) and task['attempts'] < self.max_attempts:
+                    task.update(state='leased', worker=worker, expires=now + timeout, attempts=task['attempts'] + 1)
+                    self._release(task_id)
+                    return Task(task_id, task['store'], task['payload'], task['attempts'], task['crawl'])
+        return None
+
+    def extend(self, task: Task, worker: str, timeout: int = LEASE_TIMEOUT) -> bool:
+        with self._lock:
+            stored = self._tasks[task.id]
+            if stored['state'] != 'leased' or stored['worker'] != worker:
+                return False
+            stored['expires'] = time() + timeout
+            return True
+
+    def complete(self, task: Task, worker: str) -> None:
+        with self._lock:
+            if self._tasks[task.id]['worker'] == worker:
+                self._tasks[task.id]['state'] = 'done'
+
+    def fail(self, task: Task, worker: str) -> None:
+        with self._lock:
+            if self._tasks[task.id]['worker'] == worker:
+                self._tasks[task.id].update(state='pending', worker=None)
+                self._release(task.id)
+
+    def claim(self, task: Task, ids: list[str]) -> set[str]:
+        with self._lock:
+            new = {product_id for product_id in ids if (task.crawl, task.store, product_id) not in self._seen}
+            self._seen.update(((task.crawl, task.store, product_id), task.id) for product_id in new)
+            return new
+
+    def drained(self) -> bool:
+        with self._lock:
+            return not any(task['state'] != 'done' and task['attempts'] < self.max_attempts for task in self._tasks.values())
+
+class SqliteBroker(Broker):
+    '''
+    Broker backed by a SQLite file, shared by every worker process that can open it. Leases are taken inside an
+    immediate transaction so two workers never get the same task. SQLite file locking is not reliable on network
+    filesystems, nodes on different machines should use a broker backed by a real queue.
+    '''
+
+    def __init__(self, path: str, max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.max_attempts = max_attempts
+
+        self._local = threading.local()
+
+        with self._connect() as connection:
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    store TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    worker TEXT,
+                    expires REAL NOT NULL DEFAULT 0,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    crawl REAL NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, expires);
+                CREATE TABLE IF NOT EXISTS crawls (id REAL PRIMARY KEY);
+            ''')
+
+            # Queues created before crawl ids have no crawl column, and a seen table that is not per crawl
+            if 'crawl' not in [row[1] for row in connection.execute('PRAGMA table_info(tasks)')]:
+                connection.execute('ALTER TABLE tasks ADD COLUMN crawl REAL NOT NULL DEFAULT 0')
+            if 'task' not in [row[1] for row in connection.execute('PRAGMA table_info(seen)')]:
+                connection.execute('DROP TABLE IF EXISTS seen')
+
+            connection.executescript('''
+                CREATE TABLE IF NOT EXISTS seen (
+                    crawl REAL NOT NULL,
+                    store TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    task INTEGER NOT NULL,
+                    PRIMARY KEY (crawl, store, id)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS seen_task ON seen (task);
+            ''')
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        '''
+        Immediate transaction on this thread's connection, committed when the block ends and rolled back if it raises
+        '''
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def begin(self) -> float:
+        with self._transaction() as connection:
+            last = connection.execute('SELECT MAX(id) FROM crawls').fetchone()[0] or 0.0
+            crawl = max(time(), last + 1e-3)
+            connection.execute('INSERT INTO crawls (id) VALUES (?)', (crawl,))
+            connection.execute('''
+                DELETE FROM seen WHERE crawl NOT IN (SELECT DISTINCT crawl FROM tasks WHERE state != 'done' AND attempts < ?)
+            ''', (self.max_attempts,))
+            return crawl
+
+    def publish(self, store: str, payloads: list[str]) -> int:
+        with self._transaction() as connection:
+            crawl = connection.execute('SELECT MAX(id) FROM crawls').fetchone()[0] or 0.0
+            connection.executemany('INSERT INTO tasks (store, payload, crawl) VALUES (?, ?, ?)', [(store, payload, crawl) for payload in payloads])
+        return len(payloads)
+
+    def lease(self, worker: str, timeout: int = LEASE_TIMEOUT) -> (Task | None):
+        now = time()
+        with self._transaction() as connection:
+            row = connection.execute('''
+                SELECT id, store, payload, attempts, crawl FROM tasks
+                WHERE (state = 'pending' OR (state = 'leased' AND expires < ?)) AND attempts < ?
+                ORDER BY id LIMIT 1
+            ''', (now, self.max_attempts)).fetchone()
+
+            if row is None:
+                return None
+
+            connection.execute("UPDATE tasks SET state = 'leased', worker = ?, expires = ?, attempts = attempts + 1 WHERE id = ?", (worker, now + timeout, row[0]))
+            # Claims of an earlier attempt, from a worker that died or failed, never reached the sink
+            connection.execute('DELETE FROM seen WHERE task = ?', (row[0],))
+            return Task(row[0], row[1], row[2], row[3] + 1, row[4])
+
+    def extend(self, task: Task, worker: str, timeout: int = LEASE_TIMEOUT) -> bool:
+        cursor = self._connect().execute("UPDATE tasks SET expires = ? WHERE id = ? AND worker = ? AND state = 'leased'", (time() + timeout, task.id, worker))
+        return cursor.rowcount == 1
+
+    def complete(self, task: Task, worker: str) -> None:
+        self._connect().execute("UPDATE tasks SET state = 'done' WHERE id = ? AND worker = ?", (task.id, worker))
+
+    def fail(self, task: Task, worker: str) -> None:
+        with self._transaction() as connection:
+            if connection.execute("UPDATE tasks SET state = 'pending', worker = NULL WHERE id = ? AND worker = ?", (task.id, worker)).rowcount == 1:
+                connection.execute('DELETE FROM seen WHERE task = ?', (task.id,))
+
+    def claim(self, task: Task, ids: list[str]) -> set[str]:
+        new: set[str] = set()
+        with self._transaction() as connection:
+            for product_id in ids:
+                if connection.execute('INSERT OR IGNORE INTO seen (crawl, store, id, task) VALUES (?, ?, ?, ?)', (task.crawl, task.store, product_id, task.id)).rowcount == 1:
+                    new.add(product_id)
+        return new
+
+    def drained(self) -> bool:
+        row = self._connect().execute("SELECT COUNT(*) FROM tasks WHERE state != 'done' AND attempts < ?", (self.max_attempts,)).fetchone()
+        return row[0] == 0
+
+def new_worker_id() -> str:
+    return f'worker-{uuid.uuid4().hex[:12]}'
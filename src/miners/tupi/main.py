@@ -1,14 +1,21 @@
-import requests
-import concurrent.futures
 from urllib.parse import urlparse
 from dataclasses import dataclass
 from unidecode import unidecode
 from hashlib import sha256
 from bs4 import BeautifulSoup
 import json
-import lxml
+from lxml import etree
 from time import sleep
 import random
+from typing import Iterator
+from miners import fetch
+from miners.mining import MiningError, collect
+from miners.orchestrator import run
+from miners.platforms import class_xpath, text
+
+NAME_LINK = etree.XPath(f'((.//span[{class_xpath("loop-product-categories nombre_producto_ug")}])[1]//a)[1]')
+AMOUNTS = etree.XPath(f'.//span[{class_xpath("amount")}]')
+IMAGE = etree.XPath(f'((.//div[{class_xpath("thumbnail")}])[1]//img)[1]/@src', smart_strings=False)
 
 @dataclass
 class Category:
@@ -37,7 +44,7 @@ def get_categories() -> (list[Category] | None):
     '''
     categories_list: list[Category] = []
     try:
-        response = requests.get('https://tupi.com.py/')
+        response = fetch.get('https://tupi.com.py/')
         if response.status_code == 200:
             print('[DEBUG] Retreived categories from Tupi main page successfully...')
             soup = BeautifulSoup(response.text, 'lxml')
@@ -70,47 +77,51 @@ def get_categories() -> (list[Category] | None):
         print(e)
         return None
     
-def mine_products(category: Category) -> (list[Product] | None):
+def iter_products(category: Category) -> Iterator[list[Product]]:
     '''
-    Mine products from a category, operates like a thread function to not overload the website
+    Mine products from a category page by page, operates like a thread function to not overload the website
 
     Args:
         category: Category object to mine products from
 
-    Returns:
-        list[Product]: List of Product objects mined from the category
-        None: If error occurs
+    Yields:
+        list[Product]: Product objects mined from each page of the category
+
+    Raises:
+        MiningError: If error occurs before any product was mined
     '''
     sleep(random.randint(0, 5))
 
-    products_list: list[Product] = []
+    total = 0
 
     try:
         for url in category.urls:
             page_number: int = 1
             while True:
-                response = requests.get(f'{url}{page_number}', timeout=120)
+                response = fetch.stream(f'{url}{page_number}', timeout=120)
 
                 if response.status_code == 200:
-                    soup = BeautifulSoup(response.text, 'lxml')
-
-                    products = soup.find_all('div', class_='product_unit product vista_')
+                    products = fetch.iter_nodes(response, 'div', 'product_unit product vista_')
 
                     # print(f'[DEBUG] Got {len(products)} from {category.url}{page_number}')
 
+                    page_products: list[Product] = []
+                    found = 0
+
                     for product in products:
+                        found += 1
 
                         try:
-                            name_url = product.find('span', class_='loop-product-categories nombre_producto_ug').find('a')
-                            name = name_url.text.replace("ver detalles", "").strip().lower()
-                            product_url = name_url['href']
-                            price = [ price.text for price in product.find_all('span', class_='amount')][1].split("Gs.")
+                            name_url = NAME_LINK(product)[0]
+                            name = text(name_url).replace("ver detalles", "").strip().lower()
+                            product_url = name_url.attrib['href']
+                            price = [ text(price) for price in AMOUNTS(product)][1].split("Gs.")
                             price = [ price.replace(".","").strip() for price in price if price.replace(".","").strip().isnumeric() ]
                             is_discounted = False if len(price) == 1 else True
-                            image_url = product.find('div', class_='thumbnail').find('img')['src']
+                            image_url = IMAGE(product)[0]
                             product_sha256 = sha256(product_url.encode()).hexdigest()
 
-                            products_list.append(Product(
+                            page_products.append(Product(
                                 id=product_sha256,
                                 origin='tupi',
                                 name=name,
@@ -124,61 +135,54 @@ def mine_products(category: Category) -> (list[Product] | None):
                             print(f'[ERROR] Failed to parse product: {url}{page_number}, {e}')
                             continue
 
-                    if len(products) == 0:
+                    total += len(page_products)
+                    yield page_products
+
+                    if found == 0:
                         break
-                    
+
                     page_number += 1
+
+                else:
+                    print(f'[ERROR] Invalid response from {category.name} category...')
+                    print(response.status_code)
+                    response.close()
+                    break
                 
-        print(f'[DEBUG] Found a total of {len(products_list)} {category.name} category...')
-        return products_list
+        print(f'[DEBUG] Found a total of {total} {category.name} category...')
                 
     except Exception as e:
         print('[ERROR] Failed to mine products from Tupi...')
-        print(e, category.name, len(products_list))
-        return products_list if len(products_list) > 0 else None
-    
-def main():
-    categories: list[Category] = get_categories()
+        print(e, category.name, total)
+        if total == 0:
+            raise MiningError(category.name) from e
 
-    # print(f'[DEBUG] {categories}')
+def mine_products(category: Category) -> (list[Product] | None):
+    '''
+    Mine every product from a category at once
 
-    if categories is not None:
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            product_tracker: dict[str, Product] = {}
+    Args:
+        category: Category object to mine products from
+
+    Returns:
+        list[Product]: List of Product objects mined from the category
+        None: If error occurs
+    '''
+    return collect(iter_products(category))
 
-            futures = [executor.submit(mine_products, category) for category in categories]
+def get_tasks() -> (list[Category] | None):
+    '''
+    Work items for the orchestrator, one per category
 
-            for future in concurrent.futures.as_completed(futures):
-                print(f"[DEBUG] Results from search {len(future.result()) if future.result() is not None else 0} products...")
+    Returns:
+        list[Category]: Categories to mine
+        None: If error occurs
+    '''
+    return get_categories()
 
-                if future.result() is not None:
-                    for product in future.result():
-                        if product.id not in product_tracker:
-                            product_tracker[product.id] = product
-                        else:
-                            continue
+def main():
+    run(['tupi'])
 
-            print(f"[DEBUG] Found a total of {len(product_tracker)} products from Superseis...")
-
-            # upload to api, 1000 products at a time
-            for i in range(0, len(product_tracker), 1000):
-                try:
-                    print(f"[DEBUG] Sending {i} to {i+1000} products to the API...")
-                    response = requests.post('http://api:8080/products/', json=[product.__dict__ for product in list(product_tracker.values())[i:i+1000]], timeout=120)
-
-                    if response.status_code == 201:
-                        print('[DEBUG] Products sent to the API...')
-                    else:
-                        print('[ERROR] Invalid status code from API...')
-                        print(response.status_code)
-                        continue
-                except Exception as e:
-                    print('[ERROR] Failed to send products to the API...', e)
-                    continue
-                    
-    else:
-        print('[ERROR] No Categories found on the Superseis front page...')
-        
 if __name__ == '__main__':
     print("[DEBUG] Running Tupi Miner...")
     main()
@@ -0,0 +1,128 @@
+import json
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from time import time
+from urllib.parse import urljoin
+
+from miners.config import DATA_DIR
+
+# Fields models.Product in the API marks validate:"required", a zero value fails the whole request
+REQUIRED_FIELDS = ('id', 'origin', 'name', 'price', 'image_url', 'product_url', 'category_name')
+
+# Fields of models.Product that are optional, with their JSON type
+OPTIONAL_FIELDS = {'code': str, 'mayorista_price': int, 'is_discounted': bool}
+
+DIGITS = re.compile(r'[^\d]')
+
+def coerce_int(value) -> (int | None):
+    '''
+    Integer value of a price, from an int, a float or a guaraní string like "Gs. 12.500", None if there is none
+    '''
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value == value else None
+    if isinstance(value, str):
+        digits = DIGITS.sub('', value.split(',')[0])
+        return int(digits) if digits else None
+    return None
+
+def coerce_bool(value) -> (bool | None):
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    if isinstance(value, str):
+        lowered = value.strip().lower()
+        if lowered in ('true', '1', 'yes', 'si', 'sí'):
+            return True
+        if lowered in ('false', '0', 'no', ''):
+            return False
+    return None
+
+def validate(product) -> (str | None):
+    '''
+    Check a mined product against the models.Product contract of the API, fixing in place what can be fixed: strings
+    are stripped, prices parsed to integers, booleans parsed, and relative image URLs resolved against the product URL
+
+    Args:
+        product: Product object of any store
+
+    Returns:
+        str: Why the product would be rejected by the API
+        None: If the product is valid
+    '''
+    for name in REQUIRED_FIELDS:
+        if name == 'price':
+            continue
+
+        value = getattr(product, name, None)
+        if value is not None and not isinstance(value, str):
+            value = str(value)
+        value = value.strip() if value else ''
+        if not value:
+            return f'missing {name}'
+        setattr(product, name, value)
+
+    price = coerce_int(getattr(product, 'price', None))
+    if not price or price < 0:
+        return f'invalid price {getattr(product, "price", None)!r}'
+    product.price = price
+
+    if not product.image_url.startswith(('http://', 'https://')):
+        product.image_url = urljoin(product.product_url, product.image_url)
+
+    for name, kind in OPTIONAL_FIELDS.items():
+        if not hasattr(product, name):
+            continue
+
+        value = getattr(product, name)
+        if value is None:
+            continue
+
+        if kind is int:
+            coerced = coerce_int(value)
+        elif kind is bool:
+            coerced = coerce_bool(value)
+        else:
+            coerced = str(value).strip()
+
+        if coerced is None:
+            return f'invalid {name} {value!r}'
+        setattr(product, name, coerced)
+
+    return None
+
+class Quarantine:
+    '''
+    Side file of the products that failed validation, one JSON line per product with the reason, under
+    DATA_DIR/quarantine/<store>/<run>.ndjson. Files are only created when a product of that store is rejected.
+    '''
+
+    def __init__(self, root: str | None = None):
+        self.root = root or os.path.join(DATA_DIR, 'quarantine')
+        self.run = datetime.fromtimestamp(time(), timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        self.counts: dict[str, int] = {}
+
+        self._lock = threading.Lock()
+
+    def put(self, store: str, product, error: str) -> None:
+        line = json.dumps({'error': error, 'product': getattr(product, '__dict__', {})}, ensure_ascii=False, default=str)
+
+        with self._lock:
+            directory = os.path.join(self.root, store)
+            os.makedirs(directory, exist_ok=True)
+
+            with open(os.path.join(directory, f'{self.run}.ndjson'), 'a', encoding='utf-8') as file:
+                file.write(line)
+                file.write('\n')
+
+            self.counts[store] = self.counts.get(store, 0) + 1
+
+    def report(self) -> None:
+        for store, count in self.counts.items():
+            print(f'[ERROR] Quarantined {count} invalid products from {store} under {os.path.join(self.root, store)}...')
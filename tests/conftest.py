@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The miners package lives under src/, next to the Go API
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
@@ -0,0 +1,66 @@
+from hashlib import sha256
+
+import numpy as np
+
+from miners.analytics import Snapshot, chained_index, diff
+from miners.history import ROW
+
+def snapshot(timestamp: int, products: dict[str, tuple]) -> Snapshot:
+    '''
+    Snapshot of products given as id to (price, is_discounted, category)
+    '''
+    rows = np.zeros(len(products), dtype=ROW)
+    for row, (id, (price, discounted, category)) in zip(rows, products.items()):
+        row['id'] = sha256(id.encode()).digest()
+        row['timestamp'] = timestamp
+        row['price'] = price
+        row['is_discounted'] = discounted
+        row['category'] = category
+    return Snapshot.from_rows(timestamp, rows)
+
+def ids(snapshot: Snapshot, index: np.ndarray, products: dict) -> set[str]:
+    digests = {sha256(id.encode()).digest(): id for id in products}
+    return {digests[bytes(snapshot.id[i])] for i in index}
+
+BEFORE = {'a': (100, 0, 0), 'b': (200, 0, 0), 'c': (300, 1, 1), 'd': (400, 0, 1)}
+AFTER = {'a': (90, 1, 0), 'b': (220, 0, 0), 'c': (300, 0, 1), 'e': (500, 0, 1)}
+
+def test_diff_finds_every_kind_of_change():
+    before, after = snapshot(1, BEFORE), snapshot(2, AFTER)
+
+    changes = diff(before, after)
+
+    assert ids(after, changes.new, AFTER) == {'e'}
+    assert ids(before, changes.removed, BEFORE) == {'d'}
+    assert ids(after, changes.price_drops, AFTER) == {'a'}
+    assert ids(after, changes.price_rises, AFTER) == {'b'}
+    assert ids(after, changes.discount_starts, AFTER) == {'a'}
+    assert ids(after, changes.discount_ends, AFTER) == {'c'}
+
+def test_new_and_removed_only_count_in_compared_categories():
+    changes = diff(snapshot(1, BEFORE), snapshot(2, AFTER), compared=np.array([True, False]))
+
+    assert len(changes.new) == 0
+    assert len(changes.removed) == 0
+    assert len(changes.price_drops) == 1
+
+def test_category_counts_and_price_index():
+    changes = diff(snapshot(1, BEFORE), snapshot(2, AFTER))
+
+    counts = changes.category_counts(3)
+    index = changes.price_index(3)
+
+    assert counts['new'].tolist() == [0, 1, 0]
+    assert counts['removed'].tolist() == [0, 1, 0]
+    assert counts['price_drops'].tolist() == [1, 0, 0]
+    assert np.isclose(index[0], np.sqrt(0.9 * 1.1))
+    assert np.isclose(index[1], 1.0)
+    assert np.isnan(index[2])
+
+def test_chained_index_carries_categories_without_matches_forward():
+    third = {'a': (99, 0, 0), 'b': (242, 0, 0)}
+
+    series = chained_index([snapshot(1, BEFORE), snapshot(2, AFTER), snapshot(3, third)], 2)
+
+    assert np.allclose(series[:, 0], [1.0, np.sqrt(0.99), np.sqrt(0.99) * np.sqrt(1.1 * 1.1)])
+    assert np.allclose(series[:, 1], [1.0, 1.0, 1.0])
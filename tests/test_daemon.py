@@ -0,0 +1,49 @@
+from datetime import datetime
+
+import pytest
+
+from miners.daemon import Cron, Interval, parse_field, parse_interval
+
+def at(*args) -> float:
+    return datetime(*args).timestamp()
+
+def test_parse_interval():
+    assert parse_interval('90') == 90
+    assert parse_interval('30m') == 1800
+    assert parse_interval('6H') == 6 * 3600
+
+def test_parse_field():
+    assert parse_field('*/15', 0, 59) == {0, 15, 30, 45}
+    assert parse_field('1-5/2,10', 0, 59) == {1, 3, 5, 10}
+
+    with pytest.raises(ValueError):
+        parse_field('0-60', 0, 59)
+
+@pytest.mark.parametrize('expression, after, expected', [
+    ('0 */6 * * *', (2024, 3, 1, 5, 59, 30), (2024, 3, 1, 6, 0)),
+    ('0 */6 * * *', (2024, 3, 1, 6, 0), (2024, 3, 1, 12, 0)),
+    ('30 2 * * *', (2024, 3, 1, 23, 0), (2024, 3, 2, 2, 30)),
+    ('0 0 1 * *', (2024, 1, 31, 12, 0), (2024, 2, 1, 0, 0)),
+    ('0 0 29 2 *', (2024, 3, 1, 0, 0), (2028, 2, 29, 0, 0)),
+    # 2024-03-01 is a Friday, Sunday is both 0 and 7
+    ('0 9 * * 0', (2024, 3, 1, 0, 0), (2024, 3, 3, 9, 0)),
+    ('0 9 * * 7', (2024, 3, 1, 0, 0), (2024, 3, 3, 9, 0)),
+    ('0 9 * * 1-5', (2024, 3, 1, 10, 0), (2024, 3, 4, 9, 0)),
+    # Both day fields restricted, either one fires
+    ('0 0 15 * 1', (2024, 3, 1, 0, 0), (2024, 3, 4, 0, 0)),
+])
+def test_cron_next(expression, after, expected):
+    assert Cron(expression).next(at(*after)) == at(*expected)
+
+def test_cron_rejects_invalid_expressions():
+    with pytest.raises(ValueError):
+        Cron('0 0 * *')
+
+    with pytest.raises(ValueError):
+        Cron('0 0 31 2 *').next(at(2024, 1, 1))
+
+def test_interval_counts_from_the_previous_start():
+    assert Interval(60).next(100.0) == 160.0
+
+    with pytest.raises(ValueError):
+        Interval(0)
@@ -0,0 +1,92 @@
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from types import ModuleType
+
+import pytest
+
+from miners import stores
+from miners.distributed import run_task
+from miners.mining import MiningError
+from miners.pipeline import UploadPipeline
+from miners.sinks import Sink
+from miners.stores import Store
+from miners.taskqueue import MemoryBroker
+from miners.validation import Quarantine
+
+@dataclass
+class Product:
+    id: str
+    origin: str
+    name: str
+    price: int
+    image_url: str
+    product_url: str
+    category_name: str
+
+def product(i: int) -> Product:
+    return Product(str(i), 'test', f'Product {i}', 1000 + i, f'https://test.invalid/{i}.jpg', f'https://test.invalid/{i}', 'Category')
+
+class SlowSink(Sink):
+    def __init__(self):
+        self.written: list[str] = []
+        self._lock = threading.Lock()
+
+    def write(self, store: str, batch: list) -> bool:
+        time.sleep(0.2)
+        with self._lock:
+            self.written.extend(product.id for product in batch)
+        return True
+
+@pytest.fixture
+def store(monkeypatch) -> Store:
+    module = ModuleType('miners_test_store')
+    module.pages = [[product(1), product(2)], [product(3)]]
+
+    def iter_products(item):
+        for page in module.pages:
+            if page is None:
+                raise MiningError(item)
+            yield page
+
+    module.iter_products = iter_products
+    monkeypatch.setitem(sys.modules, module.__name__, module)
+
+    store = Store('test', 'Test', module.__name__, 'test.invalid')
+    monkeypatch.setitem(stores.STORES, store.name, store)
+    return store
+
+@pytest.fixture
+def pipeline(tmp_path):
+    sink = SlowSink()
+    pipeline = UploadPipeline(sink, quarantine=Quarantine(str(tmp_path)))
+    yield pipeline
+    pipeline.close()
+
+def test_task_is_completed_after_its_products_reach_the_sink(store, pipeline):
+    broker = MemoryBroker()
+    broker.begin()
+    broker.publish(store.name, ['"item"'])
+    task = broker.lease('worker')
+
+    completed = []
+    complete = broker.complete
+    broker.complete = lambda task, worker: (completed.append(list(pipeline.sink.written)), complete(task, worker))
+
+    assert run_task(broker, pipeline, task, 'worker')
+    assert sorted(completed[0]) == ['1', '2', '3']
+    assert broker.drained()
+
+def test_failed_task_goes_back_to_the_queue(store, pipeline):
+    stores.load(store).pages = [[product(1)], None]
+    broker = MemoryBroker()
+    broker.begin()
+    broker.publish(store.name, ['"item"'])
+    task = broker.lease('worker')
+
+    assert not run_task(broker, pipeline, task, 'worker')
+
+    again = broker.lease('worker')
+    assert again.id == task.id
+    assert broker.claim(again, ['1']) == {'1'}
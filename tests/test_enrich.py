@@ -0,0 +1,42 @@
+import json
+from dataclasses import dataclass
+
+from miners.enrich import DetailCache, parse_details
+
+@dataclass
+class Product:
+    product_url: str
+    name: str = 'Product'
+    price: int = 1000
+    is_discounted: bool = False
+    image_url: str = 'https://store.invalid/product.jpg'
+
+def test_details_are_fresh_until_the_listing_changes_or_the_ttl(tmp_path):
+    cache = DetailCache(str(tmp_path), ttl=100)
+    product = Product('https://store.invalid/1')
+    cache.put('store', product, {'sku': '1'}, now=0)
+
+    assert cache.fresh('store', product, now=50)
+    assert not cache.fresh('store', product, now=100)
+    assert not cache.fresh('store', Product(product.product_url, price=900), now=50)
+
+def test_save_drops_entries_older_than_the_prune_age(tmp_path):
+    cache = DetailCache(str(tmp_path), ttl=100, prune_age=400)
+    cache.put('store', Product('https://store.invalid/old'), {'sku': 'old'}, now=0)
+    cache.put('store', Product('https://store.invalid/new'), {'sku': 'new'}, now=300)
+
+    cache.save(now=450)
+
+    assert json.loads((tmp_path / 'store.json').read_text()).keys() == {'https://store.invalid/new'}
+    assert cache.get('store', 'https://store.invalid/old') is None
+    assert DetailCache(str(tmp_path)).get('store', 'https://store.invalid/new') == {'sku': 'new'}
+
+def test_parse_details_reads_json_ld():
+    html = '''<html><head><script type="application/ld+json">
+        {"@type": "Product", "sku": "ABC", "brand": {"@type": "Brand", "name": "Acme"}}
+    </script></head></html>'''
+
+    details = parse_details(html)
+
+    assert details['sku'] == 'ABC'
+    assert details['brand'] == 'Acme'
@@ -0,0 +1,50 @@
+from dataclasses import dataclass
+
+from miners.planner import drop_overlaps, plan
+from miners.stores import Store
+
+@dataclass
+class Category:
+    name: str
+    url: str
+
+@dataclass
+class Group:
+    name: str
+    urls: list[str]
+
+def store(overlap: str | None = None) -> Store:
+    return Store('test', 'Test', 'miners_test_store', 'store.invalid', overlap=overlap)
+
+TASKS = [
+    Category('Electro', 'https://store.invalid/electro?p='),
+    Category('TV', 'https://store.invalid/electro/tv?p='),
+    Category('Electrodomesticos', 'https://store.invalid/electrodomesticos?p='),
+    Category('Audio', 'https://store.invalid/audio?p='),
+]
+
+def names(tasks: list) -> list[str]:
+    return [task.name for task in tasks]
+
+def test_parent_overlap_drops_subcategories():
+    assert names(drop_overlaps(TASKS, 'parent')) == ['Electro', 'Electrodomesticos', 'Audio']
+
+def test_children_overlap_drops_categories_with_a_subcategory():
+    assert names(drop_overlaps(TASKS, 'children')) == ['TV', 'Electrodomesticos', 'Audio']
+
+def test_plan_keeps_overlaps_unless_the_store_says_otherwise():
+    assert names(plan(store(), TASKS)) == names(TASKS)
+    assert names(plan(store('parent'), TASKS)) == ['Electro', 'Electrodomesticos', 'Audio']
+
+def test_plan_canonicalizes_and_drops_duplicate_categories():
+    tasks = [Category('Audio', 'HTTPS://Store.invalid:443//audio?p='), Category('Sonido', 'https://store.invalid/audio?p=')]
+
+    planned = plan(store(), tasks)
+
+    assert names(planned) == ['Audio']
+    assert planned[0].url == 'https://store.invalid/audio?p='
+
+def test_plan_keeps_shared_pages_in_the_first_multi_url_category():
+    tasks = [Group('A', ['https://store.invalid/1', 'https://store.invalid/2']), Group('B', ['https://store.invalid/2', 'https://store.invalid/3']), Group('C', ['https://store.invalid/1'])]
+
+    assert [task.urls for task in plan(store(), tasks)] == [['https://store.invalid/1', 'https://store.invalid/2'], ['https://store.invalid/3']]
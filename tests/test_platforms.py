@@ -0,0 +1,57 @@
+from itertools import islice
+
+import pytest
+
+from miners import fetch
+from miners.platforms import Platform
+
+class Response:
+    def __init__(self):
+        self.closed = False
+
+    def close(self) -> None:
+        self.closed = True
+
+@pytest.fixture
+def requested(monkeypatch) -> list:
+    requested = []
+
+    def stream(url, timeout=120):
+        requested.append(url)
+        return Response()
+
+    monkeypatch.setattr(fetch, 'stream', stream)
+    return requested
+
+def mine(sizes: dict[int, int], take: int | None = None) -> list:
+    pages = Platform('Test', 'test').pages(lambda number: number, lambda response, number: (sizes.get(number, 0), [number] * sizes.get(number, 0)))
+    mined = list(islice(pages, take))
+    pages.close()
+    return mined
+
+def test_pages_stop_at_the_page_without_products(requested):
+    mined = mine({1: 24, 2: 24, 3: 5})
+
+    assert [number for number, _ in mined] == [1, 2, 3]
+    assert requested == [1, 2, 3, 4]
+
+def test_pages_request_nothing_the_consumer_did_not_ask_for(requested):
+    mine({1: 24, 2: 24, 3: 24}, take=1)
+    assert requested == [1]
+
+    requested.clear()
+    mine({1: 24, 2: 24, 3: 24}, take=2)
+    assert requested == [1, 2]
+
+def test_pages_close_every_response(monkeypatch):
+    responses = []
+
+    def stream(url, timeout=120):
+        responses.append(Response())
+        return responses[-1]
+
+    monkeypatch.setattr(fetch, 'stream', stream)
+    mine({1: 24, 2: 3})
+
+    assert len(responses) == 3
+    assert all(response.closed for response in responses)
@@ -0,0 +1,70 @@
+import threading
+import time
+
+from miners.orchestrator import Scheduler
+
+def test_stores_without_estimates_are_served_round_robin():
+    scheduler = Scheduler(workers=1)
+    started = []
+
+    for name in ('a', 'b', 'c'):
+        scheduler.add_store(name, 1)
+        for _ in range(2):
+            scheduler.submit(name, started.append, name)
+
+    scheduler.run()
+
+    assert started == ['a', 'b', 'c', 'a', 'b', 'c']
+
+def test_store_with_the_most_work_per_worker_goes_first():
+    scheduler = Scheduler(workers=1)
+    started = []
+
+    scheduler.add_store('small', 1)
+    scheduler.add_store('big', 1)
+    scheduler.submit('small', started.append, 'small', cost=10)
+    scheduler.submit('big', started.append, 'big', cost=60)
+    scheduler.submit('big', started.append, 'big', cost=30)
+
+    scheduler.run()
+
+    assert started == ['big', 'big', 'small']
+
+def test_store_limits_cap_tasks_in_flight():
+    scheduler = Scheduler(workers=4)
+    lock = threading.Lock()
+    running = {'a': 0, 'b': 0}
+    peak = {'a': 0, 'b': 0}
+
+    def task(name):
+        with lock:
+            running[name] += 1
+            peak[name] = max(peak[name], running[name])
+        time.sleep(0.01)
+        with lock:
+            running[name] -= 1
+
+    scheduler.add_store('a', 1)
+    scheduler.add_store('b', 8)
+    for _ in range(8):
+        scheduler.submit('a', task, 'a')
+        scheduler.submit('b', task, 'b')
+
+    scheduler.run()
+
+    assert peak['a'] == 1
+    assert 1 < peak['b'] <= 4
+
+def test_tasks_submitted_by_tasks_run_before_the_scheduler_returns():
+    scheduler = Scheduler(workers=2)
+    done = []
+
+    def discover():
+        for i in range(3):
+            scheduler.submit('a', done.append, i)
+
+    scheduler.add_store('a', 2)
+    scheduler.submit('a', discover)
+    scheduler.run()
+
+    assert sorted(done) == [0, 1, 2]
@@ -0,0 +1,89 @@
+import numpy as np
+
+from miners.search import Postings, SearchIndex
+
+def product(id: str, name: str, price: int = 10_000, origin: str = 'Biggie', category: str = 'Almacen') -> dict:
+    return {'id': id, 'name': name, 'origin': origin, 'category_name': category, 'price': price, 'product_url': f'https://store.invalid/{id}'}
+
+PRODUCTS = [
+    product('1', 'Azúcar Blanca 1kg'),
+    product('2', 'Azucar Morena 1kg', 12_000),
+    product('3', 'Televisor Samsung 50"', 3_000_000, 'Nissei', 'Televisores'),
+    product('4', 'Arroz 1kg', 8_000),
+]
+
+def ids(result) -> set[str]:
+    return {hit['id'] for hit in result.hits}
+
+def test_merge_matches_a_full_rebuild():
+    rng = np.random.default_rng(0)
+    keys, docs = rng.integers(0, 50, 400), rng.integers(0, 100, 400)
+    new_keys, new_docs = rng.integers(0, 50, 200), rng.integers(100, 150, 200)
+
+    merged = Postings.from_pairs(keys, docs, 50).merge(Postings.from_pairs(new_keys, new_docs, 50))
+    rebuilt = Postings.from_pairs(np.concatenate([keys, new_keys]), np.concatenate([docs, new_docs]), 50)
+
+    assert np.array_equal(merged.offsets, rebuilt.offsets)
+    assert np.array_equal(merged.docs, rebuilt.docs)
+
+def test_rekey_moves_postings_to_their_new_keys():
+    postings = Postings.from_pairs(np.array([0, 1, 1]), np.array([5, 6, 7]), 2).rekey(np.array([1, 3]), 4)
+
+    assert [postings.get(key).tolist() for key in range(4)] == [[], [5], [], [6, 7]]
+
+def test_commits_add_up_to_a_single_commit(tmp_path):
+    single = SearchIndex(str(tmp_path / 'single'))
+    single.add(PRODUCTS)
+    single.commit()
+
+    incremental = SearchIndex(str(tmp_path / 'incremental'))
+    for item in PRODUCTS:
+        incremental.add([item])
+        incremental.commit()
+
+    assert np.array_equal(single.terms, incremental.terms)
+    for name in ('words', 'grams'):
+        assert np.array_equal(getattr(single, name).offsets, getattr(incremental, name).offsets)
+        assert np.array_equal(getattr(single, name).docs, getattr(incremental, name).docs)
+
+def test_search_words_prefixes_and_facets(tmp_path):
+    index = SearchIndex(str(tmp_path))
+    index.add(PRODUCTS)
+
+    result = index.search('azucar 1kg')
+    assert result.total == 2
+    assert ids(result) == {'1', '2'}
+    assert result.facets['origin'] == {'Biggie': 2}
+
+    assert ids(index.search('tele sam')) == {'3'}
+    assert ids(index.search('1kg', max_price=10_000)) == {'1', '4'}
+    assert ids(index.search('televisr samsumg', fuzzy=True)) == {'3'}
+
+def test_renamed_product_supersedes_its_document(tmp_path):
+    index = SearchIndex(str(tmp_path))
+    index.add(PRODUCTS)
+    index.commit()
+
+    index.add([product('4', 'Arroz Parboil 1kg', 9_000), product('1', 'Azúcar Blanca 1kg', 11_000)])
+
+    assert ids(index.search('arroz')) == {'4'}
+    assert index.search('parboil').hits[0]['price'] == 9_000
+    assert index.search('blanca').hits[0]['price'] == 11_000
+    assert len(index) == 4
+
+def test_compact_drops_superseded_documents_and_survives_a_reload(tmp_path):
+    index = SearchIndex(str(tmp_path))
+    index.add(PRODUCTS)
+    index.commit()
+    index.add([product('4', 'Arroz Parboil 1kg')])
+
+    assert index.compact() == 1
+    assert len(index.ids) == 4
+    index.save()
+
+    reloaded = SearchIndex(str(tmp_path))
+    assert ids(reloaded.search('parboil')) == {'4'}
+    assert ids(reloaded.search('azucar')) == {'1', '2'}
+
+    reloaded.add([product('5', 'Arroz Integral 1kg')])
+    assert ids(reloaded.search('arroz')) == {'4', '5'}
@@ -0,0 +1,53 @@
+from miners.sitemap import SitemapEntry, SitemapState, iter_sitemap, select_changed
+
+def write_sitemap(path, entries: dict[str, str]) -> str:
+    urls = ''.join(f'<url><loc>{loc}</loc><lastmod>{lastmod}</lastmod></url>' for loc, lastmod in entries.items())
+    path.write_text(f'<?xml version="1.0"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>')
+    return str(path)
+
+TASKS = ['https://store.invalid/a?p=', 'https://store.invalid/b?p=']
+
+def test_iter_sitemap_skips_entries_not_modified_since(tmp_path):
+    source = write_sitemap(tmp_path / 'sitemap.xml', {'https://store.invalid/a': '2024-01-01', 'https://store.invalid/b': '2024-03-01'})
+
+    assert [entry.loc for entry in iter_sitemap(source, since=None)] == ['https://store.invalid/a', 'https://store.invalid/b']
+    assert [entry.loc for entry in iter_sitemap(source, since=1704153600.0)] == ['https://store.invalid/b']
+
+def test_select_changed_matches_pages_under_a_category():
+    entries = [SitemapEntry('https://store.invalid/a/product', 10.0), SitemapEntry('https://store.invalid/ab', 10.0)]
+
+    assert select_changed(TASKS, entries) == [TASKS[0]]
+    assert select_changed(TASKS, entries, {'https://store.invalid/a': 10.0, 'https://store.invalid/b': 10.0}) == []
+    assert select_changed(TASKS, entries, {'https://store.invalid/a': 5.0}) == TASKS
+
+def test_first_discovery_crawls_everything(tmp_path):
+    source = write_sitemap(tmp_path / 'sitemap.xml', {'https://store.invalid/a': '2024-01-01'})
+    state = SitemapState(str(tmp_path / 'state.json'))
+
+    assert state.discover('store', source, TASKS, now=1e10) == TASKS
+
+def test_categories_are_changes_until_crawled_whole(tmp_path):
+    source = write_sitemap(tmp_path / 'sitemap.xml', {'https://store.invalid/a': '2024-01-01', 'https://store.invalid/b': '2024-01-01'})
+    state = SitemapState(str(tmp_path / 'state.json'))
+    state.discover('store', source, TASKS, now=1e10)
+
+    # Only the first category was crawled whole, the second failed
+    state.crawled('store', TASKS[0])
+    state.save()
+
+    state = SitemapState(str(tmp_path / 'state.json'))
+    assert state.discover('store', source, TASKS, now=2e10) == [TASKS[1]]
+
+    state.crawled('store', TASKS[1])
+    assert state.discover('store', source, TASKS, now=3e10) == []
+
+def test_modified_categories_are_changes(tmp_path):
+    source = write_sitemap(tmp_path / 'sitemap.xml', {'https://store.invalid/a': '2024-01-01', 'https://store.invalid/b': '2024-01-01'})
+    state = SitemapState(str(tmp_path / 'state.json'))
+    state.discover('store', source, TASKS, now=1704153600.0)
+    for task in TASKS:
+        state.crawled('store', task)
+
+    write_sitemap(tmp_path / 'sitemap.xml', {'https://store.invalid/a': '2024-01-01', 'https://store.invalid/b/product': '2024-03-01'})
+
+    assert state.discover('store', source, TASKS, now=1e10) == [TASKS[1]]
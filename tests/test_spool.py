@@ -0,0 +1,102 @@
+from types import SimpleNamespace
+
+from miners.sinks import BatchRejected, Sink
+from miners.spool import Spool, SpooledSink
+
+class FakeSink(Sink):
+    def __init__(self, results: list):
+        self.results = results
+        self.written: list[tuple[str, list[str]]] = []
+        self.closed = False
+
+    def write(self, store: str, batch: list) -> bool:
+        result = self.results.pop(0) if self.results else True
+        if isinstance(result, Exception):
+            raise result
+        if result:
+            self.written.append((store, [product.id for product in batch]))
+        return result
+
+    def close(self) -> None:
+        self.closed = True
+
+def batch(*ids: str) -> list:
+    return [SimpleNamespace(id=id, name=f'Product {id}') for id in ids]
+
+def spool(tmp_path) -> Spool:
+    return Spool(str(tmp_path / 'spool'), str(tmp_path / 'dead-letter'))
+
+def test_put_and_load_round_trip(tmp_path):
+    queue = spool(tmp_path)
+    path = queue.put('store', batch('1', '2'))
+
+    store, products = queue.load(path)
+
+    assert queue.pending() == [path]
+    assert store == 'store'
+    assert [product.name for product in products] == ['Product 1', 'Product 2']
+
+def test_replay_sends_removes_and_keeps_failed_batches(tmp_path):
+    queue = spool(tmp_path)
+    queue.put('one', batch('1'))
+    queue.put('two', batch('2'))
+    sink = FakeSink([True, False])
+
+    assert queue.replay(sink) == (1, 1)
+    assert len(queue.pending()) == 1
+
+    assert queue.replay(sink) == (1, 0)
+    assert sorted(sink.written) == [('one', ['1']), ('two', ['2'])]
+    assert queue.pending() == []
+
+def test_replay_dead_letters_rejected_batches(tmp_path):
+    queue = spool(tmp_path)
+    path = queue.put('store', batch('1'))
+
+    assert queue.replay(FakeSink([BatchRejected('invalid price')])) == (0, 0)
+
+    dead = tmp_path / 'dead-letter' / 'store'
+    assert queue.pending() == []
+    assert (dead / f'{path.rsplit("/", 1)[1]}.error').read_text() == 'invalid price'
+
+def test_spooled_sink_removes_stored_batches(tmp_path):
+    queue = spool(tmp_path)
+    sink = SpooledSink(FakeSink([True]), queue)
+
+    assert sink.write('store', batch('1'))
+    sink.close(timeout=1)
+
+    assert queue.pending() == []
+    assert sink.sink.closed
+
+def test_spooled_sink_sends_failed_batches_on_close(tmp_path):
+    queue = spool(tmp_path)
+    sink = SpooledSink(FakeSink([False, True]), queue)
+
+    assert not sink.write('store', batch('1'))
+    assert len(queue.pending()) == 1
+
+    sink.close(timeout=1)
+
+    assert sink.sink.written == [('store', ['1'])]
+    assert queue.pending() == []
+
+def test_spooled_sink_replays_batches_left_by_a_previous_run(tmp_path):
+    queue = spool(tmp_path)
+    queue.put('store', batch('1'))
+
+    sink = SpooledSink(FakeSink([]), queue)
+    sink.close(timeout=1)
+
+    assert sink.sink.written == [('store', ['1'])]
+    assert queue.pending() == []
+
+def test_spooled_sink_dead_letters_rejected_batches(tmp_path):
+    queue = spool(tmp_path)
+    sink = SpooledSink(FakeSink([BatchRejected('invalid price')]), queue)
+
+    assert not sink.write('store', batch('1'))
+    sink.close(timeout=1)
+
+    assert queue.pending() == []
+    assert len(list((tmp_path / 'dead-letter' / 'store').glob('*.json.gz'))) == 1
@@ -0,0 +1,132 @@
+import sqlite3
+
+import pytest
+
+from miners.taskqueue import MemoryBroker, SqliteBroker
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def broker(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBroker(max_attempts=3)
+    return SqliteBroker(str(tmp_path / 'queue.db'), max_attempts=3)
+
+def test_lease_hands_each_task_to_one_worker(broker):
+    broker.begin()
+    broker.publish('store', ['a', 'b'])
+
+    first = broker.lease('worker-1')
+    second = broker.lease('worker-2')
+
+    assert {first.payload, second.payload} == {'a', 'b'}
+    assert broker.lease('worker-3') is None
+
+def test_expired_lease_goes_to_another_worker(broker):
+    broker.begin()
+    broker.publish('store', ['a'])
+
+    task = broker.lease('worker-1', timeout=-1)
+    again = broker.lease('worker-2')
+
+    assert again.id == task.id
+    assert again.attempts == 2
+    assert not broker.extend(task, 'worker-1')
+    assert broker.extend(again, 'worker-2')
+
+def test_extended_lease_is_kept(broker):
+    broker.begin()
+    broker.publish('store', ['a'])
+
+    task = broker.lease('worker-1')
+
+    assert broker.extend(task, 'worker-1')
+    assert broker.lease('worker-2') is None
+
+def test_tasks_are_given_up_after_max_attempts(broker):
+    broker.begin()
+    broker.publish('store', ['a'])
+
+    for _ in range(3):
+        broker.fail(broker.lease('worker-1'), 'worker-1')
+
+    assert broker.lease('worker-1') is None
+    assert broker.drained()
+
+def test_completed_tasks_drain_the_queue(broker):
+    broker.begin()
+    broker.publish('store', ['a'])
+    task = broker.lease('worker-1')
+
+    assert not broker.drained()
+    broker.complete(task, 'worker-1')
+    assert broker.drained()
+
+def test_claims_dedup_across_tasks_of_a_crawl(broker):
+    broker.begin()
+    broker.publish('store', ['a', 'b'])
+    first, second = broker.lease('worker-1'), broker.lease('worker-2')
+
+    assert broker.claim(first, ['1', '2']) == {'1', '2'}
+    assert broker.claim(second, ['2', '3']) == {'3'}
+
+def test_claims_are_per_store(broker):
+    broker.begin()
+    broker.publish('one', ['a'])
+    broker.publish('two', ['a'])
+    first, second = broker.lease('worker-1'), broker.lease('worker-2')
+
+    assert broker.claim(first, ['1']) == {'1'}
+    assert broker.claim(second, ['1']) == {'1'}
+
+def test_failed_task_releases_its_claims(broker):
+    broker.begin()
+    broker.publish('store', ['a', 'b'])
+    first, second = broker.lease('worker-1'), broker.lease('worker-2')
+    broker.claim(first, ['1'])
+
+    broker.fail(first, 'worker-1')
+
+    assert broker.claim(second, ['1']) == {'1'}
+
+def test_releasing_an_expired_lease_frees_its_claims(broker):
+    broker.begin()
+    broker.publish('store', ['a'])
+    task = broker.lease('worker-1', timeout=-1)
+    broker.claim(task, ['1'])
+
+    again = broker.lease('worker-2')
+
+    assert broker.claim(again, ['1']) == {'1'}
+
+def test_completed_task_keeps_its_claims(broker):
+    broker.begin()
+    broker.publish('store', ['a', 'b'])
+    first, second = broker.lease('worker-1'), broker.lease('worker-2')
+    broker.claim(first, ['1'])
+
+    broker.complete(first, 'worker-1')
+
+    assert broker.claim(second, ['1']) == set()
+
+def test_a_new_crawl_dedups_afresh(broker):
+    broker.begin()
+    broker.publish('store', ['a'])
+    task = broker.lease('worker-1')
+    broker.claim(task, ['1'])
+    broker.complete(task, 'worker-1')
+
+    broker.begin()
+    broker.publish('store', ['a'])
+    task = broker.lease('worker-1')
+
+    assert broker.claim(task, ['1']) == {'1'}
+
+def test_failed_publish_is_rolled_back(tmp_path):
+    broker = SqliteBroker(str(tmp_path / 'queue.db'))
+    broker.begin()
+
+    with pytest.raises(sqlite3.IntegrityError):
+        broker.publish('store', ['a', None])
+
+    assert broker.lease('worker-1') is None
+    broker.publish('store', ['b'])
+    assert broker.lease('worker-1').payload == 'b'
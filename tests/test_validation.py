@@ -0,0 +1,63 @@
+import json
+from dataclasses import dataclass
+
+import pytest
+
+from miners.validation import REQUIRED_FIELDS, Quarantine, coerce_bool, coerce_int, validate
+
+@dataclass
+class Product:
+    id: str = 'abc'
+    origin: str = 'store'
+    name: str = ' Product '
+    price: object = 'Gs. 12.500'
+    image_url: str = '/media/product.jpg'
+    product_url: str = 'https://store.invalid/product'
+    category_name: str = 'Category'
+    is_discounted: object = 'true'
+
+def test_valid_product_is_fixed_in_place():
+    product = Product()
+
+    assert validate(product) is None
+    assert product.name == 'Product'
+    assert product.price == 12500
+    assert product.image_url == 'https://store.invalid/media/product.jpg'
+    assert product.is_discounted is True
+
+@pytest.mark.parametrize('name', [name for name in REQUIRED_FIELDS if name != 'price'])
+@pytest.mark.parametrize('value', [None, '', '   '])
+def test_missing_required_field_is_rejected(name, value):
+    product = Product()
+    setattr(product, name, value)
+
+    assert validate(product) == f'missing {name}'
+
+def test_non_string_fields_are_stringified():
+    product = Product(id=123)
+
+    assert validate(product) is None
+    assert product.id == '123'
+
+@pytest.mark.parametrize('price', [None, 0, -5, 'Gs.', True, float('nan')])
+def test_invalid_price_is_rejected(price):
+    assert validate(Product(price=price)).startswith('invalid price')
+
+def test_invalid_optional_field_is_rejected():
+    assert validate(Product(is_discounted='maybe')) == "invalid is_discounted 'maybe'"
+
+def test_coercion():
+    assert coerce_int('Gs. 1.234,50') == 1234
+    assert coerce_int(12.9) == 12
+    assert coerce_bool('Sí') is True
+    assert coerce_bool(0) is False
+
+def test_quarantine_writes_one_line_per_product(tmp_path):
+    quarantine = Quarantine(str(tmp_path))
+    quarantine.put('store', Product(), 'missing id')
+    quarantine.put('store', Product(), 'missing name')
+
+    lines = (tmp_path / 'store' / f'{quarantine.run}.ndjson').read_text().splitlines()
+
+    assert [json.loads(line)['error'] for line in lines] == ['missing id', 'missing name']
+    assert quarantine.counts == {'store': 2}